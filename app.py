@@ -1,10 +1,16 @@
 # app.py
-from flask import Flask, request, redirect, url_for, send_file, render_template_string
+from flask import Flask, Response, request, redirect, url_for, send_file, render_template_string, jsonify, \
+    stream_with_context
+from werkzeug.utils import secure_filename
 import os
-from video_io import process_video
+from events import format_sse
+from jobs import JobManager, JobQueueFull
 
 UPLOAD_FOLDER = "uploads"
 OUTPUT_FOLDER = "outputs"
+MAX_WORKERS = 2        # Số video xử lý song song (mỗi worker giữ 1 model đã load)
+MAX_QUEUED_JOBS = 8    # Số job tối đa được chờ; vượt quá thì /upload trả về 503
+SSE_KEEPALIVE_S = 15   # Gửi comment giữ kết nối SSE khi không có sự kiện (proxy hay cắt kết nối im lặng)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
@@ -12,6 +18,9 @@ app = Flask(__name__)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["OUTPUT_FOLDER"] = OUTPUT_FOLDER
 
+# Worker load model + warm-up ngay khi app khởi động, job đầu không phải chờ load
+job_manager = JobManager(workers=MAX_WORKERS, max_queued=MAX_QUEUED_JOBS, metrics=True)
+
 INDEX_HTML = """
 <!doctype html>
 <title>Vehicle Counting Demo</title>
@@ -33,15 +42,81 @@ def upload():
     file = request.files["video"]
     if file.filename == "":
         return "No selected file", 400
-    in_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
+    filename = secure_filename(file.filename) or "video.mp4"
+    job_prefix = os.urandom(4).hex()  # Tránh trùng tên khi nhiều người upload cùng file
+    in_path = os.path.join(app.config["UPLOAD_FOLDER"], f"{job_prefix}_{filename}")
     file.save(in_path)
 
-    out_video = os.path.join(app.config["OUTPUT_FOLDER"], f"out_{file.filename}")
-    out_csv = os.path.join(app.config["OUTPUT_FOLDER"], f"{os.path.splitext(file.filename)[0]}_counts.csv")
+    base_name = os.path.splitext(os.path.basename(in_path))[0]
+    out_video = os.path.join(app.config["OUTPUT_FOLDER"], f"out_{job_prefix}_{filename}")
+    out_csv = os.path.join(app.config["OUTPUT_FOLDER"], f"{base_name}_counts.csv")
+
+    # Xử lý nền: trả về job id ngay, theo dõi qua /jobs/<job_id>
+    try:
+        job = job_manager.submit(in_path, output_path=out_video, csv_path=out_csv)
+    except JobQueueFull as e:
+        os.remove(in_path)
+        return jsonify({"error": str(e)}), 503
+    return jsonify(_job_info(job)), 202
+
+def _job_info(job):
+    info = job.to_dict()
+    info["status_url"] = url_for("job_status", job_id=job.id)
+    info["cancel_url"] = url_for("job_cancel", job_id=job.id)
+    info["events_url"] = url_for("job_events", job_id=job.id)
+    if job.status == "done":
+        info["video_url"] = url_for("download_video", path=job.output_path)
+        info["csv_url"] = url_for("download_csv", path=job.csv_path)
+    return info
+
+@app.route("/jobs")
+def job_list():
+    return jsonify({"stats": job_manager.stats(), "jobs": [_job_info(j) for j in job_manager.list()]})
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Không tìm thấy job"}), 404
+    return jsonify(_job_info(job))
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def job_cancel(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Không tìm thấy job"}), 404
+    return jsonify(_job_info(job))
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """
+    Server-Sent Events của 1 job: "count" mỗi xe được đếm, "stats" snapshot get_stats() định kỳ,
+    "end" khi job kết thúc; "overflow" nếu client đọc quá chậm (bị ngắt, kết nối lại để nghe tiếp).
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Không tìm thấy job"}), 404
+    sub = job.events.subscribe()
+    if sub is None:
+        return jsonify({"error": "Quá nhiều client đang theo dõi job này"}), 503
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not sub.finished:
+                item = sub.get(timeout=SSE_KEEPALIVE_S)
+                yield format_sse(*item) if item else ": keepalive\n\n"
+        finally:
+            sub.close()  # Client ngắt kết nối (GeneratorExit) hoặc stream kết thúc
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(stream()), mimetype="text/event-stream", headers=headers)
+
+@app.route("/metrics")
+def metrics():
+    """Histogram thời gian từng stage, số detection / track mỗi frame, độ sâu queue."""
+    return jsonify({"jobs": job_manager.stats(), "metrics": job_manager.metrics_snapshot()})
 
-    # Process (synchronously) - có thể mất thời gian tùy video
-    res = process_video(in_path, output_path=out_video, csv_path=out_csv, display=False)
-    return f"Done. <a href='/download_video?path={out_video}'>Download video</a> | <a href='/download_csv?path={out_csv}'>Download CSV</a>"
 
 @app.route("/download_video")
 def download_video():
@@ -54,4 +129,5 @@ def download_csv():
     return send_file(path, as_attachment=True)
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+    # Không dùng reloader: reloader chạy module này trong 1 process con nữa, mỗi worker sẽ load model 2 lần
+    app.run(debug=True, port=5000, use_reloader=False)
@@ -0,0 +1,260 @@
+# backends.py
+"""
+Backend inference cho VehicleDetector (CPU):
+    "torch":    ultralytics YOLO, model .pt (như trước đây).
+    "onnx":     ONNX Runtime, model .onnx export bằng ultralytics (export_model / yolo export format=onnx).
+    "openvino": OpenVINO, thư mục *_openvino_model (hoặc file .xml) export bằng ultralytics.
+Backend ONNX / OpenVINO tự làm letterbox, decode output YOLOv8 (1, 4 + số class, số anchor) và NMS
+theo class (cv2.dnn), nên lúc chạy không cần torch / ultralytics.
+
+Model INT8 load như model thường: OpenVINO export với int8=True (NNCF, calibration trên tập `data`),
+ONNX export rồi quantize weight sang INT8 (onnxruntime.quantization), xem export_model().
+threads: số thread intra-op của runtime (torch.set_num_threads áp dụng cho cả process);
+None = để runtime tự chọn. Model export với input cố định (mặc định) chỉ chạy ở đúng input size đó,
+imgsz truyền vào lúc detect bị bỏ qua.
+"""
+import ast
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from detector import DETECTION_DTYPE, empty_detections
+
+BACKENDS = ("torch", "onnx", "openvino")
+MAX_DETECTIONS = 300
+
+
+def backend_for_path(model_path):
+    """Đoán backend theo đường dẫn model: .onnx -> onnx, .xml / thư mục *_openvino_model -> openvino."""
+    path = model_path.rstrip("/\\")
+    if path.endswith(".onnx"):
+        return "onnx"
+    if path.endswith(".xml") or path.endswith("_openvino_model") or os.path.isdir(path):
+        return "openvino"
+    return "torch"
+
+
+def create_backend(model_path, backend=None, device="cpu", threads=None):
+    backend = backend or backend_for_path(model_path)
+    if backend == "torch":
+        return TorchBackend(model_path, device, threads)
+    if backend == "onnx":
+        return OnnxBackend(model_path, device, threads)
+    if backend == "openvino":
+        return OpenVinoBackend(model_path, device, threads)
+    raise ValueError(f"Backend không hỗ trợ: {backend} (chọn 1 trong {BACKENDS})")
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_path, device="cpu", threads=None):
+        # Import ultralytics (kéo theo torch) khi thật sự cần model, không phải lúc import module
+        t0 = time.perf_counter()
+        from ultralytics import YOLO
+        self.import_s = time.perf_counter() - t0
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(model_path)
+        # File weights thật sau khi load (ultralytics tự tải "yolov8n.pt" về nếu chưa có)
+        self.weights_path = getattr(self.model, "ckpt_path", None) or model_path
+        self.device = device
+        self.input_size = None  # Input size tùy ý, theo imgsz mỗi lần gọi
+        names = self.model.names
+        self.names = dict(names) if isinstance(names, dict) else dict(enumerate(names))
+
+    def predict(self, frames, conf, iou, imgsz, classes):
+        results = self.model.predict(source=list(frames), conf=conf, iou=iou, imgsz=imgsz, classes=classes,
+                                     device=self.device, verbose=False)
+        return [self._parse_result(r) for r in results]
+
+    def _parse_result(self, r):
+        if r.boxes is None or len(r.boxes) == 0:
+            return empty_detections()
+
+        detections = np.empty(len(r.boxes), dtype=DETECTION_DTYPE)
+        detections["xyxy"] = r.boxes.xyxy.cpu().numpy()  # [N,4]
+        detections["conf"] = r.boxes.conf.cpu().numpy()
+        detections["cls"] = r.boxes.cls.cpu().numpy()
+        return detections
+
+
+class _ExportedBackend:
+    """Phần chung của backend chạy model YOLOv8 đã export: letterbox, decode output, NMS."""
+
+    input_size = None  # Cạnh input cố định của model (None = input động)
+    batch = 1  # Số frame tối đa mỗi lần chạy model (None = batch động)
+    half = False
+
+    def predict(self, frames, conf, iou, imgsz, classes):
+        size = self.input_size or int(imgsz)
+        classes = np.asarray(classes if classes is not None else sorted(self.names), dtype=np.int64)
+        step = self.batch or len(frames)
+        results = []
+        for i in range(0, len(frames), step):
+            chunk = frames[i:i + step]
+            blob, transforms = self._preprocess(chunk, size)
+            output = self._infer(blob)
+            results.extend(self._postprocess(output[j], transforms[j], f.shape, conf, iou, classes)
+                           for j, f in enumerate(chunk))
+        return results
+
+    def _preprocess(self, frames, size):
+        """Letterbox (giữ tỉ lệ, viền 114 ở giữa, như ultralytics) -> blob NCHW RGB [0, 1]."""
+        blob = np.empty((len(frames), 3, size, size), dtype=np.float16 if self.half else np.float32)
+        transforms = []
+        for i, frame in enumerate(frames):
+            h, w = frame.shape[:2]
+            r = min(size / h, size / w)
+            new_w, new_h = int(round(w * r)), int(round(h * r))
+            left = int(round((size - new_w) / 2 - 0.1))
+            top = int(round((size - new_h) / 2 - 0.1))
+            canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+            canvas[top:top + new_h, left:left + new_w] = cv2.resize(frame, (new_w, new_h),
+                                                                  interpolation=cv2.INTER_LINEAR)
+            blob[i] = canvas[:, :, ::-1].transpose(2, 0, 1)
+            transforms.append((r, left, top))
+        blob *= 1 / 255.0
+        return blob, transforms
+
+    def _postprocess(self, output, transform, frame_shape, conf, iou, classes):
+        """output: (4 + số class, số anchor), box dạng cx, cy, w, h theo tọa độ input đã letterbox."""
+        pred = np.asarray(output, dtype=np.float32).T
+        scores = pred[:, 4 + classes]
+        best = scores.argmax(axis=1)
+        best_conf = scores[np.arange(len(pred)), best]
+        keep = best_conf >= conf
+        if not keep.any():
+            return empty_detections()
+        pred, best, best_conf = pred[keep], best[keep], best_conf[keep]
+
+        # NMS theo từng class trên box xywh (góc trên trái)
+        xywh = pred[:, :4].copy()
+        xywh[:, :2] -= xywh[:, 2:] / 2
+        idx = cv2.dnn.NMSBoxesBatched(xywh.tolist(), best_conf.tolist(), best.tolist(), conf, iou)
+        idx = np.asarray(idx, dtype=np.int64).reshape(-1)[:MAX_DETECTIONS]
+
+        # Bỏ letterbox, đổi về tọa độ frame gốc
+        r, left, top = transform
+        h, w = frame_shape[:2]
+        detections = np.empty(len(idx), dtype=DETECTION_DTYPE)
+        xyxy = np.empty((len(idx), 4), dtype=np.float32)
+        xyxy[:, :2] = xywh[idx, :2]
+        xyxy[:, 2:] = xywh[idx, :2] + xywh[idx, 2:]
+        xyxy -= (left, top, left, top)
+        xyxy /= r
+        np.clip(xyxy, 0, (w, h, w, h), out=xyxy)
+        detections["xyxy"] = xyxy
+        detections["conf"] = best_conf[idx]
+        detections["cls"] = classes[best[idx]]
+        return detections
+
+    def _infer(self, blob):
+        raise NotImplementedError
+
+
+class OnnxBackend(_ExportedBackend):
+    name = "onnx"
+
+    def __init__(self, model_path, device="cpu", threads=None):
+        t0 = time.perf_counter()
+        import onnxruntime as ort
+        self.import_s = time.perf_counter() - t0
+        if device not in (None, "cpu"):
+            print(f"Backend onnx chỉ chạy trên CPU, bỏ qua device={device}")
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.weights_path = model_path
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.half = inp.type == "tensor(float16)"
+        batch, _, height, width = inp.shape
+        self.batch = batch if isinstance(batch, int) else None
+        self.input_size = height if isinstance(height, int) and height == width else None
+
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        if not names:
+            raise ValueError(f"Model {model_path} không có metadata 'names' (hãy export bằng ultralytics)")
+        self.names = ast.literal_eval(names)
+
+    def _infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoBackend(_ExportedBackend):
+    name = "openvino"
+
+    def __init__(self, model_path, device="cpu", threads=None):
+        t0 = time.perf_counter()
+        import openvino as ov
+        self.import_s = time.perf_counter() - t0
+
+        xml_path = model_path
+        if os.path.isdir(model_path):
+            xml_files = glob.glob(os.path.join(model_path, "*.xml"))
+            if not xml_files:
+                raise FileNotFoundError(f"Không tìm thấy file .xml trong {model_path}")
+            xml_path = xml_files[0]
+        self.weights_path = model_path
+        core = ov.Core()
+        model = core.read_model(xml_path)
+        shape = model.input(0).get_partial_shape()
+        self.batch = shape[0].get_length() if shape[0].is_static else None
+        height, width = shape[2], shape[3]
+        if height.is_static and width.is_static and height.get_length() == width.get_length():
+            self.input_size = height.get_length()
+        self.half = model.input(0).get_element_type() == ov.Type.f16
+
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        self.compiled = core.compile_model(model, (device or "cpu").upper(), config)
+        self.request = self.compiled.create_infer_request()
+        self.names = self._read_names(os.path.dirname(xml_path))
+
+    @staticmethod
+    def _read_names(model_dir):
+        """Tên class từ metadata.yaml mà ultralytics ghi cạnh model khi export."""
+        import yaml
+        metadata_path = os.path.join(model_dir, "metadata.yaml")
+        if not os.path.exists(metadata_path):
+            raise FileNotFoundError(f"Không tìm thấy {metadata_path} (hãy export bằng ultralytics)")
+        with open(metadata_path, encoding="utf-8") as f:
+            names = yaml.safe_load(f)["names"]
+        return dict(names) if isinstance(names, dict) else dict(enumerate(names))
+
+    def _infer(self, blob):
+        self.request.infer({0: blob})
+        return self.request.get_output_tensor(0).data
+
+
+def export_model(model_path, backend, imgsz=640, int8=False, data=None):
+    """
+    Export model .pt sang backend "onnx" / "openvino" bằng ultralytics; trả về đường dẫn model mới.
+    int8: OpenVINO quantize INT8 có calibration (cần nncf, data = file .yaml dataset, mặc định của
+    ultralytics); ONNX quantize weight sang INT8 (dynamic quantization, cần onnxruntime).
+    """
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    if backend == "openvino":
+        kwargs = {"data": data} if data else {}
+        return model.export(format="openvino", imgsz=imgsz, int8=int8, **kwargs)
+    if backend != "onnx":
+        raise ValueError(f"Không export được sang backend: {backend}")
+
+    path = model.export(format="onnx", imgsz=imgsz)
+    if not int8:
+        return path
+    # quantize_dynamic giữ nguyên metadata (names, imgsz...) mà OnnxBackend cần
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    int8_path = path[:-len(".onnx")] + "_int8.onnx"
+    quantize_dynamic(path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
@@ -0,0 +1,85 @@
+# benchmarks/bench_association.py
+"""
+Benchmark khả năng mở rộng của associate_detections_to_trackers (10 -> 1000 object/frame),
+so với cách ghép cũ trên toàn bộ ma trận IoU.
+
+Chạy: python -m benchmarks.bench_association [--sizes 10 100 1000] [--repeat 20] [--json out.json]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from sort import iou_batch, linear_assignment, associate_detections_to_trackers
+
+
+def make_scene(n, rng, width=3840, height=2160, size=(30, 90), jitter=4.0):
+    """n box rải đều trên khung hình và n box tracker lệch nhẹ (giống frame t và dự đoán của frame t-1)."""
+    xy = rng.uniform(0, (width, height), (n, 2))
+    wh = rng.uniform(size[0], size[1], (n, 2))
+    dets = np.column_stack((xy, xy + wh, np.full(n, 0.9)))
+    trks = dets[:, :4] + rng.normal(0, jitter, (n, 4))
+    return dets, trks
+
+
+def dense_associate(detections, trackers, iou_threshold=0.3):
+    """Cách ghép cũ: ma trận IoU đầy đủ + lapjv trên cả ma trận."""
+    iou_matrix = iou_batch(detections, trackers)
+    a = (iou_matrix > iou_threshold).astype(np.int32)
+    if a.sum(1).max() == 1 and a.sum(0).max() == 1:
+        matched = np.stack(np.where(a), axis=1)
+    else:
+        matched = linear_assignment(-iou_matrix)
+    return matched[iou_matrix[matched[:, 0], matched[:, 1]] >= iou_threshold]
+
+
+def time_call(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+# sparse: xe rải trên khung 4K, dự đoán sát; crowded: cùng số xe dồn vào 1080p, dự đoán lệch nhiều
+SCENES = {
+    "sparse": dict(width=3840, height=2160, jitter=4.0),
+    "crowded": dict(width=1920, height=1080, jitter=12.0),
+}
+
+
+def run(sizes, repeat=20, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for scene, params in SCENES.items():
+        for n in sizes:
+            dets, trks = make_scene(n, rng, **params)
+            results.append({
+                "scene": scene,
+                "objects": n,
+                "dense_ms": time_call(lambda: dense_associate(dets, trks), repeat),
+                "gated_ms": time_call(lambda: associate_detections_to_trackers(dets, trks), repeat),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 30, 100, 300, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    print(f"{'scene':>8} {'objects':>8} {'dense (ms)':>12} {'gated (ms)':>12}")
+    for r in results:
+        print(f"{r['scene']:>8} {r['objects']:>8} {r['dense_ms']:>12.3f} {r['gated_ms']:>12.3f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# benchmarks/bench_backends.py
+"""
+So sánh các backend inference (backends.py) trên 1 clip cố định:
+    - parity: box của mỗi backend so với backend tham chiếu (PyTorch, --reference), ghép theo cùng
+      class + IoU >= --match-iou; báo recall / precision, IoU trung bình, chênh lệch conf lớn nhất.
+    - latency: thời gian detect mỗi frame (avg, p50, p95) và FPS, sau warm-up.
+Model truyền vào là đường dẫn (backend đoán theo đuôi, xem backends.backend_for_path) hoặc
+"backend=đường dẫn". Thoát với mã 1 nếu 1 backend có recall hoặc precision < --min-match.
+
+Chạy: python -m benchmarks.bench_backends --video clip.mp4 yolov8n.onnx yolov8n_int8.onnx \
+          yolov8n_openvino_model [--reference yolov8n.pt] [--threads 4] [--imgsz 640] [--frames 100]
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from backends import backend_for_path
+from benchmarks.bench_roi import load_frames
+from detector import VehicleDetector
+from sort import iou_batch
+
+
+def parse_model(spec):
+    """"onnx=model.onnx" -> ("onnx", "model.onnx"); "model.onnx" -> (backend đoán theo đuôi, "model.onnx")."""
+    backend, sep, path = spec.partition("=")
+    if sep and backend in ("torch", "onnx", "openvino"):
+        return backend, path
+    return backend_for_path(spec), spec
+
+
+def run_backend(backend, model_path, frames, imgsz, threads, conf):
+    """Detect từng frame; trả về (detections mỗi frame, latency mỗi frame (ms), thông tin detector)."""
+    detector = VehicleDetector(model_path=model_path, imgsz=imgsz, backend=backend, threads=threads)
+    detector.warmup()
+    detections, latencies = [], []
+    for frame in frames:
+        t0 = time.perf_counter()
+        detections.append(detector.detect(frame, conf=conf))
+        latencies.append((time.perf_counter() - t0) * 1000)
+    info = {"backend": detector.backend.name, "model": model_path, "imgsz": detector.imgsz,
+            "startup_s": detector.startup_times}
+    return detections, latencies, info
+
+
+def match_detections(reference, candidate, min_iou=0.5):
+    """Ghép tham lam theo IoU giảm dần, chỉ giữa box cùng class; trả về list (i_ref, i_cand, iou)."""
+    if len(reference) == 0 or len(candidate) == 0:
+        return []
+    ious = iou_batch(reference["xyxy"], candidate["xyxy"])
+    ious[reference["cls"][:, None] != candidate["cls"][None, :]] = 0.0
+    pairs = []
+    used_ref, used_cand = set(), set()
+    for flat in np.argsort(-ious, axis=None):
+        i, j = np.unravel_index(flat, ious.shape)
+        if ious[i, j] < min_iou:
+            break
+        if i in used_ref or j in used_cand:
+            continue
+        used_ref.add(i)
+        used_cand.add(j)
+        pairs.append((int(i), int(j), float(ious[i, j])))
+    return pairs
+
+
+def parity(reference_frames, candidate_frames, min_iou=0.5):
+    """So box của 1 backend với backend tham chiếu trên cùng các frame."""
+    n_ref = n_cand = 0
+    ious, conf_diffs = [], []
+    for reference, candidate in zip(reference_frames, candidate_frames):
+        n_ref += len(reference)
+        n_cand += len(candidate)
+        for i, j, iou in match_detections(reference, candidate, min_iou):
+            ious.append(iou)
+            conf_diffs.append(abs(float(reference["conf"][i]) - float(candidate["conf"][j])))
+    matched = len(ious)
+    return {
+        "reference_boxes": n_ref,
+        "boxes": n_cand,
+        "matched": matched,
+        "recall": matched / n_ref if n_ref else 1.0,
+        "precision": matched / n_cand if n_cand else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else 0.0,
+        "max_conf_diff": max(conf_diffs, default=0.0),
+    }
+
+
+def latency_stats(latencies):
+    ms = np.asarray(latencies)
+    return {"avg_ms": float(ms.mean()), "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)), "fps": 1000.0 / float(ms.mean())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", nargs="+", help="Các model cần so sánh (đường dẫn hoặc backend=đường dẫn)")
+    parser.add_argument("--video", required=True, help="Clip cố định dùng cho cả parity và latency")
+    parser.add_argument("--reference", default="yolov8n.pt", help="Model tham chiếu (backend PyTorch)")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--threads", type=int, help="Số thread intra-op của mọi backend")
+    parser.add_argument("--conf", type=float, default=0.4, help="Ngưỡng conf (giống VideoEngine)")
+    parser.add_argument("--match-iou", type=float, default=0.5, help="IoU tối thiểu để 2 box được coi là khớp")
+    parser.add_argument("--min-match", type=float, default=0.9, help="Recall / precision tối thiểu để đạt parity")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.frames)
+    reference, ref_latencies, ref_info = run_backend("torch", args.reference, frames, args.imgsz, args.threads,
+                                                     args.conf)
+    results = [dict(ref_info, **latency_stats(ref_latencies), parity=None)]
+    for spec in args.models:
+        backend, path = parse_model(spec)
+        detections, latencies, info = run_backend(backend, path, frames, args.imgsz, args.threads, args.conf)
+        results.append(dict(info, **latency_stats(latencies), parity=parity(reference, detections, args.match_iou)))
+
+    print(f"{len(frames)} frame, threads={args.threads or 'mặc định'}")
+    print(f"{'model':<36} {'backend':<9} {'avg ms':>8} {'p95 ms':>8} {'FPS':>7} {'recall':>7} {'prec':>7} {'IoU':>6}")
+    failed = []
+    for r in results:
+        p = r["parity"]
+        cols = (f"{p['recall']:>7.3f} {p['precision']:>7.3f} {p['mean_iou']:>6.3f}" if p else f"{'(tham chiếu)':>22}")
+        print(f"{r['model']:<36} {r['backend']:<9} {r['avg_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['fps']:>7.1f} {cols}")
+        if p and min(p["recall"], p["precision"]) < args.min_match:
+            failed.append(r["model"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"frames": len(frames), "threads": args.threads, "results": results}, f, indent=2)
+    if failed:
+        print(f"Không đạt parity (< {args.min_match}): {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
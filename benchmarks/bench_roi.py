@@ -0,0 +1,87 @@
+# benchmarks/bench_roi.py
+"""
+Benchmark detect theo ROI (VideoEngine(roi_crop=True)) so với detect cả frame, theo tỉ lệ diện tích ROI.
+Cần model YOLO (mặc định yolov8n.pt).
+
+Chạy: python -m benchmarks.bench_roi [--video clip.mp4] [--areas 1 0.5 0.25 0.1 0.05] [--json out.json]
+"""
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from detector import DetectorLoader
+from video_engine import VideoEngine
+
+
+def load_frames(video=None, n=30, size=(1920, 1080), seed=0):
+    """Lấy n frame từ video, hoặc sinh frame nhiễu kích thước size nếu không có video."""
+    if video:
+        cap = cv2.VideoCapture(video)
+        frames = []
+        while len(frames) < n:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+        if frames:
+            return frames
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8) for _ in range(n)]
+
+
+def centered_roi(width, height, area):
+    """ROI ở giữa frame, cùng tỉ lệ khung hình, chiếm `area` diện tích frame."""
+    scale = area ** 0.5
+    w, h = int(width * scale), int(height * scale)
+    x1, y1 = (width - w) // 2, (height - h) // 2
+    return (x1, y1, x1 + w, y1 + h)
+
+
+def time_detect(engine, frames):
+    t0 = time.perf_counter()
+    for frame in frames:
+        engine._run_detector([frame])
+    return (time.perf_counter() - t0) / len(frames) * 1000
+
+
+def run(frames, areas, model_path="yolov8n.pt"):
+    detector = DetectorLoader(model_path=model_path).get()
+    height, width = frames[0].shape[:2]
+    full = VideoEngine(detector=detector)
+    crop = VideoEngine(detector=detector, roi_crop=True)
+    results = []
+    for area in areas:
+        roi = centered_roi(width, height, area)
+        full.set_roi(roi)
+        crop.set_roi(roi)
+        full_ms = time_detect(full, frames)
+        crop_ms = time_detect(crop, frames)
+        results.append({"roi_area": area, "roi": roi, "full_frame_ms": full_ms, "roi_crop_ms": crop_ms,
+                        "speedup": full_ms / crop_ms if crop_ms > 0 else 0.0})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Video dùng để lấy frame (mặc định: frame nhiễu 1920x1080)")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--areas", type=float, nargs="+", default=[1.0, 0.5, 0.25, 0.1, 0.05])
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    results = run(load_frames(args.video, args.frames), args.areas, args.model)
+    print(f"{'ROI area':>9} {'full (ms)':>10} {'crop (ms)':>10} {'speedup':>8}")
+    for r in results:
+        print(f"{r['roi_area']:>9.2f} {r['full_frame_ms']:>10.2f} {r['roi_crop_ms']:>10.2f} {r['speedup']:>7.2f}x")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
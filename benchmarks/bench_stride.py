@@ -0,0 +1,107 @@
+# benchmarks/bench_stride.py
+"""
+Ảnh hưởng của detect_stride (keyframe) lên số đếm: chạy VideoEngine trên video giả lập với
+BlobDetector (detect theo pixel, không cần model) ở stride cố định và adaptive_stride, trong từng
+chế độ chạy (tuần tự, batch, pipeline), so với stride 1 cùng chế độ. Báo tổng số đếm, độ lệch
+(%) và tỉ lệ frame thực sự chạy detect; 2 số này cần đọc cùng nhau. Adaptive stride đặt keyframe
+theo lúc xe được dự đoán qua vạch nên tỉ lệ keyframe tăng theo mật độ xe (thử với --rate khác nhau).
+
+Với batch / pipeline, adaptive stride phản ứng chậm hơn (xem VideoEngine, adaptive_stride), nên
+độ lệch có thể lớn hơn chế độ tuần tự.
+
+Chạy: python -m benchmarks.bench_stride [--clips 3] [--frames 300] [--rate 0.2] [--json out.json]
+"""
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+
+from benchmarks.stub_detector import BlobDetector
+from benchmarks.synthetic import write_video
+from video_engine import VideoEngine
+
+MODES = {
+    "tuần tự": {},
+    "batch 4": {"batch_size": 4},
+    "pipeline": {"pipeline": True},
+}
+STRIDES = [
+    ("stride 1", {"detect_stride": 1}),
+    ("stride 2", {"detect_stride": 2, "adaptive_stride": False}),
+    ("stride 3", {"detect_stride": 3, "adaptive_stride": False}),
+    ("stride 5", {"detect_stride": 5, "adaptive_stride": False}),
+    ("adaptive 3", {"detect_stride": 3, "adaptive_stride": True}),
+    ("adaptive 5", {"detect_stride": 5, "adaptive_stride": True}),
+]
+
+
+def count_video(video, out_dir, kwargs):
+    """Trả về (tổng số đếm, số frame, số keyframe)."""
+    engine = VideoEngine(detector=BlobDetector(), render=False, **kwargs)
+    atexit.unregister(engine.stop)
+    engine.output_dir = out_dir
+    engine.start(video, csv_path=os.path.join(out_dir, "counts.csv"))
+    frames = 0
+    while engine.process_next_frame()[0]:
+        frames += 1
+    total = engine.get_stats().get("total", 0)
+    keyframes = engine.keyframe_count
+    engine.stop()
+    return total, frames, keyframes
+
+
+def run(clips=3, frames=300, rate=0.2):
+    work = tempfile.mkdtemp(prefix="stride_")
+    results = []
+    try:
+        videos = []
+        for seed in range(clips):
+            path = os.path.join(work, f"clip{seed}.avi")
+            write_video(path, frames=frames, rate=rate, seed=seed)
+            videos.append(path)
+        # Counter in ra mỗi lần đếm -> bỏ stdout cho khỏi ngập
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for mode, mode_kwargs in MODES.items():
+                reference = None
+                for name, stride_kwargs in STRIDES:
+                    runs = [count_video(v, work, {**mode_kwargs, **stride_kwargs}) for v in videos]
+                    totals = [t for t, _, _ in runs]
+                    if reference is None:
+                        reference = totals
+                    error = sum(abs(t - r) for t, r in zip(totals, reference)) / max(1, sum(reference))
+                    results.append({
+                        "mode": mode,
+                        "stride": name,
+                        "totals": totals,
+                        "reference": reference,
+                        "abs_error": error,
+                        "keyframe_ratio": sum(k for _, _, k in runs) / max(1, sum(n for _, n, _ in runs)),
+                    })
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", type=int, default=3, help="Số video giả lập (mỗi video 1 seed)")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=0.2, help="Số xe mới trung bình mỗi frame")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    results = run(args.clips, args.frames, args.rate)
+    print(f"{'chế độ':<10} {'stride':<11} {'số đếm':<18} {'stride 1':<18} {'lệch':>6} {'keyframe':>9}")
+    for r in results:
+        print(f"{r['mode']:<10} {r['stride']:<11} {str(r['totals']):<18} {str(r['reference']):<18} "
+              f"{r['abs_error']:>6.1%} {r['keyframe_ratio']:>9.0%}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
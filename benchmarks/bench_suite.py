@@ -0,0 +1,214 @@
+# benchmarks/bench_suite.py
+"""
+Bộ benchmark chạy offline, không cần model: micro-benchmark các hot path (iou_batch,
+associate_detections_to_trackers, Sort.update, Counter.check_and_count) và FPS end-to-end của
+VideoEngine trên video giả lập, với ReplayDetector phát lại box thật kèm nhiễu.
+Kết quả ghi ra JSON; --baseline so sánh với 1 file kết quả cũ và báo các mục chậm đi quá --tolerance.
+--baseline không kèm đường dẫn dùng kết quả tham chiếu trong benchmarks/baselines/ (reference_full.json,
+reference_quick.json với --quick), có ghi thông tin máy đo trong "meta"; so với máy khác thì chỉ
+nên xem tỉ lệ tương đối. Tạo lại tham chiếu trên máy của mình (trước khi sửa code):
+    python -m benchmarks.bench_suite [--quick] --json benchmarks/baselines/reference_full.json
+
+Chạy: python -m benchmarks.bench_suite [--quick] [--json out.json] [--baseline [base.json]] [--tolerance 0.15]
+"""
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.bench_association import make_scene, time_call
+from benchmarks.stub_detector import ReplayDetector
+from benchmarks.synthetic import SyntheticTraffic, write_video
+from counter import Counter
+from sort import Sort, iou_batch, associate_detections_to_trackers
+from video_engine import VideoEngine
+
+# Cấu hình đầy đủ và cấu hình --quick (chạy nhanh để kiểm tra trước khi commit)
+FULL = dict(sizes=[10, 100, 1000], rates=[0.1, 0.5, 2.0], sort_frames=500, counter_calls=100000,
+            video_frames=300, video_rates=[0.2, 1.0], repeat=10)
+QUICK = dict(sizes=[10, 100], rates=[0.2, 1.0], sort_frames=200, counter_calls=20000,
+             video_frames=100, video_rates=[0.5], repeat=3)
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+# Thông tin máy trong "meta" cần giống nhau thì so sánh số tuyệt đối mới có ý nghĩa
+MACHINE_KEYS = ("python", "numpy", "platform", "cpu_count")
+
+
+def _result(value, unit, higher_is_better=False, **extra):
+    return dict(value=value, unit=unit, higher_is_better=higher_is_better, **extra)
+
+
+def bench_iou_batch(sizes, repeat, rng):
+    results = {}
+    for n in sizes:
+        dets, trks = make_scene(n, rng)
+        results[f"iou_batch/n={n}"] = _result(time_call(lambda: iou_batch(dets, trks), repeat), "ms")
+    return results
+
+
+def bench_associate(sizes, repeat, rng):
+    results = {}
+    for n in sizes:
+        dets, trks = make_scene(n, rng, width=1920, height=1080, jitter=8.0)
+        results[f"associate/n={n}"] = _result(
+            time_call(lambda: associate_detections_to_trackers(dets, trks), repeat), "ms")
+    return results
+
+
+def bench_sort_update(rates, frames, repeat, seed):
+    """Thời gian Sort.update mỗi frame trên chuỗi detections giả lập, theo mật độ xe."""
+    results = {}
+    for rate in rates:
+        traffic = SyntheticTraffic(rate=rate, seed=seed)
+        sequence = [traffic.step() for _ in range(frames)]
+        objects = float(np.mean([len(d) for d in sequence]))
+
+        def run():
+            tracker = Sort(max_age=90, min_hits=2, iou_threshold=0.1)
+            for dets in sequence:
+                tracker.update(dets)
+
+        ms = time_call(run, max(3, repeat // 3)) / frames
+        results[f"sort_update/rate={rate}"] = _result(ms, "ms/frame", objects_per_frame=objects)
+    return results
+
+
+def bench_counter(calls, repeat, seed):
+    """Thời gian 1 lần Counter.check_and_count (1/4 số lần gọi là xe cắt qua vạch)."""
+    rng = np.random.default_rng(seed)
+    line_y = 500
+    ids = rng.integers(0, calls // 4, calls)
+    prev_y = rng.integers(line_y - 40, line_y + 40, calls)
+    curr_y = prev_y + rng.integers(-8, 9, calls)
+    args = list(zip(ids.tolist(), prev_y.tolist(), curr_y.tolist()))
+
+    def run():
+        counter = Counter(line_position_y=line_y, direction="down")
+        for oid, py, cy in args:
+            counter.check_and_count(oid, (100, py), (100, cy), "car", 1, "t")
+
+    # Counter in ra mỗi lần đếm -> bỏ stdout
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        ms = time_call(run, max(3, repeat // 3))
+    return {"counter_check_and_count": _result(ms / calls * 1000, "us/call")}
+
+
+def bench_engine(video_rates, frames, seed):
+    """FPS end-to-end của VideoEngine (decode + detect giả + track + đếm + ghi kết quả [+ vẽ])."""
+    modes = {
+        "no_render": dict(render=False),
+        "render": dict(render=True, rgb=False),
+        "pipeline_render": dict(render=True, rgb=False, pipeline=True, batch_size=4),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for rate in video_rates:
+            video = os.path.join(out_dir, f"synthetic_{rate}.avi")
+            truths = write_video(video, frames=frames, rate=rate, seed=seed)
+            for mode, kwargs in modes.items():
+                engine = VideoEngine(detector=ReplayDetector(truths, seed=seed), **kwargs)
+                atexit.unregister(engine.stop)
+                engine.output_dir = out_dir
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    engine.start(video, csv_path=os.path.join(out_dir, f"{mode}_{rate}.csv"))
+                    n = 0
+                    t0 = time.perf_counter()
+                    while engine.process_next_frame()[0]:
+                        n += 1
+                    elapsed = time.perf_counter() - t0
+                    total = engine.get_stats().get("total", 0)
+                    engine.stop()
+                results[f"engine/{mode}/rate={rate}"] = _result(n / elapsed if elapsed > 0 else 0.0, "fps",
+                                                                higher_is_better=True, frames=n, counted=total)
+    return results
+
+
+def run(config, seed=0):
+    rng = np.random.default_rng(seed)
+    results = {}
+    results.update(bench_iou_batch(config["sizes"], config["repeat"], rng))
+    results.update(bench_associate(config["sizes"], config["repeat"], rng))
+    results.update(bench_sort_update(config["rates"], config["sort_frames"], config["repeat"], seed))
+    results.update(bench_counter(config["counter_calls"], config["repeat"], seed))
+    results.update(bench_engine(config["video_rates"], config["video_frames"], seed))
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": config,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=0.15):
+    """
+    So sánh với baseline. Trả về list (tên, giá trị cũ, giá trị mới, tỉ lệ thay đổi, chậm đi?).
+    Tỉ lệ > 0 nghĩa là nhanh hơn (thời gian giảm hoặc FPS tăng).
+    """
+    rows = []
+    for name, new in report["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old or not old["value"] or not new["value"]:
+            continue
+        if new["higher_is_better"]:
+            change = new["value"] / old["value"] - 1
+        else:
+            change = old["value"] / new["value"] - 1
+        rows.append((name, old["value"], new["value"], change, change < -tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Cấu hình nhỏ, chạy nhanh")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    parser.add_argument("--baseline", nargs="?", const="reference",
+                        help="File JSON kết quả cũ để so sánh (không kèm đường dẫn: kết quả tham chiếu trong baselines/)")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Mức chậm đi tối đa chấp nhận được (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    report = run(QUICK if args.quick else FULL, args.seed)
+    print(f"{'benchmark':<36} {'value':>12} {'unit':>9}")
+    for name, r in report["results"].items():
+        print(f"{name:<36} {r['value']:>12.4f} {r['unit']:>9}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        path = args.baseline
+        if path == "reference":
+            path = os.path.join(BASELINE_DIR, f"reference_{'quick' if args.quick else 'full'}.json")
+        with open(path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        meta = baseline.get("meta", {})
+        different = [k for k in MACHINE_KEYS if meta.get(k) != report["meta"][k]]
+        if different:
+            print(f"\nLưu ý: baseline {path} đo trên máy / môi trường khác ({', '.join(different)}): "
+                  f"{', '.join(str(meta.get(k)) for k in different)}")
+        if meta.get("config") != report["meta"]["config"]:
+            print("Lưu ý: baseline dùng cấu hình khác (--quick?), chỉ các mục trùng tên được so sánh")
+        rows = compare(report, baseline, args.tolerance)
+        print(f"\n{'benchmark':<36} {'baseline':>12} {'current':>12} {'change':>8}")
+        for name, old, new, change, regressed in rows:
+            flag = "  CHẬM HƠN" if regressed else ""
+            print(f"{name:<36} {old:>12.4f} {new:>12.4f} {change:>+7.1%}{flag}")
+        if any(r[4] for r in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# benchmarks/live_standin.py
+"""
+Nguồn live giả lập từ 1 file video, để thử chế độ live của VideoEngine (live.py) không cần camera:
+    --http PORT: server MJPEG qua HTTP (chỉ cần OpenCV), phát đúng nhịp FPS của video;
+                 đọc bằng http://127.0.0.1:PORT/stream.mjpg. --drop-every N: cắt mọi kết nối mỗi
+                 N giây (thử kết nối lại).
+    --fifo PATH: named pipe, ffmpeg -re ghi MPEG-TS vào pipe (cần ffmpeg trong PATH).
+--loop: phát lặp lại mãi; --fps: (--http) ghi đè FPS phát.
+
+Chạy: python -m benchmarks.live_standin clip.mp4 --http 8090 [--loop] [--drop-every 20]
+      python video_io.py http://127.0.0.1:8090/stream.mjpg --metrics
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+BOUNDARY = "frame"
+
+
+class FrameSource:
+    """Đọc video theo nhịp thời gian thực trên 1 thread; mọi client nhận frame JPEG mới nhất."""
+
+    def __init__(self, path, fps=None, loop=False, quality=80):
+        self.path = path
+        self.loop = loop
+        self.quality = quality
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise FileNotFoundError(f"Không thể mở video: {path}")
+        self.fps = fps or cap.get(cv2.CAP_PROP_FPS) or 25.0
+        cap.release()
+        self.jpeg = None
+        self.seq = 0
+        self.finished = False
+        self.generation = 0  # Tăng lên mỗi lần cắt kết nối
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, name="standin-source", daemon=True).start()
+
+    def _run(self):
+        interval = 1.0 / self.fps
+        next_time = time.perf_counter()
+        while True:
+            cap = cv2.VideoCapture(self.path)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                with self._cond:
+                    self.jpeg = buf.tobytes()
+                    self.seq += 1
+                    self._cond.notify_all()
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_time = time.perf_counter()
+            cap.release()
+            if not self.loop:
+                break
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+
+    def wait_next(self, seq, generation):
+        """Chờ frame sau seq; trả về (seq mới, jpeg) hoặc None khi hết video / bị cắt kết nối."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > seq or self.finished or self.generation != generation)
+            if self.seq <= seq or self.generation != generation:
+                return None
+            return self.seq, self.jpeg
+
+    def drop_connections(self):
+        with self._cond:
+            self.generation += 1
+            self._cond.notify_all()
+
+
+def serve_http(source, port, drop_every=None):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/stream.mjpg":
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+            self.end_headers()
+            seq, generation = source.seq, source.generation
+            try:
+                while True:
+                    item = source.wait_next(seq, generation)
+                    if item is None:
+                        break
+                    seq, jpeg = item
+                    self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                     f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                    self.wfile.write(jpeg)
+                    self.wfile.write(b"\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    if drop_every:
+        def dropper():
+            while True:
+                time.sleep(drop_every)
+                print("Cắt mọi kết nối")
+                source.drop_connections()
+        threading.Thread(target=dropper, name="standin-dropper", daemon=True).start()
+    print(f"Đang phát {source.path} tại http://127.0.0.1:{port}/stream.mjpg ({source.fps:.1f} FPS)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def serve_fifo(path, fifo, loop=False):
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("Không tìm thấy ffmpeg trong PATH (cần cho --fifo)")
+    if not os.path.exists(fifo):
+        os.mkfifo(fifo)
+    cmd = ["ffmpeg", "-v", "error", "-re"]
+    if loop:
+        cmd += ["-stream_loop", "-1"]
+    cmd += ["-i", path, "-an", "-c:v", "mpeg2video", "-q:v", "4", "-f", "mpegts", "-y", fifo]
+    print(f"Đang phát {path} vào named pipe {fifo}")
+    try:
+        # Mỗi lần bên đọc mở lại pipe thì chạy lại ffmpeg (giống camera được cắm lại)
+        while True:
+            subprocess.run(cmd, check=False)
+            if not loop:
+                break
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Video dùng làm nguồn")
+    parser.add_argument("--http", type=int, metavar="PORT", help="Phát MJPEG qua HTTP ở cổng này")
+    parser.add_argument("--fifo", help="Phát vào named pipe này (cần ffmpeg)")
+    parser.add_argument("--fps", type=float, help="FPS phát (mặc định theo video)")
+    parser.add_argument("--loop", action="store_true", help="Phát lặp lại mãi")
+    parser.add_argument("--drop-every", type=float, help="(--http) Cắt mọi kết nối mỗi N giây")
+    args = parser.parse_args()
+
+    if args.fifo:
+        serve_fifo(args.input, args.fifo, args.loop)
+    else:
+        serve_http(FrameSource(args.input, args.fps, args.loop), args.http or 8090, args.drop_every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# benchmarks/parity_chunked.py
+"""
+So sánh số đếm của chunked.process_chunked với VideoEngine chạy tuần tự trên cùng 1 video, theo
+mật độ xe (--rates) và số chunk (--chunks). Dùng video giả lập + BlobDetector (detect theo pixel,
+không cần model). Báo tổng số đếm, độ lệch tổng (lượt và % số đếm tuần tự), độ lệch trung bình mỗi
+ranh giới chunk và số lượt ghép (trùng bị bỏ / sót được thêm). Thoát với mã 1 nếu độ lệch tổng vượt
+--max-error (tỉ lệ so với số đếm tuần tự). Kết quả đo ghi trong docstring của chunked.py.
+
+Chạy: python -m benchmarks.parity_chunked [--frames 1200] [--rates 0.3 0.6 1.0] [--chunks 2 4 6]
+      [--overlap 300] [--max-error 0.02] [--json out.json]
+"""
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.stub_detector import BlobDetector
+from benchmarks.synthetic import write_video
+from chunked import process_chunked
+from video_engine import VideoEngine
+
+FPS = 25
+
+
+def run_sequential(video, out_dir):
+    engine = VideoEngine(detector=BlobDetector(), render=False)
+    atexit.unregister(engine.stop)
+    engine.output_dir = out_dir
+    engine.start(video, csv_path=os.path.join(out_dir, "sequential_counts.csv"))
+    while engine.process_next_frame()[0]:
+        pass
+    total = engine.get_stats().get("total", 0)
+    engine.stop()
+    return total
+
+
+def run(frames=1200, rates=(0.3, 0.6, 1.0), chunks=(2, 4, 6), overlap=300, seed=0):
+    work = tempfile.mkdtemp(prefix="parity_chunked_")
+    results = []
+    try:
+        for rate in rates:
+            video = os.path.join(work, f"clip_{rate}.avi")
+            write_video(video, frames=frames, fps=FPS, rate=rate, seed=seed)
+            # Counter / process_chunked in ra mỗi lần đếm -> bỏ stdout cho khỏi ngập
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                reference = run_sequential(video, work)
+            for n in chunks:
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    result = process_chunked(video, csv_path=os.path.join(work, f"chunked_{rate}_{n}.csv"),
+                                             workers=min(n, os.cpu_count() or 1), chunks=n,
+                                             overlap_s=overlap / FPS, output_dir=work, detector=BlobDetector())
+                total = result["counts"]["total"]
+                results.append({
+                    "rate": rate,
+                    "chunks": result["chunks"],
+                    "sequential": reference,
+                    "chunked": total,
+                    "error": total - reference,
+                    "relative_error": abs(total - reference) / max(1, reference),
+                    "error_per_boundary": abs(total - reference) / max(1, result["chunks"] - 1),
+                    **result["stitching"],
+                })
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=1200)
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.3, 0.6, 1.0],
+                        help="Số xe mới trung bình mỗi frame")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[2, 4, 6])
+    parser.add_argument("--overlap", type=int, default=300, help="Số frame chồng lấn mỗi phía")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-error", type=float, default=0.02, help="Độ lệch tổng tối đa (tỉ lệ số đếm tuần tự)")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    results = run(args.frames, args.rates, args.chunks, args.overlap, args.seed)
+    print(f"{'mật độ':>6} {'chunk':>5} {'tuần tự':>8} {'chunked':>8} {'lệch':>5} {'%':>6} {'/ranh giới':>10} "
+          f"{'trùng':>6} {'sót':>4}")
+    for r in results:
+        print(f"{r['rate']:>6} {r['chunks']:>5} {r['sequential']:>8} {r['chunked']:>8} {r['error']:>+5} "
+              f"{r['relative_error']:>6.1%} {r['error_per_boundary']:>10.1f} {r['duplicates_removed']:>6} "
+              f"{r['missed_recovered']:>4}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    failed = [r for r in results if r["relative_error"] > args.max_error]
+    if failed:
+        names = [f"mật độ {r['rate']} / {r['chunks']} chunk" for r in failed]
+        print(f"Lệch quá {args.max_error:.1%} số đếm tuần tự: {', '.join(names)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/parity_multistream.py
+"""
+Kiểm tra MultiStreamEngine đếm giống hệt VideoEngine chạy riêng trên cùng 1 clip, với các cấu hình
+đi qua đường detect của engine: decode_size, roi_crop, detect_stride, motion gate, cache detection.
+Dùng video giả lập + BlobDetector (detect theo pixel, không cần model), mỗi cấu hình chạy multi-stream
+với 2 bản của cùng clip. Thoát với mã 1 nếu có cấu hình cho số đếm khác nhau.
+
+Chạy: python -m benchmarks.parity_multistream [--frames 300] [--rate 0.2]
+"""
+import argparse
+import atexit
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.stub_detector import BlobDetector
+from benchmarks.synthetic import write_video
+from multistream import MultiStreamEngine
+from video_engine import VideoEngine
+
+ROI = (200, 100, 1080, 620)
+
+
+def configs(cache_dir):
+    return {
+        "default": {},
+        "decode_size": {"decode_size": 640},
+        "roi_crop": {"roi_crop": True, "roi": ROI},
+        "decode_size+roi_crop": {"decode_size": 640, "roi_crop": True, "roi": ROI},
+        "detect_stride": {"detect_stride": 3},
+        "motion_gate": {"motion_gate": True},
+        "cache (cold)": {"detection_cache": cache_dir},
+        "cache (warm)": {"detection_cache": cache_dir, "decode_size": 640},
+    }
+
+
+def _split(kwargs):
+    kwargs = dict(kwargs)
+    return kwargs.pop("roi", None), kwargs
+
+
+def run_single(video, out_dir, kwargs):
+    roi, kwargs = _split(kwargs)
+    engine = VideoEngine(detector=BlobDetector(), render=False, **kwargs)
+    atexit.unregister(engine.stop)
+    engine.output_dir = out_dir
+    engine.set_roi(roi)
+    engine.start(video, csv_path=os.path.join(out_dir, "single_counts.csv"))
+    while engine.process_next_frame()[0]:
+        pass
+    stats = engine.get_stats()
+    engine.stop()
+    return stats
+
+
+def run_multi(video, out_dir, kwargs, streams=2):
+    roi, kwargs = _split(kwargs)
+    engine = MultiStreamEngine({f"s{i}": video for i in range(streams)}, detector=BlobDetector(),
+                               output_dir=out_dir, **kwargs)
+    for s in engine.streams:
+        s.engine.set_roi(roi)
+    try:
+        stats = engine.run()
+    finally:
+        engine.stop()
+    return [st["counts"] for st in stats["streams"].values()]
+
+
+def _class_counts(stats):
+    return {k: v for k, v in stats.items() if isinstance(v, int)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=0.2, help="Số xe mới trung bình mỗi frame")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="parity_")
+    failed = []
+    try:
+        video = os.path.join(work, "clip.avi")
+        write_video(video, frames=args.frames, rate=args.rate)
+        for name, kwargs in configs(os.path.join(work, "cache")).items():
+            # Counter in ra mỗi lần đếm -> bỏ stdout cho khỏi ngập
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                single = _class_counts(run_single(video, work, kwargs))
+                multi = [_class_counts(c) for c in run_multi(video, work, kwargs)]
+            ok = all(c == single for c in multi)
+            if not ok:
+                failed.append(name)
+            print(f"{name:<22} single={single.get('total', 0):>4} "
+                  f"multi={[c.get('total', 0) for c in multi]} {'OK' if ok else 'KHÁC'}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    if failed:
+        print(f"Số đếm khác nhau: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/soak.py
+"""
+Soak test bộ nhớ của VideoEngine cho stream chạy liên tục: đẩy detections giả lập qua
+track + đếm (không decode, không model) và in bộ nhớ Python đang dùng sau mỗi giờ mô phỏng.
+Bộ nhớ phải đi ngang, không tăng theo thời gian. Khi dừng, file history spill (counter.py) phải chứa
+đúng mọi lượt đếm: số dòng (trừ header) = tổng số đếm, không ID nào bị ghi 2 lần.
+
+Chạy: python -m benchmarks.soak [--hours 24] [--fps 25] [--rate 0.2] [--json out.json]
+"""
+import argparse
+import atexit
+import contextlib
+import csv
+import os
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import SyntheticTraffic
+from counter import HISTORY_COLUMNS
+from video_engine import VideoEngine
+
+
+class _NamesOnly:
+    """Engine chỉ cần bảng tên class; soak test không gọi detect."""
+    names = {2: "car", 3: "motorcycle", 5: "bus", 7: "truck"}
+
+
+def check_history(out_dir, name):
+    """Đọc 2 file history spill; trả về {rows, duplicate_ids, header_ok}."""
+    rows, duplicates, header_ok = 0, 0, True
+    for direction in ("down", "up"):
+        seen = set()
+        with open(os.path.join(out_dir, f"{name}_history_{direction}.csv"), newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header_ok &= next(reader, None) == HISTORY_COLUMNS
+            for row in reader:
+                rows += 1
+                duplicates += row[1] in seen
+                seen.add(row[1])
+    return {"rows": rows, "duplicate_ids": duplicates, "header_ok": header_ok}
+
+
+def run(hours=24.0, fps=25, rate=0.2, history_size=10000, seed=0):
+    """Trả về (báo cáo theo giờ, kết quả kiểm tra file history khi dừng)."""
+    traffic = SyntheticTraffic(rate=rate, seed=seed)
+    engine = VideoEngine(detector=_NamesOnly(), history_size=history_size)
+    atexit.unregister(engine.stop)  # Thư mục output tạm bị xóa khi kết thúc
+    report = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        engine.output_dir = out_dir
+        engine._begin(traffic.width, traffic.height, "soak")
+
+        frames_per_hour = int(fps * 3600)
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        # Counter in ra mỗi lần đếm -> bỏ stdout cho khỏi ngập
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for hour in range(1, int(hours) + 1):
+                for _ in range(frames_per_hour):
+                    engine._track_and_count(traffic.step())
+                current, _ = tracemalloc.get_traced_memory()
+                stats = engine.get_stats()
+                report.append({
+                    "hour": hour,
+                    "memory_kb": current / 1024,
+                    "tracks": len(engine.tracker.bank),
+                    "prev_centroids": len(engine.prev_centroids),
+                    "counted_ids": len(engine.counter_down.counted_ids) + len(engine.counter_up.counted_ids),
+                    "total": stats.get("total", 0),
+                    "elapsed_s": time.perf_counter() - t0,
+                })
+                print(f"giờ {hour}: {current / 1024:.1f} KB, {report[-1]['elapsed_s']:.0f}s", file=sys.stderr)
+        tracemalloc.stop()
+        engine.stop()
+        history = check_history(out_dir, "soak")
+        history["total"] = report[-1]["total"] if report else 0
+    return report, history
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--rate", type=float, default=0.2, help="Số xe mới trung bình mỗi frame")
+    parser.add_argument("--history-size", type=int, default=10000, help="Kích thước ring buffer history của Counter")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    report, history = run(args.hours, args.fps, args.rate, args.history_size)
+    print(f"{'hour':>5} {'memory (KB)':>12} {'tracks':>7} {'centroids':>10} {'counted':>8} {'total':>8}")
+    for r in report:
+        print(f"{r['hour']:>5} {r['memory_kb']:>12.1f} {r['tracks']:>7} {r['prev_centroids']:>10} "
+              f"{r['counted_ids']:>8} {r['total']:>8}")
+    print(f"history: {history['rows']} dòng / {history['total']} lượt đếm, {history['duplicate_ids']} ID trùng, "
+          f"header {'OK' if history['header_ok'] else 'SAI'}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"hours": report, "history": history}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/stub_detector.py
+"""Detector giả thay cho VehicleDetector: phát lại box thật (kèm nhiễu) thay vì chạy model."""
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import BACKGROUND, CLASS_COLORS, add_noise
+from detector import empty_detections
+
+COCO_VEHICLE_NAMES = {2: "car", 3: "motorcycle", 5: "bus", 7: "truck"}
+
+
+class ReplayDetector:
+    """
+    Cùng giao diện với VehicleDetector (names, class_ids, imgsz, detect, detect_batch, warmup).
+    truths: list box thật theo frame (vd. từ synthetic.write_video). Mỗi frame được detect nhận
+    box thật của frame kế tiếp theo thứ tự gọi, nên engine phải detect mọi frame (detect_stride=1,
+    không motion gate). Hết truths thì trả về mảng rỗng.
+    latency: thời gian (giây) giả lập cho mỗi frame, để đo engine khi detect là phần chậm nhất.
+    """
+
+    def __init__(self, truths, noise=1.5, miss_rate=0.05, latency=0.0, imgsz=640, seed=0):
+        self.truths = truths
+        self.noise = noise
+        self.miss_rate = miss_rate
+        self.latency = latency
+        self.imgsz = imgsz
+        self.names = dict(COCO_VEHICLE_NAMES)
+        self.class_ids = sorted(self.names)
+        self.startup_times = {"import_s": 0.0, "load_s": 0.0, "warmup_s": 0.0}
+        self.rng = np.random.default_rng(seed)
+        self.calls = 0
+        self._next = 0
+
+    def detect(self, frame, conf=0.25, iou=0.45):
+        return self.detect_batch([frame], conf=conf, iou=iou)[0]
+
+    def detect_batch(self, frames, conf=0.25, iou=0.45, imgsz=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency * len(frames))
+        results = []
+        for _ in frames:
+            if self._next < len(self.truths):
+                dets = add_noise(self.truths[self._next], self.rng, self.noise, self.miss_rate)
+                results.append(dets[dets["conf"] >= conf])
+            else:
+                results.append(empty_detections())
+            self._next += 1
+        return results
+
+    def warmup(self):
+        pass
+
+    def rewind(self):
+        self._next = 0
+
+
+class BlobDetector:
+    """
+    Detector giả đọc pixel của frame (video từ synthetic.write_video): mỗi khối màu là 1 box, class theo
+    màu gần nhất. Khác ReplayDetector, kết quả phụ thuộc ảnh đưa vào (thu nhỏ, cắt ROI) và không phụ thuộc
+    thứ tự gọi, nên dùng được để so sánh các đường detect khác nhau (vd. parity_multistream).
+    """
+
+    def __init__(self, imgsz=640, min_area=20):
+        self.imgsz = imgsz
+        self.min_area = min_area
+        self.names = dict(COCO_VEHICLE_NAMES)
+        self.class_ids = sorted(self.names)
+        self.startup_times = {"import_s": 0.0, "load_s": 0.0, "warmup_s": 0.0}
+        self.calls = 0
+        self._classes = np.array(sorted(CLASS_COLORS))
+        self._colors = np.array([CLASS_COLORS[c] for c in self._classes], dtype=np.float32)
+
+    def detect(self, frame, conf=0.25, iou=0.45):
+        return self.detect_batch([frame], conf=conf, iou=iou)[0]
+
+    def detect_batch(self, frames, conf=0.25, iou=0.45, imgsz=None):
+        self.calls += 1
+        return [self._detect_one(frame) for frame in frames]
+
+    def _detect_one(self, frame):
+        lo, hi = BACKGROUND - 20, BACKGROUND + 20
+        mask = cv2.bitwise_not(cv2.inRange(frame, (lo, lo, lo), (hi, hi, hi)))
+        n, labels, boxes, centers = cv2.connectedComponentsWithStats(mask)
+        keep = [i for i in range(1, n) if boxes[i, 4] >= self.min_area]
+        dets = empty_detections()
+        if not keep:
+            return dets
+        dets = np.zeros(len(keep), dtype=dets.dtype)
+        x, y, w, h = (boxes[keep, j] for j in range(4))
+        dets["xyxy"] = np.column_stack((x, y, x + w, y + h))
+        dets["conf"] = 0.9
+        cy, cx = centers[keep, 1].astype(int), centers[keep, 0].astype(int)
+        color = frame[cy, cx].astype(np.float32)
+        nearest = np.linalg.norm(color[:, None, :] - self._colors[None], axis=2).argmin(axis=1)
+        dets["cls"] = self._classes[nearest]
+        return dets
+
+    def warmup(self):
+        pass
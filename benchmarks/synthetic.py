@@ -0,0 +1,97 @@
+# benchmarks/synthetic.py
+"""Sinh dữ liệu giao thông giả lập (box thật, detections có nhiễu, video) cho benchmark / soak test."""
+import cv2
+import numpy as np
+
+from detector import DETECTION_DTYPE
+
+
+class SyntheticTraffic:
+    """
+    Xe giả lập chạy dọc khung hình, đi xuống hoặc đi lên, với mật độ điều chỉnh được.
+    rate: số xe mới trung bình mỗi frame (phân phối Poisson).
+    step() trả về detections của frame tiếp theo dạng DETECTION_DTYPE (box thật + nhiễu).
+    """
+
+    def __init__(self, width=1280, height=720, rate=0.2, speed=(3.0, 8.0), size=(40, 90),
+                 classes=(2, 3, 5, 7), noise=1.5, miss_rate=0.05, seed=0):
+        self.width = width
+        self.height = height
+        self.rate = rate
+        self.speed = speed
+        self.size = size
+        self.classes = np.asarray(classes)
+        self.noise = noise
+        self.miss_rate = miss_rate
+        self.rng = np.random.default_rng(seed)
+        # Mỗi xe: [x1, y1, w, h, vy, cls]
+        self.vehicles = np.zeros((0, 6))
+
+    def _spawn(self, n):
+        rng = self.rng
+        w = rng.uniform(self.size[0], self.size[1], n)
+        h = w * rng.uniform(0.6, 1.0, n)
+        down = rng.random(n) < 0.5
+        y = np.where(down, -h, self.height)
+        vy = rng.uniform(self.speed[0], self.speed[1], n) * np.where(down, 1, -1)
+        x = rng.uniform(0, self.width - w)
+        cls = rng.choice(self.classes, n)
+        return np.column_stack((x, y, w, h, vy, cls))
+
+    def advance(self):
+        """Chuyển sang frame tiếp theo, trả về box thật (không nhiễu, không sót) dạng DETECTION_DTYPE."""
+        v = self.vehicles
+        v[:, 1] += v[:, 4]
+        v = v[(v[:, 1] + v[:, 3] > -1) & (v[:, 1] < self.height + 1)]
+        n_new = self.rng.poisson(self.rate)
+        if n_new:
+            v = np.concatenate((v, self._spawn(n_new)))
+        self.vehicles = v
+
+        truth = np.empty(len(v), dtype=DETECTION_DTYPE)
+        truth["xyxy"] = np.column_stack((v[:, 0], v[:, 1], v[:, 0] + v[:, 2], v[:, 1] + v[:, 3]))
+        truth["conf"] = 1.0
+        truth["cls"] = v[:, 5]
+        return truth
+
+    def step(self):
+        return add_noise(self.advance(), self.rng, self.noise, self.miss_rate)
+
+
+def add_noise(truth, rng, noise=1.5, miss_rate=0.05):
+    """Giả lập detector: bỏ sót ngẫu nhiên miss_rate box, lệch tọa độ theo N(0, noise), conf ngẫu nhiên."""
+    dets = truth[rng.random(len(truth)) >= miss_rate]
+    dets["xyxy"] += rng.normal(0, noise, dets["xyxy"].shape)
+    dets["conf"] = rng.uniform(0.5, 0.95, len(dets))
+    return dets
+
+
+# Màu (BGR) của xe theo class id và màu nền khi vẽ video giả lập
+BACKGROUND = 40
+CLASS_COLORS = {2: (200, 200, 200), 3: (60, 180, 255), 5: (255, 120, 40), 7: (80, 220, 80)}
+
+
+def render_frame(truth, width, height):
+    """Vẽ box thật thành các khối màu trên nền xám (đủ để decode / motion gate / vẽ có việc làm)."""
+    frame = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+    for (x1, y1, x2, y2), cls in zip(truth["xyxy"].astype(int), truth["cls"]):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), CLASS_COLORS.get(int(cls), (255, 255, 255)), -1)
+    return frame
+
+
+def write_video(path, frames=300, fps=25, **traffic_kwargs):
+    """
+    Sinh video giả lập (MJPG) bằng SyntheticTraffic; traffic_kwargs điều chỉnh mật độ (rate), kích thước...
+    Trả về list box thật của từng frame (dùng cho ReplayDetector).
+    """
+    traffic = SyntheticTraffic(**traffic_kwargs)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (traffic.width, traffic.height))
+    truths = []
+    try:
+        for _ in range(frames):
+            truth = traffic.advance()
+            writer.write(render_frame(truth, traffic.width, traffic.height))
+            truths.append(truth)
+    finally:
+        writer.release()
+    return truths
@@ -0,0 +1,241 @@
+# chunked.py
+"""
+Xử lý song song 1 video dài: chia video thành các đoạn (chunk) theo thời gian, mỗi đoạn chạy
+VideoEngine riêng trong 1 process, rồi ghép các lượt đếm lại thành 1 CSV + summary.
+
+Mỗi chunk [start, end) được xử lý rộng thêm `overlap` frame về 2 phía:
+    - phần trước start (warm-up): SORT / Counter có sẵn track và trạng thái "đã đếm" khi chunk bắt đầu,
+      nên xe đã cắt vạch trước start không bị đếm lại;
+    - phần sau end (tail): dùng để bù lượt đếm rơi vào khe giữa 2 chunk ở ranh giới.
+Ghép tại mỗi ranh giới b giữa chunk k và k+1; 2 lượt đếm là cùng 1 lần cắt vạch khi cùng chiều,
+lệch nhau không quá STITCH_FRAMES frame (hoặc detect_stride nếu lớn hơn) và tâm xe lệch <= 40 px theo x:
+    - lượt đếm thuộc về chunk chứa frame đó (chunk k: <= b, chunk k+1: > b);
+    - chunk k đếm ngay trước b, chunk k+1 đếm cùng lần đó ngay sau b -> trùng, bỏ bản của k+1;
+    - chunk k đếm ngay sau b, chunk k+1 đếm cùng lần đó ngay trước b (warm-up) -> thêm bản của k.
+
+Sai số so với chạy tuần tự đến từ phần trong chunk, không phải từ chỗ ghép: ID switch và class bầu
+theo lịch sử track phụ thuộc trạng thái SORT, nên chunk chỉ đếm giống hệt khi warm-up dài hơn "bộ nhớ"
+của tracker (thời gian 1 xe ở trong khung hình + max_age 90 frame). Đo bằng benchmarks/parity_chunked.py
+(video giả lập 1200 frame 25 FPS, 2 / 4 / 6 chunk), lệch tổng số đếm so với tuần tự:
+    mật độ (xe mới/frame)        0.3         0.6         1.0
+    overlap 3 s (75 frame)       0 - 8       0 - 20      5 - 16
+    overlap 12 s (300 frame)     0           1           1 - 6
+Số đếm theo class có thể lệch thêm (class bầu theo lịch sử track). object_id trong CSV là
+chunk_index * CHUNK_ID_STRIDE + ID trong chunk. Thời gian chạy giảm gần tuyến tính theo số
+worker, trừ chi phí load model ở mỗi process và phần overlap bị xử lý 2 lần.
+
+Chạy: python chunked.py input.mp4 [--workers 4] [--overlap 12.0] [--csv counts.csv]
+"""
+import argparse
+import atexit
+import contextlib
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from video_engine import VideoEngine
+from writers import open_writer
+
+CHUNK_ID_STRIDE = 1_000_000
+STITCH_FRAMES = 2  # Lệch frame tối đa giữa 2 chunk của cùng 1 lần cắt vạch (detect mỗi frame)
+DEFAULT_CLASSES = ("car", "motorcycle", "bus", "truck")
+
+
+def plan_chunks(total_frames, chunks, overlap):
+    """Chia [0, total_frames) thành `chunks` đoạn; trả về list (start, end, read_start, read_end)."""
+    bounds = [round(i * total_frames / chunks) for i in range(chunks + 1)]
+    return [(start, end, max(0, start - overlap), min(total_frames, end + overlap))
+            for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _process_chunk(in_path, read_start, read_end, out_dir, engine_kwargs):
+    """Chạy trong worker process: xử lý frame [read_start, read_end), trả về các lượt đếm."""
+    events = []
+    # Mỗi chunk 1 thư mục riêng: file tạm của engine (CSV, summary, history) không đè lên nhau
+    out_dir = os.path.join(out_dir, f"chunk_{read_start}")
+    os.makedirs(out_dir, exist_ok=True)
+    engine = VideoEngine(render=False, on_count=events.append, **engine_kwargs)
+    atexit.unregister(engine.stop)
+    engine.output_dir = out_dir
+    t0 = time.perf_counter()
+    # Counter in ra mỗi lần đếm -> bỏ stdout của worker, kết quả đã có trong events
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        engine.start(in_path, csv_path=os.path.join(out_dir, "counts.csv"))
+        engine.seek(read_start)  # Số frame trong CSV giống chạy tuần tự (frame đầu tiên = 1)
+        frames = 0
+        while frames < read_end - read_start:
+            ret, _, _ = engine.process_next_frame()
+            if not ret:
+                break
+            frames += 1
+        engine.stop()
+    return {"events": events, "frames": frames, "elapsed_s": time.perf_counter() - t0}
+
+
+def _match(event, candidates, max_frames, max_dx):
+    """Tìm lượt đếm trong candidates cùng chiều, gần về vị trí x và thời gian với event."""
+    best, best_dx = None, None
+    for i, other in enumerate(candidates):
+        if other["direction"] != event["direction"] or abs(other["frame"] - event["frame"]) > max_frames:
+            continue
+        dx = abs(other["centroid"][0] - event["centroid"][0])
+        if dx <= max_dx and (best_dx is None or dx < best_dx):
+            best, best_dx = i, dx
+    return best
+
+
+def stitch(chunks, results, max_frames=STITCH_FRAMES, max_dx=40):
+    """
+    Ghép lượt đếm của các chunk (xem docstring module). chunks: list (start, end, ...) từ plan_chunks;
+    results: list events của từng chunk; max_frames, max_dx: 2 lượt đếm của 2 chunk là cùng 1 lần
+    cắt vạch khi cùng chiều, lệch nhau không quá max_frames frame và max_dx px theo x.
+    Trả về (events đã ghép theo thứ tự frame, thống kê ghép).
+    """
+    owned = []
+    for k, ((start, end, *_), events) in enumerate(zip(chunks, results)):
+        mine = []
+        for e in events:
+            if start < e["frame"] <= end:  # Frame trong CSV đánh số từ 1
+                e = dict(e, object_id=k * CHUNK_ID_STRIDE + e["object_id"], chunk=k)
+                mine.append(e)
+        owned.append(mine)
+
+    duplicates = recovered = 0
+    for k in range(len(chunks) - 1):
+        b = chunks[k][1]
+        # Chunk trước đếm ngay trước b, chunk sau đếm cùng lần cắt vạch đó ngay sau b -> bỏ bản sau
+        before = [e for e in owned[k] if e["frame"] > b - max_frames]
+        kept = []
+        for e in owned[k + 1]:
+            if e["frame"] <= b + max_frames:
+                i = _match(e, before, max_frames, max_dx)
+                if i is not None:
+                    before.pop(i)
+                    duplicates += 1
+                    continue
+            kept.append(e)
+        owned[k + 1] = kept
+
+        # Chunk trước đếm ngay sau b, chunk sau đếm ngay trước b (phần warm-up, bị bỏ) -> không chunk
+        # nào giữ lần cắt vạch đó: thêm bản của chunk trước
+        early = [e for e in results[k + 1] if b - max_frames < e["frame"] <= b]
+        for e in results[k]:
+            if b < e["frame"] <= b + max_frames:
+                i = _match(e, early, max_frames, max_dx)
+                if i is not None:
+                    early.pop(i)
+                    owned[k + 1].append(dict(e, object_id=k * CHUNK_ID_STRIDE + e["object_id"], chunk=k))
+                    recovered += 1
+
+    merged = sorted((e for events in owned for e in events), key=lambda e: (e["frame"], e["object_id"]))
+    return merged, {"duplicates_removed": duplicates, "missed_recovered": recovered}
+
+
+def _summary(in_path, events):
+    counts = {"down": dict.fromkeys(DEFAULT_CLASSES, 0), "up": dict.fromkeys(DEFAULT_CLASSES, 0)}
+    for e in events:
+        by_class = counts[e["direction"]]
+        by_class[e["class"]] = by_class.get(e["class"], 0) + 1
+    all_keys = set(counts["down"]) | set(counts["up"])
+    combined = {k: counts["down"].get(k, 0) + counts["up"].get(k, 0) for k in all_keys}
+    return {
+        "source_video": in_path,
+        "total_all": sum(combined.values()),
+        "counts_by_class_total": combined,
+        "details": {
+            "total_down": sum(counts["down"].values()),
+            "counts_down": counts["down"],
+            "total_up": sum(counts["up"].values()),
+            "counts_up": counts["up"],
+        },
+    }
+
+
+def process_chunked(in_path, csv_path=None, workers=None, chunks=None, overlap_s=12.0, output_dir="outputs",
+                    **engine_kwargs):
+    """
+    Đếm xe trong 1 video bằng nhiều process. workers: số process (mặc định số CPU);
+    chunks: số đoạn (mặc định = workers); overlap_s: độ dài phần chồng lấn mỗi phía (giây).
+    engine_kwargs: tham số cho VideoEngine của mỗi chunk (vd. model_path, detect_stride) - phải pickle được.
+    Trả về dict {frames, elapsed_s, fps, counts, csv_path, summary_path, chunks, stitching}.
+    """
+    cap = cv2.VideoCapture(in_path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Không thể mở video: {in_path}")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+    if total_frames <= 0:
+        raise ValueError(f"Không xác định được số frame của video: {in_path}")
+
+    workers = workers or os.cpu_count() or 1
+    overlap = int(round(overlap_s * fps))
+    plan = plan_chunks(total_frames, chunks or workers, overlap)
+
+    base_name = os.path.splitext(os.path.basename(in_path))[0]
+    os.makedirs(output_dir, exist_ok=True)
+    csv_path = csv_path or os.path.join(output_dir, f"{base_name}_counts.csv")
+    summary_path = os.path.join(os.path.dirname(csv_path), f"{base_name}_summary.json")
+
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # spawn: không fork process đang giữ thread / model của process cha
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futures = [pool.submit(_process_chunk, in_path, rs, re, tmp_dir, engine_kwargs)
+                       for _, _, rs, re in plan]
+            chunk_results = [f.result() for f in futures]
+
+    # Với detect_stride > 1, 2 chunk có pha keyframe khác nhau: cùng 1 lần cắt vạch lệch tới stride frame
+    max_frames = max(STITCH_FRAMES, engine_kwargs.get("detect_stride", 1))
+    events, stitching = stitch(plan, [r["events"] for r in chunk_results], max_frames)
+    summary = _summary(in_path, events)
+    summary["chunks"] = [{"start": s, "end": e, "frames_read": r["frames"], "elapsed_s": r["elapsed_s"]}
+                         for (s, e, _, _), r in zip(plan, chunk_results)]
+    summary["stitching"] = dict(stitching, overlap_frames=overlap, match_frames=max_frames)
+
+    writer = open_writer(csv_path)
+    for e in events:
+        writer.write([e["frame"], e["object_id"], e["class"], e["direction"], e["timestamp"]])
+    writer.write_summary(summary_path, summary)
+    writer.close()
+
+    elapsed = time.perf_counter() - t0
+    counts = dict(summary["counts_by_class_total"], total=summary["total_all"])
+    print(f"Đã xử lý {total_frames} frame bằng {len(plan)} chunk / {workers} process trong {elapsed:.1f}s "
+          f"({total_frames / elapsed:.1f} FPS)")
+    return {
+        "frames": total_frames,
+        "elapsed_s": elapsed,
+        "fps": total_frames / elapsed if elapsed > 0 else 0.0,
+        "counts": counts,
+        "csv_path": csv_path,
+        "summary_path": summary_path,
+        "chunks": len(plan),
+        "stitching": stitching,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đếm xe trong 1 video dài bằng nhiều process")
+    parser.add_argument("input", help="Đường dẫn video đầu vào")
+    parser.add_argument("--csv", help="File kết quả các lượt đếm")
+    parser.add_argument("--workers", type=int, help="Số process (mặc định: số CPU)")
+    parser.add_argument("--chunks", type=int, help="Số đoạn (mặc định: bằng số process)")
+    parser.add_argument("--overlap", type=float, default=12.0, help="Độ dài phần chồng lấn mỗi phía (giây)")
+    parser.add_argument("--model", default="yolov8n.pt", help="Model YOLO")
+    parser.add_argument("--detect-stride", type=int, default=1, help="Chỉ detect mỗi k frame")
+    args = parser.parse_args()
+
+    result = process_chunked(args.input, csv_path=args.csv, workers=args.workers, chunks=args.chunks,
+                             overlap_s=args.overlap, model_path=args.model, detect_stride=args.detect_stride)
+    print(f"Kết quả: {result['counts']} | ghép: {result['stitching']}")
+    print(f"File: {result['csv_path']} | Summary: {result['summary_path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,39 @@
 # counter.py
+from collections import deque
 from datetime import datetime
 import csv
 import os
 
+HISTORY_COLUMNS = ["frame", "object_id", "class", "timestamp"]
+
 
 class Counter:
-    def __init__(self, line_position_y, direction="down"):
+    def __init__(self, line_position_y, direction="down", history_size=10000, spill_path=None):
         """
         line_position_y: pixel y của counting line
         direction: "down" (từ trên xuống) hoặc "up" (từ dưới lên)
+        history_size: số sự kiện đếm giữ trong bộ nhớ (ring buffer)
+        spill_path: file CSV nhận các sự kiện cũ bị đẩy ra khỏi ring buffer (None = bỏ đi); file được
+            ghi lại từ đầu (có header) ở lần ghi đầu tiên của mỗi lượt chạy, spill_all() ghi nốt phần
+            còn trong bộ nhớ khi dừng, nên file chứa đủ mọi sự kiện của lượt chạy đó theo thứ tự
         """
         self.line_y = int(line_position_y)
         self.direction = direction
         self.counts = {"car": 0, "motorcycle": 0, "bus": 0, "truck": 0}
         self.counted_ids = set()
-        self.history = []
+        self.history = deque(maxlen=history_size)
+        self.spill_path = spill_path
+        self._spill_started = False  # Đã ghi lại file spill (kèm header) trong lượt chạy này chưa
 
     def reset(self):
         self.counts = {k: 0 for k in self.counts.keys()}
         self.counted_ids = set()
-        self.history = []
+        self.history.clear()
+        self._spill_started = False  # Lượt chạy mới ghi đè file spill cũ
+
+    def forget(self, object_id):
+        """Bỏ trạng thái của 1 ID đã bị tracker xóa (ID không bao giờ được dùng lại)."""
+        self.counted_ids.discard(object_id)
 
     def set_line(self, y):
         self.line_y = int(y)
@@ -59,6 +73,8 @@ class Counter:
         if should_count:
             self.counts[cls_name] += 1
             self.counted_ids.add(object_id)
+            if len(self.history) == self.history.maxlen:
+                self._spill()
             self.history.append((frame_idx, object_id, cls_name, timestamp))
 
             # DEBUG: In ra để biết nó có hoạt động không
@@ -67,6 +83,31 @@ class Counter:
 
         return False
 
+    def _spill(self):
+        """Đẩy nửa cũ của history ra file (ghi nhiều dòng trong 1 lần mở file)."""
+        self._write_spill([self.history.popleft() for _ in range(max(1, len(self.history) // 2))])
+
+    def spill_all(self):
+        """Ghi nốt mọi sự kiện còn trong history ra file spill (gọi khi dừng); history được xóa."""
+        entries = list(self.history)
+        self.history.clear()
+        self._write_spill(entries)
+
+    def _write_spill(self, entries):
+        if not self.spill_path:
+            return
+        try:
+            # Lần ghi đầu của lượt chạy: ghi đè file cũ và ghi header
+            mode = "a" if self._spill_started else "w"
+            with open(self.spill_path, mode, newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if not self._spill_started:
+                    writer.writerow(HISTORY_COLUMNS)
+                writer.writerows(entries)
+            self._spill_started = True
+        except Exception as e:
+            print(f"Lỗi khi ghi history: {e}")
+
     def get_summary(self):
         total = sum(self.counts.values())
         return {"counts": dict(self.counts), "total": total}
\ No newline at end of file
@@ -0,0 +1,142 @@
+# decode.py
+"""
+Decode video ở độ phân giải nhỏ (cỡ input của model) cho chế độ không cần vẽ / hiển thị.
+
+ScaledCapture có cùng giao diện với cv2.VideoCapture (isOpened, read, grab, get, set, release);
+get() trả về thông số của video gốc (kích thước, FPS, số frame), read() trả về frame đã thu nhỏ.
+Box detect trên frame thu nhỏ phải được đổi về tọa độ video gốc: VideoEngine làm việc này trong
+đường detect chung (video_engine.detect_for_engines), mà FramePipeline và MultiStreamEngine cũng
+đi qua, nên ROI, vạch đếm, CSV vẫn theo tọa độ gốc. Code gọi thẳng detector trên frame từ
+ScaledCapture phải tự nhân box với tỉ lệ video gốc / frame.
+
+backend:
+    "opencv": cv2.VideoCapture decode rồi resize 1 lần thẳng vào buffer dùng lại (không frame.copy()).
+    "ffmpeg": ffmpeg decode + scale, đọc raw BGR qua pipe thẳng vào buffer dùng lại
+              (không có frame full-res nào trong Python). Cần lệnh ffmpeg trong PATH.
+Buffer được dùng lại xoay vòng (buffers cái): frame trả về chỉ hợp lệ cho tới khi đã đọc thêm
+`buffers` frame, nên buffers phải lớn hơn số frame có thể đang nằm trong batch / queue.
+"""
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+
+def scaled_dims(width, height, size):
+    """Kích thước (w, h) với cạnh dài nhất = size, giữ tỉ lệ, làm tròn số chẵn; không phóng to."""
+    scale = min(1.0, size / max(width, height))
+    return max(2, int(round(width * scale / 2)) * 2), max(2, int(round(height * scale / 2)) * 2)
+
+
+class ScaledCapture:
+    def __init__(self, path, size=640, backend="opencv", buffers=4):
+        self.path = path
+        self.backend = backend
+        probe = cv2.VideoCapture(path)
+        self._opened = probe.isOpened()
+        self._props = {prop: probe.get(prop) for prop in (
+            cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FPS, cv2.CAP_PROP_FRAME_COUNT)}
+        self.source_size = (int(self._props[cv2.CAP_PROP_FRAME_WIDTH]), int(self._props[cv2.CAP_PROP_FRAME_HEIGHT]))
+        self.size = scaled_dims(*self.source_size, size) if self._opened else (0, 0)
+        w, h = self.size
+        self._buffers = [np.empty((h, w, 3), dtype=np.uint8) for _ in range(max(1, buffers))]
+        self._next_buffer = 0
+        self._pos = 0
+        self._full = None
+        self._cap = None
+        self._proc = None
+
+        if not self._opened:
+            probe.release()
+        elif backend == "ffmpeg":
+            probe.release()
+            if shutil.which("ffmpeg") is None:
+                raise RuntimeError("Không tìm thấy ffmpeg trong PATH (decoder='ffmpeg')")
+            self._start_ffmpeg(0)
+        else:
+            self._cap = probe  # Dùng lại luôn capture đã mở để lấy thông số
+
+    def _start_ffmpeg(self, frame_pos):
+        self._stop_ffmpeg()
+        w, h = self.size
+        cmd = ["ffmpeg", "-v", "error", "-nostdin"]
+        fps = self._props[cv2.CAP_PROP_FPS]
+        if frame_pos and fps:
+            cmd += ["-ss", f"{frame_pos / fps:.6f}"]
+        cmd += ["-i", self.path, "-vf", f"scale={w}:{h}:flags=area", "-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=w * h * 3)
+        self._pos = frame_pos
+
+    def _stop_ffmpeg(self):
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.stdout.close()
+            self._proc.wait()
+            self._proc = None
+
+    def isOpened(self):
+        return self._opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._pos)
+        return self._props.get(prop, 0.0)
+
+    def set(self, prop, value):
+        """Hỗ trợ tua tới frame (CAP_PROP_POS_FRAMES), dùng cho chunked.py."""
+        if prop != cv2.CAP_PROP_POS_FRAMES or not self._opened:
+            return False
+        if self._cap is not None:
+            ok = self._cap.set(prop, value)
+        else:
+            self._start_ffmpeg(int(value))
+            ok = True
+        self._pos = int(value)
+        return ok
+
+    def grab(self):
+        """Bỏ qua 1 frame (không resize)."""
+        if self._cap is not None:
+            ok = self._cap.grab()
+        else:
+            ok = self._read_into(self._buffers[self._next_buffer])
+        self._pos += ok
+        return ok
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        buf = self._buffers[self._next_buffer]
+        if self._cap is not None:
+            # Frame full-res cũng decode vào 1 buffer dùng lại, chỉ sống tới lần read sau
+            ok, frame = self._cap.read(self._full)
+            if ok:
+                self._full = frame
+                cv2.resize(frame, self.size, dst=buf, interpolation=cv2.INTER_AREA)
+        else:
+            ok = self._read_into(buf)
+        if not ok:
+            return False, None
+        self._next_buffer = (self._next_buffer + 1) % len(self._buffers)
+        self._pos += 1
+        return True, buf
+
+    def _read_into(self, buf):
+        if self._proc is None:
+            return False
+        view = memoryview(buf).cast("B")
+        got = 0
+        while got < len(view):
+            n = self._proc.stdout.readinto(view[got:])
+            if not n:
+                return False
+            got += n
+        return True
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        self._stop_ffmpeg()
+        self._opened = False
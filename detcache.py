@@ -0,0 +1,258 @@
+# detcache.py
+"""
+Cache detection trên đĩa: chạy lại cùng 1 video (để chỉnh vạch đếm, ROI, tham số SORT) không phải
+chạy lại model. Key = hash nội dung video + hash file weights + các tham số làm thay đổi kết quả detect
+(backend, conf, iou, imgsz, tên class xe được giữ, decode_size, vùng roi_crop), xem cache_key() và
+VideoEngine._open_cache(). Weights chưa có trên đĩa (ultralytics tự tải lúc load) thì engine load
+model trước khi tạo key, để lần chạy đầu và các lần sau dùng cùng 1 key.
+
+Mỗi key gồm 3 file trong cache_dir:
+    <key>.dets.npy   mảng DETECTION_DTYPE nối liền detections của mọi frame (np.load mmap_mode="r")
+    <key>.index.npy  int64 (số frame, 2): [vị trí bắt đầu, số box] của mỗi frame; -1 = chưa detect
+    <key>.json       thông tin video (kích thước, FPS, số frame), tên class, số frame đã có
+Detection mới được giữ trong bộ nhớ và ghi gộp với phần đã có khi save() (có khóa file, ghi file tạm
+rồi đổi tên), nên nhiều process (chunked.py) có thể cùng điền 1 cache.
+
+Hash video được nhớ theo (đường dẫn, kích thước, mtime) trong video_hashes.json, chỉ đọc lại
+toàn bộ file khi video thay đổi.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import cv2
+import numpy as np
+
+from detector import DETECTION_DTYPE
+from writers import write_json
+
+HASH_CHUNK = 8 * 1024 * 1024
+# Frame giả do FramelessCapture trả về (pipeline dùng None để báo dừng nên không trả về None)
+EMPTY_FRAME = np.empty((0, 0, 3), dtype=np.uint8)
+
+
+def file_hash(path):
+    """Hash nội dung 1 file, hoặc mọi file trong 1 thư mục (model OpenVINO)."""
+    h = hashlib.blake2b(digest_size=20)
+    paths = [path]
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    for p in paths:
+        h.update(os.path.relpath(p, path).encode() if p != path else b"")
+        with open(p, "rb") as f:
+            while chunk := f.read(HASH_CHUNK):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def video_hash(path, cache_dir):
+    """Hash nội dung video, nhớ lại theo (kích thước, mtime) để không phải đọc lại video cũ."""
+    memo_path = os.path.join(cache_dir, "video_hashes.json")
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    memo = {}
+    if os.path.exists(memo_path):
+        try:
+            with open(memo_path, encoding="utf-8") as f:
+                memo = json.load(f)
+        except (OSError, ValueError):
+            memo = {}
+    entry = memo.get(os.path.abspath(path))
+    if entry and entry[:2] == stamp:
+        return entry[2]
+    digest = file_hash(path)
+    memo[os.path.abspath(path)] = stamp + [digest]
+    with _file_lock(memo_path):
+        write_json(memo_path, memo)
+    return digest
+
+
+def cache_key(video_digest, model_path, **params):
+    """Key của 1 cache: hash video + hash model (nếu là file) + các tham số detect."""
+    model_id = file_hash(model_path) if model_path and os.path.exists(model_path) else str(model_path)
+    payload = json.dumps({"video": video_digest, "model": model_id, **params}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+@contextlib.contextmanager
+def _file_lock(path, timeout=30.0):
+    """Khóa đơn giản bằng file <path>.lock (tạo độc quyền), chờ tối đa timeout giây."""
+    lock_path = f"{path}.lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                # Khóa bị bỏ lại (process chết giữa chừng) -> bỏ khóa cũ rồi thử lại
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(lock_path)
+                deadline = time.monotonic() + timeout
+                continue
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+class DetectionCache:
+    def __init__(self, cache_dir, key):
+        self.cache_dir = cache_dir
+        self.key = key
+        base = os.path.join(cache_dir, key)
+        self.dets_path = f"{base}.dets.npy"
+        self.index_path = f"{base}.index.npy"
+        self.meta_path = f"{base}.json"
+        self.hits = 0
+        self.misses = 0
+        self._new = {}
+        self._load()
+
+    def _load(self):
+        self.meta = {}
+        self._dets = np.empty(0, dtype=DETECTION_DTYPE)
+        self._index = np.empty((0, 2), dtype=np.int64)
+        if not os.path.exists(self.meta_path):
+            return
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                self.meta = json.load(f)
+            self._dets = np.load(self.dets_path, mmap_mode="r")
+            self._index = np.load(self.index_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            print(f"Lỗi khi đọc cache detection {self.key}: {e}")
+            self.meta = {}
+
+    def get(self, frame_id):
+        """Detections đã lưu của frame (đếm từ 0), hoặc None nếu chưa có."""
+        dets = self._new.get(frame_id)
+        if dets is not None:
+            dets = dets.copy()
+        elif frame_id < len(self._index):
+            start, count = self._index[frame_id]
+            if count >= 0:
+                dets = np.array(self._dets[start:start + count])  # Copy ra khỏi mmap (chỉ đọc)
+        if dets is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dets
+
+    def has(self, frame_id):
+        if frame_id in self._new:
+            return True
+        return frame_id < len(self._index) and self._index[frame_id, 1] >= 0
+
+    def put(self, frame_id, detections):
+        self._new[frame_id] = np.array(detections, dtype=DETECTION_DTYPE)
+
+    def is_complete(self):
+        """Đã có detection của mọi frame trong video (đủ để chạy lại mà không cần decode)."""
+        total = self.meta.get("frame_count", 0)
+        return total > 0 and self.meta.get("frames_cached", 0) >= total
+
+    def video_props(self):
+        """Thông số video gốc {cv2 prop id: giá trị} đã lưu cùng cache."""
+        return {int(k): v for k, v in self.meta.get("video_props", {}).items()}
+
+    def class_names(self):
+        return {int(k): v for k, v in self.meta.get("names", {}).items()}
+
+    def save(self, video_props=None, names=None, frame_count=None):
+        """
+        Gộp detection mới với phần đã có trên đĩa (có thể do process khác vừa ghi) rồi ghi lại.
+        frame_count: số frame thật của video, khi đã decode tới cuối video (CAP_PROP_FRAME_COUNT
+        chỉ là ước lượng với 1 số định dạng, chỉ dùng khi chưa biết số thật).
+        """
+        if not self._new and (not frame_count or frame_count == self.meta.get("frame_count")):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with _file_lock(self.meta_path):
+            self._load()
+            frames = max(len(self._index), max(self._new, default=-1) + 1)
+            counts = np.full(frames, -1, dtype=np.int64)
+            counts[:len(self._index)] = self._index[:, 1]
+            new_ids = np.fromiter(self._new, dtype=np.int64, count=len(self._new))
+            counts[new_ids] = [len(self._new[i]) for i in new_ids.tolist()]
+
+            index = np.empty((frames, 2), dtype=np.int64)
+            index[:, 1] = counts
+            index[:, 0] = np.concatenate(([0], np.cumsum(np.maximum(counts, 0))[:-1]))
+            dets = np.empty(int(np.maximum(counts, 0).sum()), dtype=DETECTION_DTYPE)
+            for frame_id in range(len(self._index)):
+                start, count = self._index[frame_id]
+                if count > 0 and frame_id not in self._new:
+                    dets[index[frame_id, 0]:index[frame_id, 0] + count] = self._dets[start:start + count]
+            for frame_id, frame_dets in self._new.items():
+                dets[index[frame_id, 0]:index[frame_id, 0] + len(frame_dets)] = frame_dets
+
+            meta = dict(self.meta)
+            if video_props:
+                meta["video_props"] = {str(k): v for k, v in video_props.items()}
+            if frame_count:
+                meta["frame_count"] = int(frame_count)
+                meta.setdefault("video_props", {})[str(cv2.CAP_PROP_FRAME_COUNT)] = float(frame_count)
+            elif video_props and not meta.get("frame_count"):
+                meta["frame_count"] = int(video_props.get(cv2.CAP_PROP_FRAME_COUNT, 0))
+            if names:
+                meta["names"] = {str(k): v for k, v in names.items()}
+            meta["frames_cached"] = int((counts >= 0).sum())
+
+            # Đóng mmap cũ trước khi thay file (Windows không cho đổi tên file đang map)
+            self._dets = self._index = None
+            tmp = f".{uuid.uuid4().hex}.tmp.npy"
+            np.save(self.dets_path + tmp, dets)
+            np.save(self.index_path + tmp, index)
+            os.replace(self.dets_path + tmp, self.dets_path)
+            os.replace(self.index_path + tmp, self.index_path)
+            write_json(self.meta_path, meta)
+            self._new = {}
+            self._load()
+
+    def stats(self):
+        return {"key": self.key, "hits": self.hits, "misses": self.misses,
+                "frames_cached": self.meta.get("frames_cached", 0) + len(self._new)}
+
+
+class FramelessCapture:
+    """
+    Thay cho cv2.VideoCapture khi cache đã đủ mọi frame và không cần vẽ: không decode gì,
+    read() trả về (True, EMPTY_FRAME) đúng số frame của video, get() trả về thông số video đã lưu.
+    """
+
+    def __init__(self, props):
+        self._props = props
+        self._total = int(props.get(cv2.CAP_PROP_FRAME_COUNT, 0))
+        self._pos = 0
+        self._opened = True
+
+    def isOpened(self):
+        return self._opened
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._pos)
+        return self._props.get(prop, 0.0)
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self._pos = int(value)
+        return True
+
+    def grab(self):
+        ok = self._opened and self._pos < self._total
+        self._pos += ok
+        return ok
+
+    def read(self):
+        return (True, EMPTY_FRAME) if self.grab() else (False, None)
+
+    def release(self):
+        self._opened = False
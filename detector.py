@@ -1,41 +1,98 @@
+# detector.py
+import threading
+import time
 
-from ultralytics import YOLO
-import numpy
+import numpy as np
 
 # Các nhãn COCO mà ta quan tâm (car, motorcycle, bus, truck)
 VEHICLE_CLASS_NAMES = {"car", "motorcycle", "bus", "truck"}
 
+# Kết quả detect dạng structured array: mỗi dòng = 1 box
+DETECTION_DTYPE = np.dtype([("xyxy", np.float32, (4,)), ("conf", np.float32), ("cls", np.int32)])
+
+
+def empty_detections():
+    return np.empty(0, dtype=DETECTION_DTYPE)
+
+
 class VehicleDetector:
-    def __init__(self, model_path="yolov8n.pt", device="cpu"):
-        self.model = YOLO(model_path)
-        # ultralytics đặt device trong .predict bằng param device nếu cần.
+    def __init__(self, model_path="yolov8n.pt", device="cpu", imgsz=640, backend=None, threads=None):
+        """
+        backend: "torch", "onnx" hoặc "openvino" (mặc định đoán theo model_path, xem backends.py).
+        threads: số thread intra-op của runtime (None = mặc định của runtime).
+        """
+        # Import backend (và runtime của nó) khi thật sự cần model, không phải lúc import module
+        from backends import create_backend
+        self.model_path = model_path
+        t0 = time.perf_counter()
+        self.backend = create_backend(model_path, backend, device=device, threads=threads)
+        self.weights_path = self.backend.weights_path  # Dùng cho key cache detection (detcache.py)
+        import_s = self.backend.import_s
+        # Model export với input cố định chỉ chạy ở input size đó
+        self.imgsz = self.backend.input_size or imgsz
+        self.startup_times = {"import_s": import_s, "load_s": time.perf_counter() - t0 - import_s, "warmup_s": 0.0}
+
+        # Map class id -> name và danh sách class id xe (tính 1 lần, truyền thẳng vào predict
+        # để NMS không phải xử lý các class khác)
+        self.names = self.backend.names
+        self.class_ids = sorted(cid for cid, name in self.names.items() if name in VEHICLE_CLASS_NAMES)
 
     def detect(self, frame, conf=0.25, iou=0.45):
         """
-        Trả về list các detections: mỗi detection = dict {bbox, conf, cls_name, cls_id, xyxy}
-        bbox ở dạng [x1,y1,x2,y2]
+        Trả về structured array DETECTION_DTYPE: mỗi dòng = (xyxy[4], conf, cls)
+        xyxy ở dạng [x1,y1,x2,y2], cls là class id COCO (tra tên qua self.names)
+        """
+        return self.detect_batch([frame], conf=conf, iou=iou)[0]
+
+    def detect_batch(self, frames, conf=0.25, iou=0.45, imgsz=None):
         """
-        results = self.model.predict(source=frame, conf=conf, iou=iou, verbose=False)
-        r = results[0]
-        detections = []
-
-        if r.boxes is None or len(r.boxes) == 0:
-            return detections
-
-        boxes = r.boxes.xyxy.cpu().numpy()  # [N,4]
-        scores = r.boxes.conf.cpu().numpy()
-        cls_ids = r.boxes.cls.cpu().numpy().astype(int)
-
-        # map class id -> name using model.names
-        names = r.names if hasattr(r, "names") else self.model.names
-
-        for bb, sc, cid in zip(boxes, scores, cls_ids):
-            cls_name = names.get(cid, str(cid)) if isinstance(names, dict) else names[cid]
-            if cls_name in VEHICLE_CLASS_NAMES:
-                detections.append({
-                    "bbox": bb.astype(int).tolist(),
-                    "conf": float(sc),
-                    "cls_id": int(cid),
-                    "cls_name": cls_name
-                })
-        return detections
+        Detect nhiều frame trong 1 lần gọi model (giảm overhead mỗi lần predict).
+        imgsz: input size cho lần gọi này (mặc định self.imgsz), vd. nhỏ hơn khi chỉ detect vùng ROI.
+        Trả về list (theo đúng thứ tự frames), mỗi phần tử là structured array như detect().
+        """
+        if len(frames) == 0:
+            return []
+        return self.backend.predict(frames, conf=conf, iou=iou, imgsz=imgsz or self.imgsz, classes=self.class_ids)
+
+    def warmup(self):
+        """Chạy 1 lần inference giả ở đúng input size để frame thật đầu tiên không phải chịu chi phí khởi tạo."""
+        t0 = time.perf_counter()
+        self.detect(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8))
+        self.startup_times["warmup_s"] = time.perf_counter() - t0
+
+
+class DetectorLoader:
+    """
+    Load VehicleDetector (kèm warm-up) đúng 1 lần, khi cần hoặc trước trên thread nền.
+    GUI / Flask app gọi start() ngay khi khởi động; get() chờ nếu model đang được load.
+    """
+
+    def __init__(self, model_path="yolov8n.pt", imgsz=640, warmup=True, backend=None, threads=None):
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.backend = backend
+        self.threads = threads
+        self.warmup = warmup
+        self._detector = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Load model trên thread nền."""
+        threading.Thread(target=self.get, name="detector-preload", daemon=True).start()
+
+    def get(self):
+        if self._detector is None:
+            with self._lock:
+                if self._detector is None:
+                    detector = VehicleDetector(model_path=self.model_path, imgsz=self.imgsz,
+                                               backend=self.backend, threads=self.threads)
+                    if self.warmup:
+                        detector.warmup()
+                    t = detector.startup_times
+                    print(f"Model {self.model_path} ({detector.backend.name}) sẵn sàng: import {t['import_s']:.2f}s, "
+                          f"load {t['load_s']:.2f}s, warm-up {t['warmup_s']:.2f}s")
+                    self._detector = detector
+        return self._detector
+
+    def is_loaded(self):
+        return self._detector is not None
@@ -0,0 +1,149 @@
+# events.py
+"""
+Phát sự kiện của 1 job tới nhiều client (Server-Sent Events trong app.py), hoàn toàn trong bộ nhớ.
+
+EventBroker.publish() được gọi trên thread xử lý video (on_count của VideoEngine, snapshot
+get_stats() định kỳ) và không bao giờ chờ client: mỗi subscriber có hàng đợi riêng, giới hạn
+max_pending sự kiện.
+    - "stats": chỉ giữ snapshot mới nhất chưa gửi (gộp), client chậm chỉ bỏ lỡ snapshot cũ.
+    - "count": không được gộp; hàng đợi đầy thì subscriber bị ngắt (nhận sự kiện "overflow"
+      rồi đóng), client kết nối lại để nhận tiếp từ snapshot hiện tại.
+    - "end": job kết thúc (done / failed / cancelled), là sự kiện cuối cùng của mọi subscriber.
+Subscriber mới nhận ngay snapshot "stats" gần nhất (nếu có); job đã kết thúc thì nhận luôn "end".
+"""
+import itertools
+import json
+import threading
+from collections import deque
+
+
+class Subscription:
+    def __init__(self, broker, max_pending):
+        self._broker = broker
+        self.max_pending = max_pending
+        self._events = deque()
+        self._cond = threading.Condition()
+        self.closed = False
+        self.dropped_stats = 0  # Số snapshot bị gộp (client không đọc kịp)
+
+    def offer(self, event_id, event, data):
+        """Thêm 1 sự kiện, không chờ; trả về False nếu subscriber đã bị đóng."""
+        with self._cond:
+            if self.closed:
+                return False
+            if event == "stats":
+                # Gộp: bỏ snapshot cũ chưa gửi, giữ vị trí cuối hàng
+                for i, item in enumerate(self._events):
+                    if item[1] == "stats":
+                        del self._events[i]
+                        self.dropped_stats += 1
+                        break
+            elif event == "count" and len(self._events) >= self.max_pending:
+                self._events.clear()
+                self._events.append((event_id, "overflow", {"max_pending": self.max_pending}))
+                self.closed = True
+                self._cond.notify_all()
+                return False
+            self._events.append((event_id, event, data))
+            if event == "end":
+                self.closed = True
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Chờ sự kiện tiếp theo: (id, event, data); None nếu hết timeout (để gửi keepalive) hoặc
+        subscriber đã đóng và không còn gì để đọc.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._events or self.closed, timeout=timeout)
+            if self._events:
+                return self._events.popleft()
+            return None
+
+    @property
+    def finished(self):
+        """Đã đóng và đã đọc hết sự kiện."""
+        with self._cond:
+            return self.closed and not self._events
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._broker._remove(self)
+
+
+class EventBroker:
+    """
+    max_pending: số sự kiện tối đa chờ gửi của mỗi subscriber.
+    max_subscribers: số client tối đa cùng nghe 1 job (subscribe() trả về None khi đủ).
+    """
+
+    def __init__(self, max_pending=256, max_subscribers=64):
+        self.max_pending = max_pending
+        self.max_subscribers = max_subscribers
+        self._subs = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._last_stats = None
+        self._end = None
+        self.published = 0
+        self.disconnected = 0
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subs) >= self.max_subscribers:
+                return None
+            sub = Subscription(self, self.max_pending)
+            if self._last_stats is not None:
+                sub.offer(*self._last_stats)
+            if self._end is not None:
+                sub.offer(*self._end)
+            else:
+                self._subs.append(sub)
+        return sub
+
+    def publish(self, event, data):
+        """Gửi 1 sự kiện tới mọi subscriber (gọi từ thread xử lý, không chờ client)."""
+        with self._lock:
+            if self._end is not None:
+                return
+            item = (next(self._ids), event, data)
+            if event == "stats":
+                self._last_stats = item
+            elif event == "end":
+                self._end = item
+            self.published += 1
+            subs = list(self._subs)
+        overflowed = [sub for sub in subs if not sub.offer(*item)]
+        with self._lock:
+            if event == "end":
+                self._subs = []  # Mọi subscriber đã nhận "end" và tự đóng
+            elif overflowed:
+                self.disconnected += len(overflowed)
+                self._subs = [sub for sub in self._subs if sub not in overflowed]
+
+    def publish_count(self, event):
+        """Dùng làm on_count của VideoEngine."""
+        self.publish("count", event)
+
+    def close(self, data=None):
+        """Job kết thúc: gửi "end" cho mọi subscriber, subscriber mới nhận "end" ngay."""
+        self.publish("end", data or {})
+
+    def _remove(self, sub):
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subs), "published": self.published,
+                    "disconnected": self.disconnected}
+
+
+def format_sse(event_id, event, data):
+    """1 sự kiện theo định dạng text/event-stream."""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n"
@@ -1,14 +1,202 @@
 import sys
 import os
+import threading
+import time
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton, QVBoxLayout,
-    QFileDialog, QHBoxLayout, QMessageBox, QGroupBox, QFormLayout
+    QFileDialog, QHBoxLayout, QMessageBox, QGroupBox, QFormLayout, QCheckBox
 )
-from PyQt6.QtGui import QImage, QPixmap
-from PyQt6.QtCore import Qt, QTimer, QPoint, QRect
+from PyQt6.QtGui import QImage, QPixmap, QPainter, QColor, QPen
+from PyQt6.QtCore import Qt, QTimer, QPoint, QRect, QThread, pyqtSignal
 
-# Import ClickableLabel và Engine xử lý từ file logic
-from video_engine import ClickableVideoLabel, VideoEngine
+# Import Engine xử lý từ file logic (không phụ thuộc PyQt)
+from video_engine import VideoEngine
+
+
+# ============================================================
+# Label hỗ trợ chọn ROI bằng chuột
+# (Chuyển lại từ video_engine.py để engine không phụ thuộc PyQt)
+# ============================================================
+class ClickableVideoLabel(QLabel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMouseTracking(True)
+        self._drawing = False
+        self._start_pos = QPoint()
+        self._current_rect = QRect()
+        self._frame_size = None
+        self._roi_callback = None
+        self._has_roi = False
+        self._roi_rect_frame = None
+
+    def set_frame_size(self, frame_w, frame_h):
+        self._frame_size = (frame_w, frame_h)
+
+    def set_roi_callback(self, cb):
+        self._roi_callback = cb
+
+    def clear_roi(self):
+        self._has_roi = False
+        self._roi_rect_frame = None
+        self.update()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton and self.pixmap():
+            self._drawing = True
+            self._start_pos = event.pos()
+            self._current_rect = QRect(self._start_pos, self._start_pos)
+            self.update()
+
+    def mouseMoveEvent(self, event):
+        if self._drawing:
+            self._current_rect = QRect(self._start_pos, event.pos()).normalized()
+            self.update()
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton and self._drawing:
+            self._drawing = False
+            self._current_rect = QRect(self._start_pos, event.pos()).normalized()
+            roi_frame = self.map_rect_to_frame(self._current_rect)
+            if roi_frame:
+                self._has_roi = True
+                self._roi_rect_frame = roi_frame
+                if self._roi_callback:
+                    self.setToolTip(f"ROI: {roi_frame}")
+                    self._roi_callback(roi_frame)
+            self.update()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        painter = QPainter(self)
+        # Vẽ ROI đang vẽ (màu xanh lá)
+        if self._drawing:
+            painter.setPen(QPen(QColor(0, 255, 0), 2, Qt.PenStyle.SolidLine))
+            painter.drawRect(self._current_rect)
+
+        # Vẽ ROI đã chốt (màu cam)
+        if self._has_roi and self._roi_rect_frame:
+            disp_rect = self.map_frame_rect_to_display(self._roi_rect_frame)
+            painter.setPen(QPen(QColor(255, 165, 0), 2, Qt.PenStyle.DashLine))
+            painter.drawRect(disp_rect)
+
+    def map_rect_to_frame(self, disp_rect: QRect):
+        pix = self.pixmap()
+        if not self._frame_size or not pix or pix.isNull() or pix.width() == 0 or pix.height() == 0:
+            return None
+        lbl_w, lbl_h = self.width(), self.height()
+        disp_w, disp_h = pix.width(), pix.height()
+        scale = min(lbl_w / disp_w, lbl_h / disp_h)
+        if scale == 0: return None
+        new_w, new_h = disp_w * scale, disp_h * scale
+        off_x, off_y = (lbl_w - new_w) / 2, (lbl_h - new_h) / 2
+        x1, y1 = max(0, disp_rect.left() - off_x), max(0, disp_rect.top() - off_y)
+        x2, y2 = disp_rect.right() - off_x, disp_rect.bottom() - off_y
+        frame_w, frame_h = self._frame_size
+        fx1 = int(x1 * frame_w / new_w)
+        fy1 = int(y1 * frame_h / new_w)
+        fx2 = int(x2 * frame_w / new_w)
+        fy2 = int(y2 * frame_h / new_w)
+        return (max(0, fx1), max(0, fy1), min(frame_w, fx2), min(frame_h, fy2))
+
+    def map_frame_rect_to_display(self, rect):
+        pix = self.pixmap()
+        if not rect or not self._frame_size or not pix or pix.isNull() or pix.width() == 0 or pix.height() == 0:
+            return QRect()
+        x1, y1, x2, y2 = rect
+        frame_w, frame_h = self._frame_size
+        lbl_w, lbl_h = self.width(), self.height()
+        disp_w, disp_h = pix.width(), pix.height()
+        scale = min(lbl_w / disp_w, lbl_h / disp_h)
+        if scale == 0: return QRect()
+        new_w, new_h = disp_w * scale, disp_h * scale
+        off_x, off_y = (lbl_w - new_w) / 2, (lbl_h - new_h) / 2
+        dx1 = int(x1 * new_w / frame_w + off_x)
+        dy1 = int(y1 * new_h / frame_h + off_y)
+        dx2 = int(x2 * new_w / frame_w + off_x)
+        dy2 = int(y2 * new_h / frame_h + off_y)
+        return QRect(dx1, dy1, dx2 - dx1, dy2 - dy1)
+
+
+# ============================================================
+# Thread xử lý: chạy engine ngoài UI thread
+# ============================================================
+class EngineWorker(QThread):
+    """
+    Gọi engine.process_next_frame() liên tục trên thread riêng.
+    Chỉ giữ kết quả mới nhất: frame_ready chỉ được phát khi GUI đã lấy kết quả trước đó
+    (take_latest), frame đến trong lúc GUI còn bận vẽ sẽ thay thế frame cũ (drop-to-latest).
+    fast=True: xử lý nhanh nhất có thể; False: giữ nhịp theo FPS của video.
+    """
+    frame_ready = pyqtSignal()
+    video_finished = pyqtSignal()
+    error = pyqtSignal(str)
+
+    def __init__(self, engine, fast=False, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.fast = fast
+        self.frames = 0
+        self.dropped = 0
+        self._latest = None
+        self._waiting_gui = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+
+    def run(self):
+        interval = 1.0 / (self.engine.source_fps or 30.0)
+        next_time = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                if not self._resume.is_set():
+                    self._resume.wait(0.1)
+                    next_time = time.perf_counter()
+                    continue
+
+                ret, frame, stats = self.engine.process_next_frame()
+                if not ret:
+                    break
+                self.frames += 1
+                with self._lock:
+                    if self._latest is not None:
+                        self.dropped += 1
+                    self._latest = (frame, stats)
+                    notify = not self._waiting_gui
+                    self._waiting_gui = True
+                if notify:
+                    self.frame_ready.emit()
+
+                # Nguồn live tự có nhịp (read chờ frame mới), không cần giữ nhịp thêm
+                if not self.fast and not self.engine.is_live:
+                    next_time += interval
+                    delay = next_time - time.perf_counter()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                    else:
+                        next_time = time.perf_counter()
+        except Exception as e:
+            self.error.emit(str(e))
+        if not self._stop.is_set():
+            self.video_finished.emit()
+
+    def take_latest(self):
+        """Lấy (frame, stats) mới nhất (gọi từ GUI thread), hoặc None."""
+        with self._lock:
+            latest, self._latest = self._latest, None
+            self._waiting_gui = False
+        return latest
+
+    def set_paused(self, paused):
+        if paused:
+            self._resume.clear()
+        else:
+            self._resume.set()
+
+    def stop(self):
+        self._stop.set()
+        self._resume.set()
+        self.wait()
 
 
 # ============================================================
@@ -21,8 +209,10 @@ class VehicleCounterGUI(QWidget):
         self.setGeometry(100, 60, 1280, 720)
 
         # Khởi tạo Engine xử lý
-        # Engine sẽ lo toàn bộ logic nặng
-        self.engine = VideoEngine()
+        # Engine sẽ lo toàn bộ logic nặng; model được load nền ngay khi cửa sổ chạy
+        # Frame giữ nguyên BGR, đưa thẳng vào QImage (Format_BGR888), không cần cvtColor
+        self.engine = VideoEngine(rgb=False)
+        QTimer.singleShot(0, self.engine.preload)
 
         # 1. CỘT TRÁI (VIDEO)
         self.video_label = ClickableVideoLabel(self)
@@ -48,12 +238,15 @@ class VehicleCounterGUI(QWidget):
         self.btn_pause.clicked.connect(self.toggle_pause)
         self.btn_clear_roi = QPushButton("🧽 Xóa ROI")
         self.btn_clear_roi.clicked.connect(self.clear_roi)
+        self.chk_fast = QCheckBox("⚡ Xử lý nhanh nhất có thể")
+        self.chk_fast.toggled.connect(self.set_fast_mode)
         self.btn_exit = QPushButton("❌ Thoát")
         self.btn_exit.clicked.connect(self.close)
         control_layout.addWidget(self.btn_open)
         control_layout.addWidget(self.btn_start)
         control_layout.addWidget(self.btn_pause)
         control_layout.addWidget(self.btn_clear_roi)
+        control_layout.addWidget(self.chk_fast)
         control_layout.addWidget(self.btn_exit)
         control_group.setLayout(control_layout)
 
@@ -76,6 +269,8 @@ class VehicleCounterGUI(QWidget):
         results_layout.addRow("Truck:", self.truck_label)
         results_layout.addRow("Bus:", self.bus_label)
         results_layout.addRow("Motorcycle:", self.motorcycle_label)
+        self.fps_label = QLabel("-")
+        results_layout.addRow("FPS xử lý:", self.fps_label)
         results_group.setLayout(results_layout)
 
         right_layout.addWidget(control_group)
@@ -90,10 +285,10 @@ class VehicleCounterGUI(QWidget):
         self.setLayout(main_layout)
 
         # Biến trạng thái của GUI
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_frame)
+        self.worker = None
         self.video_path = None
         self.paused = False
+        self._started_at = 0.0
 
     def open_file(self):
         """Mở dialog chọn file video."""
@@ -126,27 +321,36 @@ class VehicleCounterGUI(QWidget):
         self.bus_label.setText("0")
         self.motorcycle_label.setText("0")
 
-        # Khởi động timer để cập nhật frame
+        # Khởi động thread xử lý, kết quả về qua signal
         self.paused = False
-        self.timer.start(30)  # 30ms ~ 33 FPS
+        self.worker = EngineWorker(self.engine, fast=self.chk_fast.isChecked(), parent=self)
+        self.worker.frame_ready.connect(self.update_frame)
+        self.worker.video_finished.connect(self.end_video)
+        self.worker.error.connect(lambda msg: print(f"Lỗi khi xử lý video: {msg}"))
+        self._started_at = time.perf_counter()
+        self.worker.start()
         self.btn_start.setEnabled(False)
         self.btn_pause.setEnabled(True)
         self.btn_pause.setText("⏸️ Pause")
 
     def toggle_pause(self):
-        """Tạm dừng hoặc tiếp tục timer."""
-        if not self.engine.is_running():
+        """Tạm dừng hoặc tiếp tục thread xử lý."""
+        if not self.worker or not self.engine.is_running():
             return
 
         self.paused = not self.paused  # Đảo trạng thái
+        self.worker.set_paused(self.paused)
 
         if self.paused:
-            self.timer.stop()
             self.btn_pause.setText("▶️ Resume")
         else:
-            self.timer.start(30)
             self.btn_pause.setText("⏸️ Pause")
 
+    def set_fast_mode(self, fast):
+        """Bật: xử lý nhanh nhất có thể; tắt: chạy theo FPS của video."""
+        if self.worker:
+            self.worker.fast = fast
+
     def clear_roi(self):
         """Xóa vùng ROI đã chọn."""
         self.engine.set_roi(None)  # Báo cho Engine
@@ -159,15 +363,14 @@ class VehicleCounterGUI(QWidget):
         QMessageBox.information(self, "ROI", f"Đã chọn ROI: {roi_rect}")
 
     def update_frame(self):
-        """Hàm chính, được gọi liên tục bởi QTimer."""
-        # 1. Yêu cầu Engine xử lý frame tiếp theo
-        # Engine trả về: (True/False, ảnh đã vẽ, dict số liệu)
-        ret, frame, stats = self.engine.process_next_frame()
-
-        # 2. Nếu hết video (ret=False)
-        if not ret:
-            self.end_video()
+        """Slot nhận signal frame_ready từ EngineWorker: chỉ vẽ kết quả mới nhất."""
+        # 1. Lấy kết quả mới nhất (frame đã vẽ, dict số liệu); frame cũ hơn đã bị bỏ qua
+        latest = self.worker.take_latest() if self.worker else None
+
+        # 2. Không có kết quả mới (đã được lấy ở lần gọi trước)
+        if latest is None:
             return
+        frame, stats = latest
 
         # 3. Cập nhật bảng kết quả
         self.total_label.setText(str(stats.get("total", 0)))
@@ -175,16 +378,19 @@ class VehicleCounterGUI(QWidget):
         self.truck_label.setText(str(stats.get("truck", 0)))
         self.bus_label.setText(str(stats.get("bus", 0)))
         self.motorcycle_label.setText(str(stats.get("motorcycle", 0)))
+        elapsed = time.perf_counter() - self._started_at
+        if elapsed > 0:
+            self.fps_label.setText(f"{self.worker.frames / elapsed:.1f}")
 
-        # 4. Hiển thị frame lên GUI
+        # 4. Hiển thị frame lên GUI: QImage dùng trực tiếp buffer BGR của frame (không đổi màu, không copy)
         h, w, ch = frame.shape
-        img = QImage(frame.data, w, h, ch * w, QImage.Format.Format_RGB888)
+        img = QImage(frame.data, w, h, frame.strides[0], QImage.Format.Format_BGR888)
         self.video_label.setPixmap(QPixmap.fromImage(img).scaled(
             self.video_label.width(), self.video_label.height(), Qt.AspectRatioMode.KeepAspectRatio))
 
     def end_video(self):
-        """Dừng timer và yêu cầu Engine lưu kết quả."""
-        self.timer.stop()
+        """Dừng thread xử lý và yêu cầu Engine lưu kết quả."""
+        self._stop_worker()
 
         # Yêu cầu Engine dừng và lưu kết quả
         summary_path = self.engine.stop()
@@ -199,8 +405,14 @@ class VehicleCounterGUI(QWidget):
         self.btn_pause.setEnabled(False)
         self.video_label.setText("Hoàn thành! Vui lòng chọn video mới.")
 
+    def _stop_worker(self):
+        if self.worker:
+            self.worker.stop()
+            self.worker = None
+
     def closeEvent(self, event):
         """Đảm bảo Engine dừng khi đóng cửa sổ."""
+        self._stop_worker()  # Dừng thread trước khi engine đóng video
         self.engine.stop()  # Đảm bảo engine đã dừng
         event.accept()
 
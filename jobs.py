@@ -0,0 +1,188 @@
+# jobs.py
+"""
+Hàng đợi xử lý video chạy nền cho Flask app: mỗi worker là 1 thread giữ sẵn 1 VehicleDetector
+đã load, upload trả về job id ngay, trạng thái / tiến độ / hủy job qua JobManager.
+"""
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from detector import DetectorLoader
+from events import EventBroker
+from metrics import Metrics
+from video_io import process_video
+
+
+class JobQueueFull(Exception):
+    """Đã đủ số job đang chờ, job mới bị từ chối."""
+
+
+class Job:
+    def __init__(self, in_path, output_path, csv_path):
+        self.id = uuid.uuid4().hex[:12]
+        self.in_path = in_path
+        self.output_path = output_path
+        self.csv_path = csv_path
+        self.status = "queued"  # queued -> running -> done / failed / cancelled
+        self.frames = 0
+        self.total_frames = 0
+        self.fps = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.metrics = None
+        self.events = EventBroker()  # Sự kiện đếm / stats trực tiếp cho client SSE
+
+    def is_finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "frames": self.frames,
+            "total_frames": self.total_frames,
+            "fps": round(self.fps, 2),
+            "counts": self.result["counts"] if self.result else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Pool cố định `workers` thread xử lý video. Mỗi worker load detector riêng 1 lần lúc khởi động
+    (model ultralytics không dùng chung an toàn giữa các thread).
+    Admission control: tối đa `max_queued` job chờ, vượt quá thì submit() ném JobQueueFull.
+    Chỉ giữ thông tin của `max_history` job đã xong gần nhất.
+    metrics: đo thời gian từng stage cho mỗi job; số liệu của job đã xong được cộng dồn vào self.metrics.
+    backend / threads: backend inference và số thread của mỗi detector (xem backends.py).
+    stats_interval: chu kỳ (giây) đẩy snapshot get_stats() vào job.events (xem events.py).
+    """
+
+    def __init__(self, workers=2, max_queued=8, model_path="yolov8n.pt", max_history=200, metrics=False,
+                 backend=None, threads=None, stats_interval=1.0, **engine_kwargs):
+        self.max_queued = max_queued
+        self.stats_interval = stats_interval
+        self.metrics = Metrics() if metrics else None
+        self.max_history = max_history
+        self.engine_kwargs = engine_kwargs
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers = []
+        self.worker_errors = {}  # Tên worker -> lỗi load model (worker đó đánh dấu failed mọi job nó nhận)
+        for i in range(workers):
+            loader = DetectorLoader(model_path=model_path, backend=backend, threads=threads)
+            t = threading.Thread(target=self._worker_loop, args=(loader,), name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    def submit(self, in_path, output_path, csv_path):
+        job = Job(in_path, output_path, csv_path)
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j.status == "queued")
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"Đang có {queued} job chờ xử lý, vui lòng thử lại sau")
+            self._jobs[job.id] = job
+            self._prune()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """Hủy job: job đang chờ sẽ bị bỏ qua, job đang chạy dừng ở frame tiếp theo."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        with self._lock:
+            cancelled_in_queue = job.status == "queued"
+            if cancelled_in_queue:
+                job.status = "cancelled"
+                job.finished_at = time.time()
+        if cancelled_in_queue:
+            job.events.close(job.to_dict())
+        return job
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        by_status = {}
+        for j in jobs:
+            by_status[j.status] = by_status.get(j.status, 0) + 1
+        return {"workers": len(self._workers), "max_queued": self.max_queued, "jobs": by_status,
+                "worker_errors": dict(self.worker_errors)}
+
+    def metrics_snapshot(self):
+        """Metrics cộng dồn của các job đã xong + metrics hiện tại của các job đang chạy."""
+        if self.metrics is None:
+            return {"enabled": False}
+        running = {j.id: j.metrics.snapshot() for j in self.list() if j.status == "running" and j.metrics}
+        return {"enabled": True, "completed": self.metrics.snapshot(), "running": running}
+
+    def _prune(self):
+        finished = [jid for jid, j in self._jobs.items() if j.is_finished()]
+        for jid in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[jid]
+
+    def _worker_loop(self, loader):
+        load_error = None
+        try:
+            detector = loader.get()  # Load + warm-up ngay khi worker khởi động
+        except Exception as e:
+            # Không để thread chết: job vẫn được lấy khỏi hàng đợi và báo lỗi, thay vì nằm "queued" mãi
+            load_error = f"Không load được model {loader.model_path}: {e}"
+            print(f"Lỗi khi khởi động {threading.current_thread().name}: {load_error}")
+            self.worker_errors[threading.current_thread().name] = load_error
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if job.status != "queued":  # Đã bị hủy khi còn trong hàng đợi
+                    continue
+                job.status = "running"
+                job.started_at = time.time()
+                if self.metrics is not None:
+                    job.metrics = Metrics()
+            if load_error is not None:
+                job.error = load_error
+                job.status = "failed"
+                job.finished_at = time.time()
+                job.events.close(job.to_dict())
+                continue
+            try:
+                def on_progress(frames, total, fps):
+                    job.frames, job.total_frames, job.fps = frames, total, fps
+
+                def on_stats(stats):
+                    job.events.publish("stats", {"job": job.to_dict(), "stats": stats})
+
+                job.result = process_video(job.in_path, output_path=job.output_path, csv_path=job.csv_path,
+                                           display=False, detector=detector, progress_cb=on_progress,
+                                           stop_event=job.cancel_event, metrics=job.metrics or False,
+                                           on_count=job.events.publish_count, stats_cb=on_stats,
+                                           stats_interval=self.stats_interval, **self.engine_kwargs)
+                job.frames, job.fps = job.result["frames"], job.result["fps"]
+                job.status = "cancelled" if job.cancel_event.is_set() else "done"
+            except Exception as e:
+                print(f"Lỗi khi xử lý job {job.id}: {e}")
+                job.error = str(e)
+                job.status = "failed"
+            if job.metrics is not None:
+                self.metrics.merge(job.metrics)
+            job.finished_at = time.time()
+            job.events.close(job.to_dict())
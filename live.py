@@ -0,0 +1,182 @@
+# live.py
+"""
+Nguồn live (RTSP / HTTP / UDP / named pipe / webcam) cho VideoEngine.
+
+LiveCapture thay cho cv2.VideoCapture: 1 thread nền đọc frame liên tục từ nguồn và chỉ giữ
+`buffer` frame mới nhất, frame cũ hơn bị bỏ (đếm vào dropped). read() trả về frame mới nhất chưa
+xử lý, nên khi detect chậm hơn camera, độ trễ không tăng dần mà chỉ bằng khoảng 1 lần xử lý.
+Mất kết nối (mở không được / đọc lỗi) thì tự kết nối lại sau backoff tăng dần
+(backoff_min -> backoff_max giây, nhân 2 mỗi lần), về lại backoff_min khi đọc được frame.
+
+Độ trễ end-to-end: mỗi frame được ghi lại thời điểm grab; engine gọi frame_processed() khi
+xong track + đếm frame đó (đúng thứ tự read), độ trễ = lúc xong - lúc grab.
+"""
+import os
+import re
+import stat
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from metrics import Histogram, TIME_BUCKETS_MS
+
+LIVE_SCHEMES = ("rtsp://", "rtsps://", "rtmp://", "http://", "https://", "udp://", "tcp://", "srt://")
+
+
+def is_live_source(source):
+    """Nguồn live: số (webcam), URL stream hoặc named pipe."""
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        return True
+    if source.lower().startswith(LIVE_SCHEMES):
+        return True
+    try:
+        return stat.S_ISFIFO(os.stat(source).st_mode)
+    except OSError:
+        return False
+
+
+def source_name(source):
+    """Tên dùng cho file output: URL / số webcam -> chuỗi chỉ gồm ký tự an toàn."""
+    if isinstance(source, str) and not is_live_source(source):
+        return os.path.splitext(os.path.basename(source))[0]
+    name = re.sub(r"^[a-z]+://", "", str(source).lower())
+    return re.sub(r"[^0-9a-z]+", "_", name).strip("_") or "live"
+
+
+class LiveCapture:
+    """
+    buffer: số frame mới nhất được giữ (1 = luôn xử lý frame mới nhất).
+    max_retries: số lần kết nối lại liên tiếp tối đa (None = mãi mãi); hết lượt thì read() trả về False.
+    open_timeout: thời gian chờ frame đầu tiên khi khởi tạo (để có kích thước / FPS của nguồn).
+    """
+
+    def __init__(self, source, buffer=1, backoff_min=0.5, backoff_max=10.0, max_retries=None, open_timeout=10.0):
+        self.source = int(source) if isinstance(source, str) and source.isdigit() else source
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.max_retries = max_retries
+        self._frames = deque(maxlen=max(1, int(buffer)))
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._ended = False
+        self._props = {}
+        self._in_flight = deque()  # Thời điểm grab của các frame đã trả về, chưa xử lý xong
+        self.latency = Histogram(TIME_BUCKETS_MS)
+        self.grabbed = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.connected = False
+        self.last_error = None
+
+        self._thread = threading.Thread(target=self._grab_loop, name="live-grabber", daemon=True)
+        self._thread.start()
+        with self._cond:
+            self._cond.wait_for(lambda: self._frames or self._ended, timeout=open_timeout)
+
+    # --- Giao diện giống cv2.VideoCapture ---
+    def isOpened(self):
+        # Đã nhận được ít nhất 1 frame (có kích thước nguồn) và chưa release
+        return not self._stop.is_set() and bool(self._props)
+
+    def get(self, prop):
+        return self._props.get(prop, 0.0)
+
+    def set(self, prop, value):
+        return False  # Nguồn live không tua được
+
+    def read(self):
+        """Chờ và lấy frame cũ nhất còn giữ (buffer=1: frame mới nhất); (False, None) khi nguồn kết thúc."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frames or self._ended or self._stop.is_set())
+            if not self._frames:
+                return False, None
+            grabbed_at, frame = self._frames.popleft()
+            self._in_flight.append(grabbed_at)
+            self.delivered += 1
+        return True, frame
+
+    def release(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._thread.join(timeout=2.0)
+
+    # --- Độ trễ / thống kê ---
+    def frame_processed(self):
+        """Engine gọi khi xong 1 frame (theo thứ tự read); trả về độ trễ end-to-end (giây)."""
+        with self._cond:
+            if not self._in_flight:
+                return 0.0
+            grabbed_at = self._in_flight.popleft()
+        latency = time.perf_counter() - grabbed_at
+        self.latency.observe(latency * 1000)
+        return latency
+
+    def get_stats(self):
+        return {
+            "connected": self.connected,
+            "grabbed": self.grabbed,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "drop_rate": self.dropped / self.grabbed if self.grabbed else 0.0,
+            "reconnects": self.reconnects,
+            "latency_ms": self.latency.to_dict(),
+            "last_error": self.last_error,
+        }
+
+    # --- Thread grab ---
+    def _grab_loop(self):
+        backoff = self.backoff_min
+        failures = 0
+        while not self._stop.is_set():
+            cap = cv2.VideoCapture(self.source)
+            ok = cap.isOpened()
+            first = True
+            while ok and not self._stop.is_set():
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                if first:
+                    self._update_props(cap, frame)
+                    first = False
+                    backoff, failures = self.backoff_min, 0
+                self._push(frame)
+            cap.release()
+            self.connected = False
+            if self._stop.is_set():
+                break
+
+            failures += 1
+            self.last_error = "không mở được nguồn" if self.grabbed == 0 else "mất kết nối"
+            if self.max_retries is not None and failures > self.max_retries:
+                break
+            print(f"Lỗi khi đọc nguồn live {self.source}: {self.last_error}, kết nối lại sau {backoff:.1f}s")
+            self._stop.wait(backoff)
+            backoff = min(self.backoff_max, backoff * 2)
+            self.reconnects += 1
+        with self._cond:
+            self._ended = True
+            self._cond.notify_all()
+
+    def _update_props(self, cap, frame):
+        """Thông số nguồn lấy khi có frame đầu tiên (1 số stream chưa báo kích thước trước đó)."""
+        self.connected = True
+        props = {
+            cv2.CAP_PROP_FRAME_WIDTH: float(frame.shape[1]),
+            cv2.CAP_PROP_FRAME_HEIGHT: float(frame.shape[0]),
+            cv2.CAP_PROP_FPS: cap.get(cv2.CAP_PROP_FPS),
+            cv2.CAP_PROP_FRAME_COUNT: 0.0,  # Nguồn live không có số frame
+        }
+        with self._cond:
+            self._props = props
+
+    def _push(self, frame):
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1  # deque đầy: append bỏ frame cũ nhất
+            self._frames.append((time.perf_counter(), frame))
+            self.grabbed += 1
+            self._cond.notify_all()
@@ -0,0 +1,128 @@
+# metrics.py
+"""
+Đo thời gian từng stage của VideoEngine (decode, motion gate, detect, track, đếm, vẽ, đổi màu),
+số detection / track mỗi frame và độ sâu các queue, dưới dạng histogram có bucket cố định.
+
+Engine chỉ tạo Metrics khi bật (metrics=True); khi tắt mỗi điểm đo chỉ còn 1 phép kiểm tra None.
+Mỗi histogram chỉ được ghi bởi 1 thread (mỗi stage chạy trên 1 thread), nên observe() không khóa;
+lock chỉ dùng khi tạo histogram mới, merge() và snapshot().
+"""
+import threading
+import time
+from bisect import bisect_left
+
+# Cận trên các bucket thời gian (ms) và bucket số lượng (detection, track, phần tử trong queue)
+TIME_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, float("inf"))
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * len(bounds)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value, n=1):
+        """Ghi n lần cùng 1 giá trị (vd. thời gian mỗi frame của 1 batch n frame)."""
+        self.buckets[bisect_left(self.bounds, value)] += n
+        self.count += n
+        self.total += value * n
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Giá trị xấp xỉ (cận trên bucket) của phân vị q."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.buckets):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+            "buckets": {("+Inf" if b == float("inf") else str(b)): n for b, n in zip(self.bounds, self.buckets)},
+        }
+
+
+class Metrics:
+    """
+    Gom các histogram theo tên:
+        timings: thời gian mỗi stage (ms)
+        counts: số detection / track mỗi frame
+        queues: độ sâu các queue (lấy mẫu mỗi frame)
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counts = {}
+        self.queues = {}
+        self.frames = 0
+        self.started_at = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _hist(self, group, name, bounds):
+        hist = group.get(name)
+        if hist is None:
+            with self._lock:
+                hist = group.setdefault(name, Histogram(bounds))
+        return hist
+
+    def observe(self, stage, seconds, n=1):
+        """Ghi thời gian (giây) của 1 lần chạy stage; n: số frame cùng chịu thời gian đó (batch)."""
+        self._hist(self.timings, stage, TIME_BUCKETS_MS).observe(seconds * 1000, n)
+
+    def since(self, stage, t0):
+        """Ghi thời gian từ t0 (time.perf_counter()) tới bây giờ; trả về thời điểm hiện tại."""
+        now = time.perf_counter()
+        self._hist(self.timings, stage, TIME_BUCKETS_MS).observe((now - t0) * 1000)
+        return now
+
+    def count(self, name, value):
+        self._hist(self.counts, name, COUNT_BUCKETS).observe(value)
+
+    def queue_depths(self, depths):
+        for name, depth in depths.items():
+            self._hist(self.queues, name, COUNT_BUCKETS).observe(depth)
+
+    def frame_done(self):
+        self.frames += 1
+
+    def merge(self, other):
+        """Cộng dồn số liệu của 1 Metrics khác (vd. job đã xong) vào đây."""
+        with self._lock:
+            self.frames += other.frames
+            for mine, theirs, bounds in ((self.timings, other.timings, TIME_BUCKETS_MS),
+                                         (self.counts, other.counts, COUNT_BUCKETS),
+                                         (self.queues, other.queues, COUNT_BUCKETS)):
+                for name, hist in list(theirs.items()):
+                    mine.setdefault(name, Histogram(bounds)).merge(hist)
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self.started_at
+            return {
+                "frames": self.frames,
+                "elapsed_s": elapsed,
+                "timings_ms": {k: h.to_dict() for k, h in self.timings.items()},
+                "counts": {k: h.to_dict() for k, h in self.counts.items()},
+                "queues": {k: h.to_dict() for k, h in self.queues.items()},
+            }
@@ -0,0 +1,96 @@
+# motion.py
+import time
+
+import cv2
+
+
+class MotionGate:
+    """
+    Cổng chuyển động rẻ tiền đặt trước VehicleDetector: so sánh frame đã thu nhỏ (grayscale)
+    với frame trước, chỉ trong vùng quan tâm (ROI hoặc dải quanh vạch đếm).
+    Không có chuyển động đáng kể -> bỏ qua detect ở frame đó.
+
+    scale: tỉ lệ thu nhỏ frame trước khi so sánh
+    method: "diff" (trừ frame liên tiếp) hoặc "mog2" (cv2 background subtraction)
+    threshold: ngưỡng chênh lệch mức xám (0-255) để 1 pixel được coi là thay đổi (chế độ diff)
+    min_area: tỉ lệ pixel thay đổi tối thiểu trong vùng để coi là có chuyển động
+    max_skip: bỏ qua tối đa bao nhiêu frame liên tiếp, sau đó bắt buộc detect 1 lần
+    Tăng threshold / min_area / max_skip -> bỏ qua nhiều frame hơn.
+    """
+
+    def __init__(self, scale=0.25, method="diff", threshold=25, min_area=0.002, max_skip=25, blur=5):
+        self.scale = scale
+        self.method = method
+        self.threshold = threshold
+        self.min_area = min_area
+        self.max_skip = max_skip
+        self.blur = blur
+        self.region = None
+        self._prev = None
+        self._bg = None
+        self._skipped_in_row = 0
+        # Thống kê
+        self.checked = 0
+        self.skipped = 0
+        self.total_time = 0.0
+
+    def set_region(self, region):
+        """Vùng xét chuyển động (x1, y1, x2, y2) theo tọa độ frame gốc; None = cả frame."""
+        if region != self.region:
+            self.region = region
+            self._prev = None
+            self._bg = None
+
+    def reset(self):
+        self._prev = None
+        self._bg = None
+        self._skipped_in_row = 0
+        self.checked = 0
+        self.skipped = 0
+        self.total_time = 0.0
+
+    def should_detect(self, frame):
+        """True nếu frame cần chạy detect (có chuyển động, hoặc đã bỏ qua quá max_skip frame)."""
+        t0 = time.perf_counter()
+        moving = self._has_motion(frame)
+        self.total_time += time.perf_counter() - t0
+        self.checked += 1
+
+        if moving or self._skipped_in_row >= self.max_skip:
+            self._skipped_in_row = 0
+            return True
+        self._skipped_in_row += 1
+        self.skipped += 1
+        return False
+
+    def _has_motion(self, frame):
+        if self.region:
+            x1, y1, x2, y2 = self.region
+            frame = frame[y1:y2, x1:x2]
+        if frame.size == 0:
+            return True
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        if self.blur:
+            gray = cv2.GaussianBlur(gray, (self.blur, self.blur), 0)
+
+        if self.method == "mog2":
+            if self._bg is None:
+                self._bg = cv2.createBackgroundSubtractorMOG2(history=200, detectShadows=False)
+            mask = self._bg.apply(gray)
+            return cv2.countNonZero(mask) >= self.min_area * mask.size
+
+        prev, self._prev = self._prev, gray
+        if prev is None or prev.shape != gray.shape:
+            return True
+        diff = cv2.absdiff(gray, prev)
+        changed = cv2.countNonZero(cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)[1])
+        return changed >= self.min_area * diff.size
+
+    def get_stats(self):
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_rate": self.skipped / self.checked if self.checked else 0.0,
+            "avg_ms": self.total_time / self.checked * 1000 if self.checked else 0.0,
+        }
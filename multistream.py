@@ -0,0 +1,265 @@
+# multistream.py
+"""
+Xử lý nhiều nguồn video trong 1 process với 1 model dùng chung.
+Mỗi stream có thread đọc frame riêng; 1 thread gom frame từ các stream trong 1 khoảng
+thời gian ngắn (batch_window) thành 1 batch để detect chung, rồi track + đếm từng frame
+theo đúng thứ tự của stream đó. Mỗi stream giữ Sort / Counter / CSV / không gian ID riêng.
+Detect đi qua cùng đường với VideoEngine (video_engine.detect_for_engines): decode_size, roi_crop,
+cache detection của từng stream đều được áp dụng; kiểm tra bằng benchmarks/parity_multistream.py.
+
+Chạy: python multistream.py cam1.mp4 cam2.mp4 [--max-batch 8] [--batch-window 0.01]
+"""
+import argparse
+import atexit
+import os
+import queue
+import threading
+import time
+
+from detector import DetectorLoader
+from video_engine import VideoEngine, detect_for_engines
+
+# Đánh dấu stream đã hết frame
+_END = object()
+
+
+class _Stream:
+    def __init__(self, name, source, engine, queue_size):
+        self.name = name
+        self.source = source
+        self.engine = engine
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.reader = None
+        self.finished = False
+        self.summary_path = None
+        # Thống kê
+        self.frames = 0
+        self.started_at = None
+        self.finished_at = None
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def stats(self):
+        end = self.finished_at or time.perf_counter()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "frames": self.frames,
+            "fps": self.frames / elapsed if elapsed > 0 else 0.0,
+            "latency_avg_ms": self.latency_sum / self.frames * 1000 if self.frames else 0.0,
+            "latency_max_ms": self.latency_max * 1000,
+            "queue_depth": self.queue.qsize(),
+            "finished": self.finished,
+            "counts": self.engine.get_stats(),
+            "csv_path": self.engine.csv_path,
+            "summary_path": self.summary_path,
+        }
+
+
+class MultiStreamEngine:
+    """
+    sources: list đường dẫn video hoặc dict {tên stream: đường dẫn}.
+    max_batch: số frame tối đa trong 1 lần detect; batch_window: thời gian (giây) tối đa chờ
+    gom thêm frame sau khi đã có frame đầu tiên của batch.
+    backend / threads: backend inference và số thread của detector dùng chung (xem backends.py).
+    engine_kwargs: tham số thêm cho VideoEngine của từng stream (vd. detect_stride).
+    """
+
+    def __init__(self, sources, model_path="yolov8n.pt", detector=None, max_batch=8, batch_window=0.01,
+                 queue_size=8, output_dir="outputs", backend=None, threads=None, **engine_kwargs):
+        if not isinstance(sources, dict):
+            sources = self._name_sources(sources)
+        if detector is None:
+            detector = DetectorLoader(model_path=model_path, backend=backend, threads=threads).get()
+        self.detector = detector
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Frame của 1 stream có thể đang nằm trong queue (queue_size) + batch (max_batch): buffer xoay
+        # vòng của ScaledCapture (decode_size, xem decode.py) được tính theo queue_size của engine
+        engine_kwargs.setdefault("queue_size", queue_size + max_batch)
+        self.streams = []
+        for name, source in sources.items():
+            engine = VideoEngine(detector=self.detector, render=False, **engine_kwargs)
+            atexit.unregister(engine.stop)  # MultiStreamEngine tự dừng từng engine
+            engine.output_dir = output_dir
+            self.streams.append(_Stream(name, source, engine, queue_size))
+
+        self._stop = threading.Event()
+        self._batcher = None
+        self.batches = 0
+        self.batched_frames = 0
+
+    @staticmethod
+    def _name_sources(paths):
+        named = {}
+        for path in paths:
+            name = os.path.splitext(os.path.basename(path))[0]
+            base, i = name, 1
+            while name in named:
+                i += 1
+                name = f"{base}_{i}"
+            named[name] = path
+        return named
+
+    def start(self):
+        for s in self.streams:
+            s.engine.start(s.source, csv_path=os.path.join(self.output_dir, f"{s.name}_counts.csv"))
+            s.started_at = time.perf_counter()
+            s.reader = threading.Thread(target=self._read_loop, args=(s,), name=f"stream-{s.name}", daemon=True)
+            s.reader.start()
+        self._batcher = threading.Thread(target=self._batch_loop, name="stream-batcher", daemon=True)
+        self._batcher.start()
+
+    def wait(self):
+        """Chờ tới khi mọi stream xử lý xong."""
+        while self._batcher is not None and self._batcher.is_alive():
+            self._batcher.join(timeout=0.5)
+
+    def run(self):
+        self.start()
+        self.wait()
+        return self.get_stats()
+
+    def stop(self):
+        self._stop.set()
+        if self._batcher is not None:
+            self._batcher.join()
+        for s in self.streams:
+            if s.reader is not None:
+                s.reader.join()
+            self._finish(s)
+
+    def get_stats(self):
+        return {
+            "streams": {s.name: s.stats() for s in self.streams},
+            "batches": self.batches,
+            "avg_batch_size": self.batched_frames / self.batches if self.batches else 0.0,
+        }
+
+    # --- Threads ---
+    def _read_loop(self, stream):
+        cap = stream.engine.cap
+        m = stream.engine.metrics
+        while not self._stop.is_set():
+            t0 = time.perf_counter() if m else 0
+            ret, frame = cap.read()
+            if m and ret:
+                m.since("decode", t0)
+            if not ret:
+                stream.engine._reached_end = True  # Số frame thật cho cache detection
+            item = (frame, time.perf_counter()) if ret else _END
+            while not self._stop.is_set():
+                try:
+                    stream.queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if not ret:
+                return
+
+    def _batch_loop(self):
+        try:
+            while not self._stop.is_set():
+                active = [s for s in self.streams if not s.finished]
+                if not active:
+                    return
+                batch = self._collect(active)
+                if batch:
+                    self._process_batch(batch)
+                # Stream hết frame: đóng sau khi các frame cuối (nếu có trong batch) đã được xử lý
+                for s in active:
+                    if s.finished:
+                        self._finish(s)
+        except Exception as e:
+            print(f"Lỗi khi xử lý multi-stream: {e}")
+
+    def _collect(self, active):
+        """Gom frame từ các stream (lần lượt từng stream cho công bằng) tới khi đủ batch hoặc hết batch_window."""
+        batch = []
+        deadline = None
+        while len(batch) < self.max_batch and not self._stop.is_set():
+            got = False
+            for s in active:
+                if s.finished or len(batch) >= self.max_batch:
+                    continue
+                try:
+                    item = s.queue.get_nowait()
+                except queue.Empty:
+                    continue
+                got = True
+                if item is _END:
+                    s.finished = True
+                    continue
+                batch.append((s, item))
+            now = time.perf_counter()
+            if batch and deadline is None:
+                deadline = now + self.batch_window
+            if all(s.finished for s in active) or (deadline is not None and now >= deadline):
+                break
+            if not got:
+                time.sleep(0.001)
+        return batch
+
+    def _process_batch(self, batch):
+        # Chỉ keyframe của từng stream mới được detect (detect_stride, motion gate, cache); mỗi stream
+        # áp dụng decode_size / roi_crop / cache của nó, keyframe của mọi stream được detect chung
+        by_stream = {}
+        for s, (frame, _) in batch:
+            by_stream.setdefault(s, []).append(frame)
+        plans, requests = {}, []
+        for s, frames in by_stream.items():
+            plan, key_frames, key_ids = s.engine._plan_frames(frames)
+            plans[s] = plan
+            requests.append((s.engine, key_frames, key_ids))
+        key_frames = sum(len(frames) for _, frames, _ in requests)
+        if key_frames:
+            self.batches += 1
+            self.batched_frames += key_frames
+        detections = {s: iter(s.engine._assign_detections(plans[s], key_detections))
+                      for s, key_detections in zip(by_stream, detect_for_engines(self.detector, requests))}
+
+        for s, (_, t_read) in batch:
+            m = s.engine.metrics
+            if m:
+                m.queue_depths({"stream": s.queue.qsize()})
+            s.engine._track_and_count(next(detections[s]))
+            latency = time.perf_counter() - t_read
+            s.frames += 1
+            s.latency_sum += latency
+            s.latency_max = max(s.latency_max, latency)
+
+    def _finish(self, stream):
+        if stream.finished_at is None:
+            stream.finished_at = time.perf_counter()
+            stream.summary_path = stream.engine.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đếm xe trên nhiều video / camera với 1 model dùng chung")
+    parser.add_argument("sources", nargs="+", help="Các video đầu vào")
+    parser.add_argument("--model", default="yolov8n.pt", help="Model YOLO")
+    parser.add_argument("--backend", choices=["torch", "onnx", "openvino"], help="Backend inference (mặc định theo model)")
+    parser.add_argument("--threads", type=int, help="Số thread intra-op của backend")
+    parser.add_argument("--max-batch", type=int, default=8, help="Số frame tối đa mỗi lần detect")
+    parser.add_argument("--batch-window", type=float, default=0.01, help="Thời gian chờ gom batch (giây)")
+    parser.add_argument("--detect-stride", type=int, default=1, help="Chỉ detect mỗi k frame")
+    parser.add_argument("--output-dir", default="outputs")
+    args = parser.parse_args()
+
+    engine = MultiStreamEngine(args.sources, model_path=args.model, max_batch=args.max_batch,
+                               batch_window=args.batch_window, output_dir=args.output_dir,
+                               detect_stride=args.detect_stride, backend=args.backend, threads=args.threads)
+    try:
+        stats = engine.run()
+    finally:
+        engine.stop()
+    for name, st in stats["streams"].items():
+        print(f"{name}: {st['frames']} frame, {st['fps']:.1f} FPS, latency TB {st['latency_avg_ms']:.1f} ms "
+              f"(max {st['latency_max_ms']:.1f} ms), tổng {st['counts'].get('total', 0)} xe")
+    print(f"{stats['batches']} batch, trung bình {stats['avg_batch_size']:.1f} frame/batch")
+
+
+if __name__ == "__main__":
+    main()
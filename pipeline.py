@@ -0,0 +1,176 @@
+# pipeline.py
+import queue
+import threading
+import time
+
+# Đánh dấu hết video, được chuyển tiếp qua từng stage
+_END = object()
+
+
+class FramePipeline:
+    """
+    Chạy các stage của VideoEngine trên các thread riêng, nối với nhau bằng queue có giới hạn:
+        decode -> detect (theo batch) -> track + đếm (đúng thứ tự) -> vẽ (tùy chọn)
+    Queue đầy thì stage phía trước bị chặn lại (backpressure), nên bộ nhớ không tăng
+    khi stage sau chậm hơn. Track + đếm chạy trên 1 thread duy nhất theo thứ tự frame,
+    vì vậy số đếm và CSV giống hệt chế độ tuần tự.
+    """
+
+    def __init__(self, engine, queue_size=8, render=True):
+        self.engine = engine
+        self.render = render
+        self._stop = threading.Event()
+        self._decoded = queue.Queue(maxsize=queue_size)
+        self._detected = queue.Queue(maxsize=queue_size)
+        self._tracked = queue.Queue(maxsize=queue_size)
+        self._output = queue.Queue(maxsize=queue_size) if render else self._tracked
+        self._threads = []
+        self._finished = False
+
+    def start(self):
+        stages = [
+            ("decode", self._decode_loop),
+            ("detect", self._detect_loop),
+            ("track", self._track_loop),
+        ]
+        if self.render:
+            stages.append(("render", self._render_loop))
+        for name, target in stages:
+            t = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def get(self):
+        """Lấy kết quả frame tiếp theo (chặn cho tới khi có). Trả về (ret, frame, stats)."""
+        if self._finished:
+            return False, None, {}
+        item = self._get(self._output)
+        if item is None or item is _END:
+            self._finished = True
+            return False, None, {}
+        frame, stats = item
+        return True, frame, stats
+
+    def stop(self):
+        """Dừng mọi stage: báo dừng, xả các queue để thread đang bị chặn thoát ra, rồi join."""
+        self._stop.set()
+        for t in self._threads:
+            while t.is_alive():
+                self._drain()
+                t.join(timeout=0.05)
+        self._drain()
+        self._threads = []
+        self._finished = True
+
+    def queue_depths(self):
+        return {
+            "decoded": self._decoded.qsize(),
+            "detected": self._detected.qsize(),
+            "tracked": self._tracked.qsize(),
+        }
+
+    # --- Các stage ---
+    def _decode_loop(self):
+        cap = self.engine.cap
+        m = self.engine.metrics
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter() if m else 0
+                ret, frame = cap.read()
+                if not ret:
+                    self.engine._reached_end = True
+                    break
+                if m:
+                    m.since("decode", t0)
+                if not self._put(self._decoded, frame):
+                    return
+        except Exception as e:
+            print(f"Lỗi khi decode: {e}")
+        self._put(self._decoded, _END)
+
+    def _detect_loop(self):
+        engine = self.engine
+        ended = False
+        try:
+            while not ended and not self._stop.is_set():
+                # Lấy frame đầu tiên (chờ), sau đó gom thêm các frame đã sẵn sàng cho đủ batch
+                first = self._get(self._decoded)
+                if first is None or first is _END:
+                    break
+                frames = [first]
+                while len(frames) < engine.batch_size:
+                    try:
+                        frame = self._decoded.get_nowait()
+                    except queue.Empty:
+                        break
+                    if frame is _END:
+                        ended = True
+                        break
+                    frames.append(frame)
+
+                detections_list = engine._detect_frames(frames)
+                for item in zip(frames, detections_list):
+                    if not self._put(self._detected, item):
+                        return
+        except Exception as e:
+            print(f"Lỗi khi detect: {e}")
+        self._put(self._detected, _END)
+
+    def _track_loop(self):
+        engine = self.engine
+        m = engine.metrics
+        try:
+            while not self._stop.is_set():
+                item = self._get(self._detected)
+                if item is None or item is _END:
+                    break
+                if m:
+                    m.queue_depths(self.queue_depths())
+                frame, detections = item
+                tracks, stats = engine._track_and_count(detections)
+                out = (frame, tracks, stats) if self.render else (None, stats)
+                if not self._put(self._tracked, out):
+                    return
+        except Exception as e:
+            print(f"Lỗi khi track: {e}")
+        self._put(self._tracked, _END)
+
+    def _render_loop(self):
+        engine = self.engine
+        try:
+            while not self._stop.is_set():
+                item = self._get(self._tracked)
+                if item is None or item is _END:
+                    break
+                frame, tracks, stats = item
+                if not self._put(self._output, (engine._render(frame, tracks), stats)):
+                    return
+        except Exception as e:
+            print(f"Lỗi khi vẽ: {e}")
+        self._put(self._output, _END)
+
+    # --- Helpers: put/get có kiểm tra cờ dừng để không bị treo khi stop() ---
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _drain(self):
+        for q in (self._decoded, self._detected, self._tracked, self._output):
+            try:
+                while True:
+                    q.get_nowait()
+            except queue.Empty:
+                pass
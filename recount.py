@@ -0,0 +1,177 @@
+# recount.py
+"""
+Đếm lại (what-if) trên track log (tracklog.py) với nhiều cấu hình Counter cùng lúc:
+vị trí vạch, chiều đi, ROI, mà không phải decode / detect / track lại video.
+
+Cùng logic với Counter.check_and_count trong VideoEngine: tâm track (cX, cY) ở frame trước và
+frame hiện tại của cùng ID; "down" đếm khi prev_y < line <= curr_y, "up" khi prev_y > line >= curr_y;
+mỗi ID đếm tối đa 1 lần mỗi cấu hình. Với vạch / chiều giống lúc ghi log, kết quả trùng với engine.
+ROI ở đây chỉ lọc theo tâm track lúc cắt vạch; trong engine ROI lọc detection trước SORT nên có thể
+làm track khác đi, vì vậy số đếm theo ROI mới chỉ là ước lượng.
+
+Mỗi cấu hình là vài phép so sánh vector hóa trên các dòng log có tâm thay đổi; các cấu hình được
+chia cho nhiều process, mỗi process đọc chung dữ liệu đã chuẩn bị qua mmap.
+
+Chạy: python recount.py outputs/video_tracks --lines 300:800:5 [--direction both] [--roi x1 y1 x2 y2]
+      [--workers 4] [--json sweep.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tracklog import TrackLog
+
+_SEGMENT_COLUMNS = ("id", "frame", "cls", "cx", "cy", "prev_cy")
+_segments = None  # Dữ liệu đã chuẩn bị, mở trong mỗi worker process
+
+
+def prepare_segments(log):
+    """
+    Sắp xếp log theo (id, frame), tính tâm ở frame hiện tại và tâm y ở lần xuất hiện trước của cùng ID,
+    rồi chỉ giữ các dòng có tâm y thay đổi (chỉ các dòng này mới có thể cắt vạch).
+    """
+    ids = np.asarray(log["id"])
+    frames = np.asarray(log["frame"])
+    order = np.lexsort((frames, ids))
+    ids = ids[order]
+    # int((a + b) / 2) trong engine: chia thực rồi cắt về phía 0
+    cx = np.trunc((log["x1"][order].astype(np.float64) + log["x2"][order]) / 2).astype(np.int32)
+    cy = np.trunc((log["y1"][order].astype(np.float64) + log["y2"][order]) / 2).astype(np.int32)
+    prev_cy = np.empty_like(cy)
+    if len(cy):
+        prev_cy[0] = cy[0]
+        prev_cy[1:] = cy[:-1]
+        # Lần xuất hiện đầu tiên của 1 ID: prev = curr (giống prev_centroids.get(oid, curr))
+        first = np.r_[True, ids[1:] != ids[:-1]]
+        prev_cy[first] = cy[first]
+    moving = prev_cy != cy
+    return {
+        "id": ids[moving],
+        "frame": frames[order][moving],
+        "cls": np.asarray(log["cls"])[order][moving],
+        "cx": cx[moving],
+        "cy": cy[moving],
+        "prev_cy": prev_cy[moving],
+    }
+
+
+def count_config(segments, config, names, events=False):
+    """
+    config: {"line_y": int, "direction": "down" | "up", "roi": (x1, y1, x2, y2) hoặc None}.
+    Trả về {config, total, counts theo class[, events (frame, id, class)]}.
+    """
+    line_y = config["line_y"]
+    prev_cy, cy = segments["prev_cy"], segments["cy"]
+    if config.get("direction", "down") == "down":
+        mask = (prev_cy < line_y) & (cy >= line_y)
+    else:
+        mask = (prev_cy > line_y) & (cy <= line_y)
+    roi = config.get("roi")
+    if roi:
+        rx1, ry1, rx2, ry2 = roi
+        cx = segments["cx"]
+        mask &= (rx1 < cx) & (cx < rx2) & (ry1 < cy) & (cy < ry2)
+
+    rows = np.flatnonzero(mask)
+    # Dòng đã sắp theo (id, frame): lần cắt vạch đầu tiên của mỗi ID là dòng đầu của nhóm ID đó
+    ids = segments["id"][rows]
+    rows = rows[np.r_[True, ids[1:] != ids[:-1]]] if len(rows) else rows
+    cls = segments["cls"][rows]
+    counts = {"car": 0, "motorcycle": 0, "bus": 0, "truck": 0}
+    for cid, n in zip(*np.unique(cls, return_counts=True)):
+        name = names.get(int(cid), "unknown")
+        counts[name] = counts.get(name, 0) + int(n)
+    result = {"config": config, "total": int(len(rows)), "counts": counts}
+    if events:
+        order = np.argsort(segments["frame"][rows], kind="stable")
+        result["events"] = [(int(f), int(i), names.get(int(c), "unknown")) for f, i, c in
+                            zip(segments["frame"][rows][order], segments["id"][rows][order], cls[order])]
+    return result
+
+
+def _init_worker(segments_dir):
+    global _segments
+    _segments = {name: np.load(os.path.join(segments_dir, f"{name}.npy"), mmap_mode="r")
+                 for name in _SEGMENT_COLUMNS}
+
+
+def _count_chunk(configs, names, events):
+    return [count_config(_segments, config, names, events) for config in configs]
+
+
+def recount(log_path, configs, workers=None, events=False):
+    """
+    Đếm lại track log ở log_path với từng cấu hình trong configs (xem count_config).
+    workers: số process (mặc định số CPU; 1 = chạy trong process hiện tại).
+    Trả về list kết quả theo đúng thứ tự configs.
+    """
+    log = TrackLog(log_path)
+    names = log.names
+    segments = prepare_segments(log)
+    workers = min(workers or os.cpu_count() or 1, len(configs))
+    if workers <= 1:
+        return [count_config(segments, config, names, events) for config in configs]
+
+    chunk = -(-len(configs) // (workers * 4))
+    with tempfile.TemporaryDirectory() as segments_dir:
+        for name in _SEGMENT_COLUMNS:
+            np.save(os.path.join(segments_dir, f"{name}.npy"), segments[name])
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(segments_dir,)) as pool:
+            futures = [pool.submit(_count_chunk, configs[i:i + chunk], names, events)
+                       for i in range(0, len(configs), chunk)]
+            return [r for f in futures for r in f.result()]
+
+
+def sweep_configs(lines, directions=("down", "up"), roi=None):
+    """Tích Descartes vị trí vạch x chiều đi (cùng 1 ROI)."""
+    return [{"line_y": int(y), "direction": d, "roi": roi} for y in lines for d in directions]
+
+
+def _parse_lines(spec):
+    """"300:800:5" -> range(300, 801, 5); "300,450,600" -> [300, 450, 600]."""
+    if ":" in spec:
+        start, stop, *step = (int(v) for v in spec.split(":"))
+        return list(range(start, stop + 1, step[0] if step else 1))
+    return [int(v) for v in spec.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đếm lại track log với nhiều vị trí vạch / chiều / ROI")
+    parser.add_argument("log", help="Thư mục track log (VideoEngine(track_log=...))")
+    parser.add_argument("--lines", help="Các vị trí vạch: start:stop[:step] hoặc y1,y2,... (mặc định: vạch lúc ghi log)")
+    parser.add_argument("--direction", default="both", choices=["down", "up", "both"])
+    parser.add_argument("--roi", type=int, nargs=4, metavar=("X1", "Y1", "X2", "Y2"))
+    parser.add_argument("--workers", type=int, help="Số process (mặc định: số CPU)")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    directions = ("down", "up") if args.direction == "both" else (args.direction,)
+    if args.lines:
+        configs = sweep_configs(_parse_lines(args.lines), directions, args.roi)
+    else:
+        meta = TrackLog(args.log).meta
+        configs = [{"line_y": meta["line_down_y"], "direction": "down", "roi": args.roi},
+                   {"line_y": meta["line_up_y"], "direction": "up", "roi": args.roi}]
+
+    t0 = time.perf_counter()
+    results = recount(args.log, configs, workers=args.workers)
+    elapsed = time.perf_counter() - t0
+    for r in results:
+        c = r["config"]
+        print(f"line_y={c['line_y']:>5} {c['direction']:<4} total={r['total']:>5} {r['counts']}")
+    print(f"{len(configs)} cấu hình trong {elapsed:.2f}s")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
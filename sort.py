@@ -1,6 +1,5 @@
 # sort.py
 import numpy as np
-from filterpy.kalman import KalmanFilter
 
 
 def linear_assignment(cost_matrix):
@@ -37,6 +36,8 @@ class KalmanBoxTracker(object):
     count = 0
 
     def __init__(self, bbox):
+        # filterpy chỉ cần cho tracker đơn lẻ này; Sort dùng KalmanBoxBank
+        from filterpy.kalman import KalmanFilter
         self.kf = KalmanFilter(dim_x=7, dim_z=4)
         self.kf.F = np.array(
             [[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0, 0],
@@ -96,83 +97,371 @@ class KalmanBoxTracker(object):
             return np.array([x[0] - w / 2., x[1] - h / 2., x[0] + w / 2., x[1] + h / 2., score]).reshape((1, 5))
 
 
+def convert_bboxes_to_z(bboxes):
+    """Phiên bản vector hóa của KalmanBoxTracker.convert_bbox_to_z: (N,4+) -> (N,4) [x,y,s,r]."""
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    x = bboxes[:, 0] + w / 2.
+    y = bboxes[:, 1] + h / 2.
+    return np.stack((x, y, w * h, w / h), axis=1)
+
+
+def convert_x_to_bboxes(x):
+    """Phiên bản vector hóa của KalmanBoxTracker.convert_x_to_bbox: (N,7) -> (N,4) [x1,y1,x2,y2]."""
+    with np.errstate(invalid="ignore"):
+        w = np.sqrt(x[:, 2] * x[:, 3])
+        h = x[:, 2] / w
+    return np.stack((x[:, 0] - w / 2., x[:, 1] - h / 2., x[:, 0] + w / 2., x[:, 1] + h / 2.), axis=1)
+
+
+# Thông tin kèm theo mỗi track output (Sort.update(..., return_info=True))
+#   det_index: chỉ số detection khớp với track ở frame này (-1 nếu frame coast)
+#   cls: class id được bầu nhiều nhất (tổng score) qua các frame, -1 nếu detection không có class
+#   score: score của detection khớp gần nhất
+TRACK_INFO_DTYPE = np.dtype([("det_index", np.int32), ("cls", np.int32), ("score", np.float32)])
+
+
+class KalmanBoxBank(object):
+    """
+    Kalman filter của toàn bộ track, lưu dạng mảng chồng nhau thay vì 1 KalmanFilter mỗi track:
+        x: (N,7), P: (N,7,7); ids / hits / hit_streak / age / time_since_update: (N,)
+    Cùng mô hình và tham số với KalmanBoxTracker (filterpy), nhưng predict / update
+    chạy 1 lần cho mọi track. Thứ tự các dòng = thứ tự tạo track.
+    Mỗi track còn giữ det_index (detection khớp ở frame hiện tại), score gần nhất
+    và votes (N,C): tổng score theo từng class id để bầu class cho track.
+    """
+    F = np.array(
+        [[1, 0, 0, 0, 1, 0, 0], [0, 1, 0, 0, 0, 1, 0], [0, 0, 1, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0, 0],
+         [0, 0, 0, 0, 1, 0, 0], [0, 0, 0, 0, 0, 1, 0], [0, 0, 0, 0, 0, 0, 1]], dtype=float)
+    H = np.array(
+        [[1, 0, 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0, 0], [0, 0, 1, 0, 0, 0, 0], [0, 0, 0, 1, 0, 0, 0]], dtype=float)
+    R = np.diag([1., 1., 10., 10.])
+    Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+    P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+
+    def __init__(self):
+        self.x = np.zeros((0, 7))
+        self.P = np.zeros((0, 7, 7))
+        self.ids = np.zeros(0, dtype=int)
+        self.hits = np.zeros(0, dtype=int)
+        self.hit_streak = np.zeros(0, dtype=int)
+        self.age = np.zeros(0, dtype=int)
+        self.time_since_update = np.zeros(0, dtype=int)
+        self.det_index = np.zeros(0, dtype=int)
+        self.score = np.zeros(0)
+        self.votes = np.zeros((0, 0))
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, bboxes, det_index=None, scores=None, classes=None):
+        """Tạo track mới cho mỗi box (N,4+), id tăng dần riêng cho từng bank (mỗi Sort 1 không gian id)."""
+        n = len(bboxes)
+        if n == 0:
+            return
+        x = np.zeros((n, 7))
+        x[:, :4] = convert_bboxes_to_z(bboxes)
+        ids = np.arange(self.next_id, self.next_id + n)
+        self.next_id += n
+        zeros = np.zeros(n, dtype=int)
+
+        self.x = np.concatenate((self.x, x))
+        self.P = np.concatenate((self.P, np.broadcast_to(self.P0, (n, 7, 7))))
+        self.ids = np.concatenate((self.ids, ids))
+        self.hits = np.concatenate((self.hits, zeros))
+        self.hit_streak = np.concatenate((self.hit_streak, zeros))
+        self.age = np.concatenate((self.age, zeros))
+        self.time_since_update = np.concatenate((self.time_since_update, zeros))
+        self.det_index = np.concatenate((self.det_index, zeros - 1 if det_index is None else det_index))
+        self.score = np.concatenate((self.score, np.zeros(n) if scores is None else scores))
+        self.votes = np.concatenate((self.votes, np.zeros((n, self.votes.shape[1]))))
+        self._vote(np.arange(len(self.x) - n, len(self.x)), scores, classes)
+
+    def _vote(self, idx, scores, classes):
+        """Cộng score vào phiếu bầu class của các track idx."""
+        if classes is None or len(idx) == 0:
+            return
+        classes = classes.astype(int)
+        n_cls = classes.max() + 1
+        if n_cls > self.votes.shape[1]:
+            self.votes = np.pad(self.votes, ((0, 0), (0, n_cls - self.votes.shape[1])))
+        np.add.at(self.votes, (idx, classes), 1. if scores is None else scores)
+
+    def voted_classes(self):
+        """Class id được bầu nhiều nhất của mỗi track (-1 nếu chưa có phiếu)."""
+        if self.votes.shape[1] == 0:
+            return np.full(len(self.x), -1)
+        return np.where(self.votes.max(axis=1) > 0, self.votes.argmax(axis=1), -1)
+
+    def predict(self, coast=False):
+        """
+        Predict mọi track, trả về box dự đoán (N,4).
+        coast=True: frame không chạy detect, không tăng time_since_update / không reset hit_streak.
+        """
+        x = self.x
+        x[(x[:, 6] + x[:, 2]) <= 0, 6] = 0.
+        self.x = x @ self.F.T
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        self.age += 1
+        self.det_index[:] = -1
+        if not coast:
+            self.hit_streak[self.time_since_update > 0] = 0
+            self.time_since_update += 1
+        return self.get_state()
+
+    def update(self, idx, bboxes, det_index=None, scores=None, classes=None):
+        """Update các track ở vị trí idx với box đo được tương ứng (M,4+)."""
+        if len(idx) == 0:
+            return
+        x = self.x[idx]
+        P = self.P[idx]
+        z = convert_bboxes_to_z(bboxes)
+
+        # Các bước giống KalmanFilter.update của filterpy (dạng Joseph cho P)
+        y = z - x @ self.H.T
+        PHT = P @ self.H.T
+        S = self.H @ PHT + self.R
+        K = PHT @ np.linalg.inv(S)
+        self.x[idx] = x + (K @ y[..., None])[..., 0]
+        I_KH = np.eye(7) - K @ self.H
+        self.P[idx] = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+
+        self.time_since_update[idx] = 0
+        self.hits[idx] += 1
+        self.hit_streak[idx] += 1
+        if det_index is not None:
+            self.det_index[idx] = det_index
+        if scores is not None:
+            self.score[idx] = scores
+        self._vote(idx, scores, classes)
+
+    def get_state(self):
+        return convert_x_to_bboxes(self.x)
+
+    def keep(self, mask):
+        """Chỉ giữ lại các track có mask = True (giữ nguyên thứ tự)."""
+        for name in ("x", "P", "ids", "hits", "hit_streak", "age", "time_since_update",
+                     "det_index", "score", "votes"):
+            setattr(self, name, getattr(self, name)[mask])
+
+
 class Sort(object):
     def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
         self.max_age = max_age
         self.min_hits = min_hits
         self.iou_threshold = iou_threshold
-        self.trackers = []
+        self.bank = KalmanBoxBank()
         self.frame_count = 0
+        self.removed_ids = np.zeros(0, dtype=int)  # id (dạng output) của các track bị xóa ở lần update gần nhất
 
-    def update(self, dets=np.empty((0, 5))):
+    def update(self, dets=np.empty((0, 5)), return_info=False):
+        """
+        dets: mảng Nx5 [x1,y1,x2,y2,score], Nx6 [x1,y1,x2,y2,score,cls] hoặc structured array
+        có các cột xyxy/conf/cls (kết quả trực tiếp của VehicleDetector.detect).
+        return_info=True: trả về (tracks, info) với info là mảng TRACK_INFO_DTYPE cùng thứ tự
+        tracks (detection đã khớp, class được bầu, score).
+        """
+        classes = None
+        if dets.dtype.names is not None:
+            if "cls" in dets.dtype.names:
+                classes = dets["cls"]
+            dets = np.column_stack((dets["xyxy"], dets["conf"])).astype(np.float64)
+        elif dets.ndim == 2 and dets.shape[1] > 5:
+            classes = dets[:, 5]
         self.frame_count += 1
-        trks = np.zeros((len(self.trackers), 5))
-        to_del = []
-        ret = []
-        for t, trk in enumerate(trks):
-            pos = self.trackers[t].predict()[0]
-            trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
-            if np.any(np.isnan(pos)):
-                to_del.append(t)
-        trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
-        for t in reversed(to_del):
-            self.trackers.pop(t)
+        bank = self.bank
+
+        # Predict mọi track 1 lần, bỏ các track có trạng thái NaN
+        trks = bank.predict()
+        valid = ~np.any(np.isnan(trks), axis=1)
+        removed = [bank.ids[~valid]]
+        if not valid.all():
+            bank.keep(valid)
+            trks = trks[valid]
         matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks, self.iou_threshold)
 
-        for m in matched:
-            self.trackers[m[1]].update(dets[m[0], :])
+        d = matched[:, 0]
+        bank.update(matched[:, 1], dets[d, :4], d, dets[d, 4], None if classes is None else classes[d])
+        d = np.asarray(unmatched_dets, dtype=int)
+        bank.add(dets[d, :4], d, dets[d, 4], None if classes is None else classes[d])
+
+        ret = self._output(bank.get_state(), return_info=return_info)
+        alive = bank.time_since_update <= self.max_age
+        removed.append(bank.ids[~alive])
+        bank.keep(alive)
+        self.removed_ids = np.concatenate(removed) + 1
+        return ret
+
+    def coast(self, return_info=False):
+        """
+        Đẩy mọi tracker đi 1 frame chỉ bằng Kalman predict (frame không chạy detect).
+        Frame coast không tính là mất dấu nên track không bị xóa vì max_age.
+        Trả về box dự đoán của các track đang được output, cùng định dạng với update().
+        """
+        state = self.bank.predict(coast=True)
+        self.removed_ids = np.zeros(0, dtype=int)
+        return self._output(state, ~np.any(np.isnan(state), axis=1), return_info)
 
-        for i in unmatched_dets:
-            trk = KalmanBoxTracker(dets[i, :])
-            self.trackers.append(trk)
+    def _output(self, state, mask=True, return_info=False):
+        """[x1,y1,x2,y2,id] của các track vừa được update và đủ min_hits, theo thứ tự track mới nhất trước."""
+        bank = self.bank
+        mask = mask & (bank.time_since_update < 1) & \
+            ((bank.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+        idx = np.flatnonzero(mask)[::-1]
+        ret = np.column_stack((state[idx], bank.ids[idx] + 1)) if len(idx) else np.empty((0, 5))
+        if not return_info:
+            return ret
+        info = np.empty(len(idx), dtype=TRACK_INFO_DTYPE)
+        info["det_index"] = bank.det_index[idx]
+        info["cls"] = bank.voted_classes()[idx]
+        info["score"] = bank.score[idx]
+        return ret, info
 
-        i = len(self.trackers)
-        for trk in reversed(self.trackers):
-            d = trk.get_state()[0]
-            if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
-                ret.append(np.concatenate((d, [trk.id + 1])).reshape(1, -1))
-            i -= 1
-            if (trk.time_since_update > self.max_age):
-                self.trackers.pop(i)
-        if (len(ret) > 0):
-            return np.concatenate(ret)
-        return np.empty((0, 5))
+
+def pair_iou(bb_a, bb_b):
+    """IoU theo từng cặp dòng của 2 mảng box cùng độ dài (N,4+) -> (N,)."""
+    w = np.maximum(0., np.minimum(bb_a[:, 2], bb_b[:, 2]) - np.maximum(bb_a[:, 0], bb_b[:, 0]))
+    h = np.maximum(0., np.minimum(bb_a[:, 3], bb_b[:, 3]) - np.maximum(bb_a[:, 1], bb_b[:, 1]))
+    wh = w * h
+    return wh / ((bb_a[:, 2] - bb_a[:, 0]) * (bb_a[:, 3] - bb_a[:, 1]) +
+                 (bb_b[:, 2] - bb_b[:, 0]) * (bb_b[:, 3] - bb_b[:, 1]) - wh)
+
+
+def candidate_pairs(detections, trackers):
+    """
+    Tìm các cặp (detection, tracker) có box giao nhau (IoU > 0) mà không dựng ma trận IoU đầy đủ.
+    Trackers được sắp theo x1; mỗi detection chỉ xét các tracker có x1 trong
+    [det.x1 - độ rộng tracker lớn nhất, det.x2) (tìm bằng searchsorted).
+    Trả về (det_idx, trk_idx, iou).
+    """
+    order = np.argsort(trackers[:, 0], kind="stable")
+    tx1 = trackers[order, 0]
+    max_w = max(0., np.max(trackers[:, 2] - trackers[:, 0]))
+    lo = np.searchsorted(tx1, detections[:, 0] - max_w, side="left")
+    hi = np.searchsorted(tx1, detections[:, 2], side="left")
+    counts = np.maximum(hi - lo, 0)
+
+    # Trải các khoảng [lo, hi) của từng detection thành danh sách cặp
+    det_idx = np.repeat(np.arange(len(detections)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    trk_idx = order[np.repeat(lo, counts) + offsets]
+
+    iou = pair_iou(detections[det_idx], trackers[trk_idx])
+    keep = iou > 0
+    return det_idx[keep], trk_idx[keep], iou[keep]
+
+
+def connected_components(n, u, v):
+    """Nhãn thành phần liên thông của đồ thị n đỉnh, cạnh (u[i], v[i]) (hook + nén đường đi bằng numpy)."""
+    labels = np.arange(n)
+    while True:
+        lu, lv = labels[u], labels[v]
+        if np.array_equal(lu, lv):
+            return labels
+        low = np.minimum(lu, lv)
+        np.minimum.at(labels, lu, low)
+        np.minimum.at(labels, lv, low)
+        while True:
+            nxt = labels[labels]
+            if np.array_equal(nxt, labels):
+                break
+            labels = nxt
+
+
+# Bài toán nhỏ hơn ngưỡng này (số detection x số tracker) giải thẳng trên ma trận IoU đầy đủ,
+# vì chi phí lọc cặp + tách thành phần lớn hơn phần tiết kiệm được
+DENSE_ASSOCIATION_LIMIT = 100 * 100
+
+
+def _solve_dense(iou_matrix, iou_threshold):
+    """Ghép trên 1 ma trận IoU nhỏ (1 thành phần liên thông), như cách SORT gốc làm trên toàn bộ ma trận."""
+    a = (iou_matrix > iou_threshold).astype(np.int32)
+    if a.sum(1).max() == 1 and a.sum(0).max() == 1:
+        return np.stack(np.where(a), axis=1)
+    return linear_assignment(-iou_matrix).reshape(-1, 2)
 
 
 def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3):
-    if (len(trackers) == 0):
-        return np.empty((0, 2), dtype=int), np.arange(len(detections)), np.empty((0, 5), dtype=int)
+    """
+    Ghép detections với trackers theo IoU, dùng được cho hàng trăm object mỗi frame:
+      1. chỉ xét các cặp box giao nhau (candidate_pairs)
+      2. các cặp trên ngưỡng đã 1-1 thì nhận luôn (như SORT gốc); ngược lại tách đồ thị cặp thành
+         các thành phần liên thông độc lập, thành phần 1 detection - 1 tracker ghép thẳng, còn lại
+         giải riêng trên ma trận nhỏ
+      3. loại các cặp có IoU < iou_threshold, tập chưa ghép tính bằng mask boolean
+    Trả về (matches Kx2 [det, trk], unmatched_detections, unmatched_trackers).
+    """
+    n_det, n_trk = len(detections), len(trackers)
+    if n_det == 0 or n_trk == 0:
+        return np.empty((0, 2), dtype=int), np.arange(n_det), np.arange(n_trk)
 
-    iou_matrix = iou_batch(detections, trackers)
+    if n_det * n_trk <= DENSE_ASSOCIATION_LIMIT:
+        matches = _solve_dense(iou_batch(detections, trackers), iou_threshold)
+        return _finish_matches(detections, trackers, matches, iou_threshold)
 
-    if min(iou_matrix.shape) > 0:
-        a = (iou_matrix > iou_threshold).astype(np.int32)
-        if a.sum(1).max() == 1 and a.sum(0).max() == 1:
-            matched_indices = np.stack(np.where(a), axis=1)
-        else:
-            matched_indices = linear_assignment(-iou_matrix)
-    else:
-        matched_indices = np.empty(shape=(0, 2))
-
-    unmatched_detections = []
-    for d, det in enumerate(detections):
-        if (d not in matched_indices[:, 0]):
-            unmatched_detections.append(d)
-    unmatched_trackers = []
-    for t, trk in enumerate(trackers):
-        if (t not in matched_indices[:, 1]):
-            unmatched_trackers.append(t)
-
-    matches = []
-    for m in matched_indices:
-        if (iou_matrix[m[0], m[1]] < iou_threshold):
-            unmatched_detections.append(m[0])
-            unmatched_trackers.append(m[1])
-        else:
-            matches.append(m.reshape(1, 2))
-    if (len(matches) == 0):
-        matches = np.empty((0, 2), dtype=int)
-    else:
-        matches = np.concatenate(matches, axis=0)
+    det_idx, trk_idx, iou = candidate_pairs(detections, trackers)
+
+    # Như SORT gốc: các cặp trên ngưỡng đã là 1-1 trên toàn bộ thì nhận luôn, ngược lại giải tối ưu
+    # (ở đây giải riêng từng thành phần liên thông, kết quả như giải trên cả ma trận)
+    above = iou > iou_threshold
+    if above.any() and np.bincount(det_idx[above]).max() == 1 and np.bincount(trk_idx[above]).max() == 1:
+        return _finish_matches(detections, trackers, np.stack((det_idx[above], trk_idx[above]), axis=1),
+                               iou_threshold)
+
+    matches = [np.empty((0, 2), dtype=int)]
+    if len(iou):
+        labels = connected_components(n_det + n_trk, det_idx, n_det + trk_idx)
+        comp = labels[det_idx]
+        det_count = np.bincount(labels[:n_det], minlength=n_det + n_trk)
+        trk_count = np.bincount(labels[n_det:], minlength=n_det + n_trk)
+
+        # Thành phần chỉ có 1 detection và 1 tracker: ghép trực tiếp
+        single = (det_count[comp] == 1) & (trk_count[comp] == 1)
+        matches.append(np.stack((det_idx[single], trk_idx[single]), axis=1))
+
+        # Các thành phần còn lại: gom cặp theo nhãn thành phần rồi giải từng phần
+        rest = np.flatnonzero(~single)
+        rest = rest[np.argsort(comp[rest], kind="stable")]
+        bounds = np.flatnonzero(np.diff(comp[rest])) + 1
+        for group in np.split(rest, bounds) if len(rest) else []:
+            dets_u, d_local = np.unique(det_idx[group], return_inverse=True)
+            trks_u, t_local = np.unique(trk_idx[group], return_inverse=True)
+            sub = np.zeros((len(dets_u), len(trks_u)))
+            sub[d_local, t_local] = iou[group]
+            local = linear_assignment(-sub).reshape(-1, 2)
+            matches.append(np.stack((dets_u[local[:, 0]], trks_u[local[:, 1]]), axis=1))
+
+    matches, unmatched_dets, unmatched_trks = _finish_matches(detections, trackers, np.concatenate(matches),
+                                                              iou_threshold)
+    if n_det <= n_trk:
+        # Giải trên cả ma trận thì mọi detection đều được gán (có thể với IoU = 0) rồi bị loại
+        # -> SORT gốc trả các detection chưa ghép theo thứ tự tăng dần
+        unmatched_dets = np.sort(unmatched_dets)
+    return matches, unmatched_dets, unmatched_trks
+
+
+def _finish_matches(detections, trackers, matches, iou_threshold):
+    """
+    Loại cặp dưới ngưỡng IoU, tính detection / tracker chưa ghép bằng mask.
+    Thứ tự unmatched_detections giữ như SORT gốc (track mới được cấp ID theo thứ tự này): trước là
+    các detection không được ghép, rồi tới các detection bị loại vì dưới ngưỡng, mỗi nhóm tăng dần.
+    Với bài toán lớn giải theo thành phần và nhiều detection hơn tracker, detection nào bị gán IoU = 0
+    khi giải trên cả ma trận tùy solver, nên thứ tự (ID track mới) có thể khác SORT gốc; tập ghép
+    và số track mới vẫn giống.
+    """
+    n_det, n_trk = len(detections), len(trackers)
+    matches = matches.astype(int)
+    rejected = np.empty(0, dtype=int)
+    if len(matches):
+        ok = pair_iou(detections[matches[:, 0]], trackers[matches[:, 1]]) >= iou_threshold
+        rejected = np.sort(matches[~ok, 0])
+        matches = matches[ok]
 
-    return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
\ No newline at end of file
+    det_matched = np.zeros(n_det, dtype=bool)
+    det_matched[matches[:, 0]] = True
+    det_matched[rejected] = True
+    trk_matched = np.zeros(n_trk, dtype=bool)
+    trk_matched[matches[:, 1]] = True
+    unmatched_dets = np.concatenate((np.flatnonzero(~det_matched), rejected))
+    return matches, unmatched_dets, np.flatnonzero(~trk_matched)
@@ -0,0 +1,114 @@
+# tracklog.py
+"""
+Track log dạng cột: mỗi track SORT trả về ở mỗi frame là 1 dòng (frame, id, x1, y1, x2, y2, cls),
+đúng các giá trị engine dùng để đếm (tọa độ đã làm tròn như trong VideoEngine._track_and_count).
+Dùng cho recount.py: đếm lại với vạch / chiều / ROI khác mà không phải xử lý lại video.
+
+Thư mục log:
+    <cột>.bin   mảng thô của từng cột, ghi nối thêm theo lô (đọc lại bằng np.memmap)
+    meta.json   số dòng, dtype từng cột, tên class, kích thước / FPS video, vạch đếm, ROI lúc ghi
+meta.json chỉ được ghi khi close(), nên log đang ghi dở không bị đọc nhầm.
+"""
+import json
+import os
+
+import numpy as np
+
+from writers import write_json
+
+TRACK_COLUMNS = (
+    ("frame", np.int32),
+    ("id", np.int32),
+    ("x1", np.int32),
+    ("y1", np.int32),
+    ("x2", np.int32),
+    ("y2", np.int32),
+    ("cls", np.int16),
+)
+
+
+class TrackLogWriter:
+    def __init__(self, path, flush_rows=65536):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.rows = 0
+        os.makedirs(path, exist_ok=True)
+        # Xóa meta cũ trước: log đang ghi lại không được coi là log hoàn chỉnh
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        self._files = {name: open(os.path.join(path, f"{name}.bin"), "wb") for name, _ in TRACK_COLUMNS}
+        self._chunks = []
+        self._pending = 0
+
+    def append(self, frame_idx, tracks, cls):
+        """tracks: mảng (N, 5) [x1, y1, x2, y2, id] như Sort.update trả về; cls: class id của từng track."""
+        if len(tracks) == 0:
+            return
+        self._chunks.append((frame_idx, np.asarray(tracks), np.asarray(cls)))
+        self._pending += len(tracks)
+        if self._pending >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._chunks:
+            return
+        tracks = np.concatenate([t for _, t, _ in self._chunks])
+        # astype(int) cắt phần thập phân về phía 0, giống int() trong engine
+        columns = {
+            "frame": np.concatenate([np.full(len(t), f, dtype=np.int32) for f, t, _ in self._chunks]),
+            "id": tracks[:, 4],
+            "x1": tracks[:, 0],
+            "y1": tracks[:, 1],
+            "x2": tracks[:, 2],
+            "y2": tracks[:, 3],
+            "cls": np.concatenate([c for _, _, c in self._chunks]),
+        }
+        for name, dtype in TRACK_COLUMNS:
+            self._files[name].write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+        self.rows += len(tracks)
+        self._chunks = []
+        self._pending = 0
+
+    def close(self, meta=None):
+        """Ghi nốt phần còn lại và meta.json (meta: thông tin thêm, vd. tên class, vạch đếm)."""
+        if self._files is None:
+            return
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files = None
+        data = dict(meta or {})
+        data["rows"] = self.rows
+        data["columns"] = {name: np.dtype(dtype).str for name, dtype in TRACK_COLUMNS}
+        write_json(os.path.join(self.path, "meta.json"), data)
+
+
+class TrackLog:
+    """Đọc track log: log["frame"], log["id"]... là np.memmap chỉ đọc."""
+
+    def __init__(self, path):
+        self.path = path
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"Track log chưa hoàn chỉnh hoặc không tồn tại: {path}")
+        with open(meta_path, encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self.columns = {}
+        for name, dtype in self.meta["columns"].items():
+            if self.rows:
+                self.columns[name] = np.memmap(os.path.join(path, f"{name}.bin"), dtype=np.dtype(dtype),
+                                               mode="r", shape=(self.rows,))
+            else:
+                self.columns[name] = np.empty(0, dtype=np.dtype(dtype))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def names(self):
+        return {int(k): v for k, v in self.meta.get("names", {}).items()}
@@ -1,133 +1,132 @@
 import cv2
 import os
 import numpy as np
-import csv
-import json
 import atexit
+import math
+import threading
+import time
+from collections import deque
 from datetime import datetime
 
 # Import các module logic
-from detector import VehicleDetector
+from backends import backend_for_path
+from detector import VEHICLE_CLASS_NAMES, DetectorLoader, empty_detections
 from sort import Sort
 from counter import Counter
-
-# Import ClickableLabel để dùng chung
-from PyQt6.QtWidgets import QLabel
-from PyQt6.QtGui import QPainter, QColor, QPen
-from PyQt6.QtCore import Qt, QPoint, QRect
-
-
-# ============================================================
-# Label hỗ trợ chọn ROI bằng chuột
-# (Đã di chuyển từ gui.py sang đây)
-# ============================================================
-class ClickableVideoLabel(QLabel):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setMouseTracking(True)
-        self._drawing = False
-        self._start_pos = QPoint()
-        self._current_rect = QRect()
-        self._frame_size = None
-        self._roi_callback = None
-        self._has_roi = False
-        self._roi_rect_frame = None
-
-    def set_frame_size(self, frame_w, frame_h):
-        self._frame_size = (frame_w, frame_h)
-
-    def set_roi_callback(self, cb):
-        self._roi_callback = cb
-
-    def clear_roi(self):
-        self._has_roi = False
-        self._roi_rect_frame = None
-        self.update()
-
-    def mousePressEvent(self, event):
-        if event.button() == Qt.MouseButton.LeftButton and self.pixmap():
-            self._drawing = True
-            self._start_pos = event.pos()
-            self._current_rect = QRect(self._start_pos, self._start_pos)
-            self.update()
-
-    def mouseMoveEvent(self, event):
-        if self._drawing:
-            self._current_rect = QRect(self._start_pos, event.pos()).normalized()
-            self.update()
-
-    def mouseReleaseEvent(self, event):
-        if event.button() == Qt.MouseButton.LeftButton and self._drawing:
-            self._drawing = False
-            self._current_rect = QRect(self._start_pos, event.pos()).normalized()
-            roi_frame = self.map_rect_to_frame(self._current_rect)
-            if roi_frame:
-                self._has_roi = True
-                self._roi_rect_frame = roi_frame
-                if self._roi_callback:
-                    self.setToolTip(f"ROI: {roi_frame}")
-                    self._roi_callback(roi_frame)
-            self.update()
-
-    def paintEvent(self, event):
-        super().paintEvent(event)
-        painter = QPainter(self)
-        # Vẽ ROI đang vẽ (màu xanh lá)
-        if self._drawing:
-            painter.setPen(QPen(QColor(0, 255, 0), 2, Qt.PenStyle.SolidLine))
-            painter.drawRect(self._current_rect)
-
-        # Vẽ ROI đã chốt (màu cam)
-        if self._has_roi and self._roi_rect_frame:
-            disp_rect = self.map_frame_rect_to_display(self._roi_rect_frame)
-            painter.setPen(QPen(QColor(255, 165, 0), 2, Qt.PenStyle.DashLine))
-            painter.drawRect(disp_rect)
-
-    def map_rect_to_frame(self, disp_rect: QRect):
-        pix = self.pixmap()
-        if not self._frame_size or not pix or pix.isNull() or pix.width() == 0 or pix.height() == 0:
-            return None
-        lbl_w, lbl_h = self.width(), self.height()
-        disp_w, disp_h = pix.width(), pix.height()
-        scale = min(lbl_w / disp_w, lbl_h / disp_h)
-        if scale == 0: return None
-        new_w, new_h = disp_w * scale, disp_h * scale
-        off_x, off_y = (lbl_w - new_w) / 2, (lbl_h - new_h) / 2
-        x1, y1 = max(0, disp_rect.left() - off_x), max(0, disp_rect.top() - off_y)
-        x2, y2 = disp_rect.right() - off_x, disp_rect.bottom() - off_y
-        frame_w, frame_h = self._frame_size
-        fx1 = int(x1 * frame_w / new_w)
-        fy1 = int(y1 * frame_h / new_w)
-        fx2 = int(x2 * frame_w / new_w)
-        fy2 = int(y2 * frame_h / new_w)
-        return (max(0, fx1), max(0, fy1), min(frame_w, fx2), min(frame_h, fy2))
-
-    def map_frame_rect_to_display(self, rect):
-        pix = self.pixmap()
-        if not rect or not self._frame_size or not pix or pix.isNull() or pix.width() == 0 or pix.height() == 0:
-            return QRect()
-        x1, y1, x2, y2 = rect
-        frame_w, frame_h = self._frame_size
-        lbl_w, lbl_h = self.width(), self.height()
-        disp_w, disp_h = pix.width(), pix.height()
-        scale = min(lbl_w / disp_w, lbl_h / disp_h)
-        if scale == 0: return QRect()
-        new_w, new_h = disp_w * scale, disp_h * scale
-        off_x, off_y = (lbl_w - new_w) / 2, (lbl_h - new_h) / 2
-        dx1 = int(x1 * new_w / frame_w + off_x)
-        dy1 = int(y1 * new_h / frame_h + off_y)
-        dx2 = int(x2 * new_w / frame_w + off_x)
-        dy2 = int(y2 * new_h / frame_h + off_y)
-        return QRect(dx1, dy1, dx2 - dx1, dy2 - dy1)
+from pipeline import FramePipeline
+from motion import MotionGate
+from metrics import Metrics
+from decode import ScaledCapture, scaled_dims
+from detcache import DetectionCache, FramelessCapture, cache_key, video_hash
+from tracklog import TrackLogWriter
+from live import LiveCapture, is_live_source, source_name
+from writers import WRITER_FORMATS, format_from_path, open_writer, write_json
+
+# Ngưỡng conf / IoU (NMS) khi detect
+DETECT_CONF = 0.4
+DETECT_IOU = 0.45
+# Thông số video lưu cùng cache detection
+VIDEO_PROPS = (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FPS, cv2.CAP_PROP_FRAME_COUNT)
+
+
+def detect_for_engines(detector, requests):
+    """
+    Detect cho 1 hoặc nhiều VideoEngine dùng chung 1 detector (MultiStreamEngine) với ít lần gọi model nhất:
+    mỗi engine áp dụng cache detection, decode_size, roi_crop của riêng nó; ảnh của mọi engine có cùng
+    input size được detect chung 1 lần, rồi box được đổi về tọa độ video gốc của từng engine.
+    requests: list (engine, frames, frame_ids); frame_ids = None thì không dùng cache.
+    Trả về list (theo requests) các list detections (theo thứ tự frames).
+    """
+    results = []
+    groups = {}  # imgsz -> list (số thứ tự request, vị trí các frame thiếu, ảnh, mapping)
+    for r, (engine, frames, frame_ids) in enumerate(requests):
+        cache = engine._cache if frame_ids is not None else None
+        detections_list = [cache.get(i) for i in frame_ids] if cache else [None] * len(frames)
+        missing = [k for k, d in enumerate(detections_list) if d is None]
+        results.append(detections_list)
+        if missing:
+            inputs, imgsz, mapping = engine._detect_inputs([frames[k] for k in missing])
+            groups.setdefault(imgsz, []).append((r, missing, inputs, mapping))
+
+    for imgsz, members in groups.items():
+        inputs = [img for _, _, member_inputs, _ in members for img in member_inputs]
+        t0 = time.perf_counter()
+        detections_list = iter(detector.detect_batch(inputs, conf=DETECT_CONF, iou=DETECT_IOU, imgsz=imgsz))
+        # Thời gian 1 lần gọi model, chia đều cho mỗi ảnh
+        per_frame = (time.perf_counter() - t0) / len(inputs)
+        for r, missing, member_inputs, mapping in members:
+            engine, _, frame_ids = requests[r]
+            batch = engine._map_detections([next(detections_list) for _ in member_inputs], mapping)
+            for k, detections in zip(missing, batch):
+                results[r][k] = detections
+                if engine._cache and frame_ids is not None:
+                    engine._cache.put(frame_ids[k], detections)
+            if engine.metrics:
+                # 1 mẫu cho mỗi frame được detect, như các stage khác
+                engine.metrics.observe("detect", per_frame, n=len(missing))
+    return results
 
 
 # ============================================================
 # Class Engine xử lý video
 # ============================================================
 class VideoEngine:
-    def __init__(self, model_path="yolov8n.pt"):
+    def __init__(self, model_path="yolov8n.pt", batch_size=1, pipeline=False, queue_size=8, render=True,
+                 detect_stride=1, adaptive_stride=True, dense_tracks=20, line_band=8,
+                 detector=None, history_size=10000, rgb=True, imgsz=640, roi_crop=False, roi_margin=32,
+                 motion_gate=None, motion_band=120, output_format="csv", flush_rows=256, flush_interval=1.0,
+                 metrics=False, on_count=None, decode_size=None, decoder="opencv", backend=None, threads=None,
+                 detection_cache=None, track_log=None, live=None, live_buffer=1):
+        """
+        live: nguồn live (RTSP / HTTP / pipe / webcam, xem live.py): thread nền chỉ giữ live_buffer frame
+            mới nhất, bỏ frame cũ, tự kết nối lại; get_stats()["live"] có số frame bị bỏ và độ trễ
+            end-to-end. None = tự nhận theo nguồn truyền vào start().
+        track_log: ghi track log dạng cột (frame, id, box, class) để đếm lại với vạch / chiều / ROI khác
+            bằng recount.py; True = output_dir/<tên video>_tracks, hoặc đường dẫn thư mục log.
+        detection_cache: thư mục cache detection trên đĩa (xem detcache.py). Chạy lại cùng video, model,
+            ngưỡng, imgsz, decode_size (và ROI khi roi_crop) thì frame đã có trong cache không chạy model
+            (cũng không qua motion gate); cache đủ mọi frame + render=False thì không decode video nữa.
+        backend: backend inference "torch" / "onnx" / "openvino" (mặc định đoán theo model_path);
+            threads: số thread intra-op của runtime. Xem backends.py.
+        decode_size: cạnh dài nhất (px) của frame đưa vào detect. Khi không vẽ (render=False), video được
+            decode thẳng ở kích thước này (decoder "opencv" hoặc "ffmpeg", xem decode.py); khi vẽ, frame
+            full-res chỉ được thu nhỏ 1 lần trước detect. Box luôn được đổi về tọa độ video gốc, nên
+            ROI, vạch đếm, CSV vẫn theo tọa độ gốc.
+        on_count: hàm gọi mỗi lần 1 xe được đếm, nhận dict {frame, object_id, class, direction,
+            timestamp, centroid} (gọi trên thread track + đếm).
+        metrics: đo thời gian từng stage, số detection / track mỗi frame, độ sâu queue (xem metrics.py);
+            True = Metrics riêng, tạo mới mỗi lần start(); hoặc truyền 1 Metrics có sẵn. Kết quả nằm
+            trong get_stats()["metrics"] và summary JSON.
+        output_format: định dạng file kết quả ("csv", "jsonl", "parquet", "feather", xem writers.py);
+            nếu csv_path truyền vào start() có đuôi đã biết thì dùng định dạng theo đuôi file.
+            Kết quả được ghi theo lô: mỗi flush_rows dòng hoặc mỗi flush_interval giây, và khi stop().
+        motion_gate: MotionGate (hoặc True = MotionGate mặc định) chạy trước detect ở mỗi keyframe;
+            không có chuyển động trong ROI / dải quanh vạch đếm (± motion_band px) thì bỏ qua detect,
+            SORT vẫn được cập nhật với 0 detection để các track già đi như bình thường.
+        roi_crop: khi có ROI, chỉ chạy detect trên vùng ROI (+ roi_margin px mỗi phía) với input size
+            vừa với vùng đó, rồi đổi box về tọa độ frame gốc (thay vì detect cả frame rồi lọc).
+        Model chỉ được load khi cần (hoặc khi gọi preload()), kèm 1 lần warm-up ở input size imgsz.
+        rgb: frame trả về ở dạng RGB (cho PyQt); False = giữ BGR (cho cv2.VideoWriter / imshow).
+        detector: dùng lại 1 VehicleDetector có sẵn thay vì tự load model.
+        history_size: số sự kiện đếm mỗi Counter giữ trong bộ nhớ, phần cũ hơn được ghi ra file.
+        batch_size: số frame được gom lại để detect trong 1 lần gọi model.
+        detect_stride: chỉ chạy detect mỗi k frame; các frame xen giữa SORT chỉ dự đoán (Kalman coast).
+        adaptive_stride: tự chọn stride sau mỗi frame: giảm 1 nửa khi có nhiều track (>= dense_tracks);
+            track sắp qua vạch đếm (quãng đường dự đoán theo vận tốc Kalman trước keyframe sau chạm
+            vạch) thì rút stride để keyframe sau rơi vào frame đầu tiên track đã qua vạch; track
+            cách vạch dưới line_band px mà gần như đứng yên thì detect mỗi frame.
+            Stride được tính sau bước track, còn keyframe được chọn lúc detect, với stride mới nhất
+            có tại thời điểm đó cho cả batch: chạy tuần tự với batch_size=1 thì không trễ; với
+            batch_size > 1 thay đổi có hiệu lực chậm tối đa batch_size - 1 frame; với pipeline
+            chậm thêm số frame đang nằm trong queue (tối đa ~queue_size * batch_size).
+            Đo ảnh hưởng lên số đếm: benchmarks/bench_stride.py.
+        pipeline: chạy decode / detect / track / vẽ trên các thread riêng (xem pipeline.py).
+        queue_size: kích thước tối đa mỗi queue giữa các stage khi dùng pipeline.
+        render: vẽ kết quả lên frame; nếu False, process_next_frame trả về frame = None.
+        """
         # Khởi tạo các module
-        self.detector = VehicleDetector(model_path=model_path)
+        self._detector = detector
+        self._loader = DetectorLoader(model_path=model_path, imgsz=imgsz, backend=backend, threads=threads)
         self.tracker = Sort(max_age=30, min_hits=3, iou_threshold=0.3)
         self.counter_down = None
         self.counter_up = None
@@ -137,80 +136,247 @@ class VideoEngine:
         self.frame_idx = 0
         self.video_path = None
         self.roi = None
+        self.history_size = history_size
+        self.roi_crop = roi_crop
+        self.roi_margin = roi_margin
+        self.motion_gate = MotionGate() if motion_gate is True else motion_gate
+        self.motion_band = motion_band
+        self._own_metrics = metrics is True
+        self.metrics = Metrics() if metrics is True else (metrics or None)
+        self.on_count = on_count
+        self.decode_size = decode_size
+        self.decoder = decoder
+        self.source_size = (0, 0)
+        self.detection_cache = detection_cache
+        self.track_log = track_log
+        self.live = live
+        self.live_buffer = live_buffer
+        self.is_live = False
+        self.track_log_path = None
+        self._track_log = None
+        self._cache = None
+        self._class_names = {}
+        self._video_props = {}
+        self._decode_idx = 0  # Số thứ tự (từ 0) của frame tiếp theo được đưa vào detect
+        self._reached_end = False
+        self.batch_size = max(1, int(batch_size))
+        self._pending = deque()  # Các (frame, detections) đã detect theo batch, chờ track
+        self.use_pipeline = pipeline
+        self.queue_size = queue_size
+        self.render = render
+        self.rgb = rgb
+        self.source_fps = 0.0
+        self.total_frames = 0
+        self._pipeline = None
+
+        # Keyframe stride
+        self.detect_stride = max(1, int(detect_stride))
+        self.adaptive_stride = adaptive_stride
+        self.dense_tracks = dense_tracks
+        self.line_band = line_band
+        self._current_stride = self.detect_stride  # Ghi bởi bước track, đọc lúc lập plan (có thể khác thread)
+        self._stride_lock = threading.Lock()
+        self._frames_to_key = 0
+        self.keyframe_count = 0  # Số frame đã thực sự chạy detect
 
         # Biến lưu trữ
         self.prev_centroids = {}
-        self.id_classes = {}  # Bộ nhớ lưu class của ID
 
         # Biến xử lý file output
         self.output_dir = "outputs"
         self.csv_path = None
         self.summary_path = None
-        self._csv_file = None
-        self._csv_writer = None
+        self.output_format = output_format
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self._writer = None
         os.makedirs(self.output_dir, exist_ok=True)
         atexit.register(self.stop)  # Đảm bảo file được đóng khi thoát
 
+    @property
+    def detector(self):
+        if self._detector is None:
+            self._detector = self._loader.get()
+        return self._detector
+
+    def preload(self):
+        """Load model + warm-up trên thread nền (gọi ngay khi GUI / app khởi động)."""
+        if self._detector is None:
+            self._loader.start()
+
+    def startup_report(self):
+        """Thời gian import / load / warm-up model (giây), để theo dõi cold start."""
+        return dict(getattr(self.detector, "startup_times", {}))
+
     def is_running(self):
         return self.cap is not None and self.cap.isOpened()
 
     def set_roi(self, roi_rect):
         self.roi = roi_rect
 
-    def start(self, video_path):
+    def start(self, video_path, csv_path=None):
         """
         Bắt đầu xử lý video.
+        csv_path: đường dẫn file kết quả (mặc định: output_dir/<tên video>_counts.<đuôi theo output_format>).
         Trả về (width, height) nếu thành công.
         """
         self.stop()  # Dừng video cũ (nếu có)
 
         self.video_path = video_path
-        self.cap = cv2.VideoCapture(self.video_path)
+        self.is_live = self.live if self.live is not None else is_live_source(video_path)
+        # Nguồn live không hash được nội dung -> không dùng cache detection
+        self._cache = self._open_cache(video_path) if self.detection_cache and not self.is_live else None
+        self._class_names = self._cache.class_names() if self._cache else {}
+        self.cap = self._open_capture(video_path)
         if not self.cap.isOpened():
+            self.cap.release()
             self.cap = None
             raise FileNotFoundError(f"Không thể mở video: {video_path}")
+        self._video_props = {prop: self.cap.get(prop) for prop in VIDEO_PROPS}
 
         width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.source_fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self._begin(width, height, source_name(video_path), csv_path)
 
+        if self.use_pipeline:
+            # Nguồn live: queue giữa các stage ngắn, frame không nằm chờ lâu sau khi đã grab
+            queue_size = min(self.queue_size, 2) if self.is_live else self.queue_size
+            self._pipeline = FramePipeline(self, queue_size=queue_size, render=self.render)
+            self._pipeline.start()
+
+        return (width, height)
+
+    def _open_capture(self, video_path):
+        """
+        Nguồn live: LiveCapture (live.py);
+        không vẽ + cache detection đủ mọi frame: không decode (FramelessCapture);
+        không vẽ + decode_size: decode thẳng ở độ phân giải nhỏ (decode.py); còn lại decode full-res.
+        """
+        if self.is_live:
+            return LiveCapture(video_path, buffer=self.live_buffer)
+        if self._cache and self._cache.is_complete() and not self.render and os.path.exists(video_path):
+            return FramelessCapture(self._cache.video_props())
+        if self.decode_size and not self.render:
+            # Buffer dùng lại xoay vòng: đủ cho mọi frame có thể đang nằm trong batch / các queue
+            buffers = self.batch_size + 2 + 3 * self.queue_size
+            return ScaledCapture(video_path, self.decode_size, self.decoder, buffers=buffers)
+        return cv2.VideoCapture(video_path)
+
+    def _open_cache(self, video_path):
+        """Mở cache detection của video (key theo nội dung video, model và tham số detect)."""
+        try:
+            os.makedirs(self.detection_cache, exist_ok=True)
+            model, backend, imgsz = self._cache_model()
+            crop = (tuple(self.roi), self.roi_margin) if self.roi_crop and self.roi else None
+            key = cache_key(video_hash(video_path, self.detection_cache), model, backend=backend,
+                            classes=sorted(VEHICLE_CLASS_NAMES), conf=DETECT_CONF, iou=DETECT_IOU,
+                            imgsz=imgsz, decode_size=self.decode_size, roi_crop=crop)
+            return DetectionCache(self.detection_cache, key)
+        except OSError as e:
+            print(f"Lỗi khi mở cache detection: {e}")
+            return None
+
+    def _cache_model(self):
+        """
+        (file weights, backend, imgsz) cho key cache. Model chưa load chỉ được giữ nguyên khi là model
+        PyTorch có file trên đĩa; nếu không thì load trước (ultralytics tự tải weights khi load;
+        model export có input size cố định trong file), để key luôn theo hash của cùng 1 file weights.
+        """
+        loader = self._loader
+        if self._detector is None:
+            backend = loader.backend or backend_for_path(loader.model_path)
+            if backend == "torch" and os.path.isfile(loader.model_path):
+                return loader.model_path, backend, loader.imgsz
+        detector = self.detector
+        backend = getattr(detector, "backend", None)
+        model = getattr(detector, "weights_path", None) or getattr(detector, "model_path", type(detector).__name__)
+        return model, getattr(backend, "name", type(detector).__name__), detector.imgsz
+
+    def _save_cache(self):
+        if not self._cache:
+            return None
+        names = self._detector.names if self._detector is not None else None
+        try:
+            self._cache.save(self._video_props, names, self._decode_idx if self._reached_end else None)
+        except OSError as e:
+            print(f"Lỗi khi lưu cache detection: {e}")
+        stats = self._cache.stats()
+        self._cache = None
+        return stats
+
+    def seek(self, frame_pos):
+        """Tua tới frame frame_pos (đếm từ 0) ngay sau start(); số frame trong kết quả tiếp tục từ đó."""
+        if frame_pos:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
+        self.frame_idx = frame_pos
+        self._decode_idx = frame_pos
+
+    def _begin(self, width, height, base_name, csv_path=None):
+        """Khởi tạo tracker, bộ đếm, trạng thái và file output cho 1 nguồn video mới."""
+        self.source_size = (width, height)
         # Cấu hình line đếm
         self.line_down_y = int(height * 0.5)
         self.line_up_y = int(height * 0.6)
 
         # Khởi tạo/Reset các module
         self.tracker = Sort(max_age=90, min_hits=2, iou_threshold=0.1)
-        self.counter_down = Counter(line_position_y=self.line_down_y, direction="down")
-        self.counter_up = Counter(line_position_y=self.line_up_y, direction="up")
+        history_path = f"{self.output_dir}/{base_name}_history_{{}}.csv"
+        self.counter_down = Counter(line_position_y=self.line_down_y, direction="down",
+                                    history_size=self.history_size, spill_path=history_path.format("down"))
+        self.counter_up = Counter(line_position_y=self.line_up_y, direction="up",
+                                  history_size=self.history_size, spill_path=history_path.format("up"))
 
         # Reset trạng thái
         self.frame_idx = 0
+        self._decode_idx = 0
+        self._reached_end = False
+        self._pending.clear()
+        self._current_stride = self.detect_stride
+        self._frames_to_key = 0
+        self.keyframe_count = 0
         self.prev_centroids = {}
-        self.id_classes = {}
-
-        # Mở file CSV
-        base_name = os.path.splitext(os.path.basename(video_path))[0]
-        self.csv_path = f"{self.output_dir}/{base_name}_counts.csv"
-        self.summary_path = f"{self.output_dir}/{base_name}_summary.json"
-
-        self._open_csv()
-
-        return (width, height)
+        if self.motion_gate:
+            self.motion_gate.reset()
+        if self._own_metrics:
+            self.metrics = Metrics()
+
+        # Mở file kết quả
+        if csv_path:
+            self.csv_path = csv_path
+            self.summary_path = os.path.join(os.path.dirname(csv_path), f"{base_name}_summary.json")
+        else:
+            self.csv_path = f"{self.output_dir}/{base_name}_counts{WRITER_FORMATS[self.output_format]}"
+            self.summary_path = f"{self.output_dir}/{base_name}_summary.json"
+
+        self._open_writer()
+        if self.track_log:
+            self._open_track_log(base_name)
 
     def stop(self):
         """
         Dừng xử lý và lưu file summary.
         Trả về đường dẫn file summary.
         """
+        # Dừng pipeline trước khi release cap (thread decode còn đang đọc)
+        if self._pipeline:
+            self._pipeline.stop()
+            self._pipeline = None
+        live_stats = self.cap.get_stats() if self.is_live and self.cap else None
         if self.cap:
             self.cap.release()
             self.cap = None
-
-        self._close_csv()
+        self._pending.clear()
+        cache_stats = self._save_cache()
 
         summary_path_to_return = None
 
         # Chỉ lưu summary nếu 2 bộ đếm đã được khởi tạo
         if self.counter_down and self.counter_up:
+            # History còn trong bộ nhớ ra file spill (đủ mọi lượt đếm của lượt chạy)
+            self.counter_down.spill_all()
+            self.counter_up.spill_all()
             summary_down = self.counter_down.get_summary()
             summary_up = self.counter_up.get_summary()
 
@@ -230,14 +396,27 @@ class VideoEngine:
                     "counts_up": summary_up["counts"]
                 }
             }
-
+            if self.motion_gate:
+                summary["motion"] = self.motion_gate.get_stats()
+            if cache_stats:
+                summary["detection_cache"] = cache_stats
+            if live_stats:
+                summary["live"] = live_stats
+            if self.metrics:
+                summary["metrics"] = self.metrics.snapshot()
+
+            # Summary đi qua cùng writer: kết quả được flush xuống file trước khi ghi summary
             try:
-                with open(self.summary_path, "w", encoding="utf-8") as f:
-                    json.dump(summary, f, ensure_ascii=False, indent=2)
+                if self._writer:
+                    self._writer.write_summary(self.summary_path, summary)
+                else:
+                    write_json(self.summary_path, summary)
                 summary_path_to_return = self.summary_path
             except Exception as e:
                 print(f"Lỗi khi lưu JSON: {e}")
 
+        self._close_writer()
+        self._close_track_log()
         self.video_path = None
         return summary_path_to_return
 
@@ -249,48 +428,228 @@ class VideoEngine:
         if not self.is_running():
             return False, None, {}
 
-        ret, frame = self.cap.read()
-        if not ret:
-            return False, None, {}
-
-        frame_to_show = frame.copy()
-        self.frame_idx += 1
-
-        # 1. Detect
-        detections = self.detector.detect(frame, conf=0.4)
-
-        # 2. Chuẩn bị data cho SORT (Numpy)
-        dets_to_sort = []
-        current_frame_classes = {}  # Map tạm
+        if self._pipeline:
+            return self._pipeline.get()
 
-        for d in detections:
-            x1, y1, x2, y2 = d["bbox"]
-            score = d.get("conf", 0.5)
-            cls_name = d["cls_name"]
-
-            # Lọc bằng ROI (nếu có)
-            if self.roi:
-                rx1, ry1, rx2, ry2 = self.roi
-                # Tính trung tâm của box
-                box_cx = (x1 + x2) / 2
-                box_cy = (y1 + y2) / 2
-                # Chỉ xử lý nếu trung tâm nằm trong ROI
-                if not (rx1 < box_cx < rx2 and ry1 < box_cy < ry2):
-                    continue
+        # 1. Đọc + detect theo batch (nếu hàng đợi trống)
+        if not self._pending:
+            self._read_and_detect_batch()
+        if not self._pending:
+            return False, None, {}
 
-            dets_to_sort.append([x1, y1, x2, y2, score])
-            cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
-            current_frame_classes[(cx, cy)] = cls_name  # Lưu class theo tọa độ
+        frame, detections = self._pending.popleft()
+        return self._process_detections(frame, detections)
+
+    def _read_and_detect_batch(self):
+        """Đọc tối đa batch_size frame rồi detect chung 1 lần, đẩy kết quả vào hàng đợi theo thứ tự."""
+        m = self.metrics
+        frames = []
+        while len(frames) < self.batch_size:
+            t0 = time.perf_counter() if m else 0
+            ret, frame = self.cap.read()
+            if not ret:
+                self._reached_end = True
+                break
+            if m:
+                m.since("decode", t0)
+            frames.append(frame)
+
+        if frames:
+            self._pending.extend(zip(frames, self._detect_frames(frames)))
+
+    def _detect_frames(self, frames):
+        """
+        Detect các keyframe trong frames bằng 1 lần gọi model.
+        Frame xen giữa (không phải keyframe) nhận None -> SORT chỉ coast ở frame đó.
+        Keyframe bị motion gate bỏ qua nhận mảng rỗng -> SORT update với 0 detection.
+        """
+        plan, key_frames, key_ids = self._plan_frames(frames)
+        return self._assign_detections(plan, self._run_detector(key_frames, key_ids))
+
+    def _plan_frames(self, frames):
+        """Lập kế hoạch cho các frame đọc tiếp theo (đúng thứ tự); trả về (plan, keyframe, số thứ tự keyframe)."""
+        first = self._decode_idx
+        self._decode_idx += len(frames)
+        with self._stride_lock:
+            stride = self._current_stride  # Cả batch dùng cùng 1 stride, lấy tại lúc lập plan
+        plan = [self._plan_frame(f, first + k, stride) for k, f in enumerate(frames)]
+        key_ids = [first + k for k, p in enumerate(plan) if p == "detect"]
+        key_frames = [frames[i - first] for i in key_ids]
+        self.keyframe_count += len(key_frames)
+        return plan, key_frames, key_ids
+
+    @staticmethod
+    def _assign_detections(plan, key_detections):
+        """Ghép detections của các keyframe vào đúng frame theo plan (xem _detect_frames)."""
+        key_detections = iter(key_detections)
+        return [next(key_detections) if p == "detect" else empty_detections() if p == "idle" else None
+                for p in plan]
+
+    def _plan_frame(self, frame, frame_id=None, stride=None):
+        """Quyết định cho 1 frame: "detect", "coast" (ngoài keyframe) hoặc "idle" (không có chuyển động)."""
+        if not self._next_is_keyframe(self._current_stride if stride is None else stride):
+            return "coast"
+        gate = self.motion_gate
+        if gate is None or (self._cache and frame_id is not None and self._cache.has(frame_id)):
+            return "detect"
+        gate.set_region(self._motion_region(frame.shape))
+        t0 = time.perf_counter() if self.metrics else 0
+        moving = gate.should_detect(frame)
+        if self.metrics:
+            self.metrics.since("motion", t0)
+        return "detect" if moving else "idle"
+
+    def _motion_region(self, frame_shape):
+        """Vùng xét chuyển động: ROI (+ margin) nếu có, nếu không thì dải quanh 2 vạch đếm."""
+        if self.roi:
+            return self._crop_box(self.roi, frame_shape)
+        h, w = frame_shape[:2]
+        _, sy = self._frame_scale(frame_shape)
+        y0 = max(0, int((min(self.line_down_y, self.line_up_y) - self.motion_band) / sy))
+        y1 = min(h, int((max(self.line_down_y, self.line_up_y) + self.motion_band) / sy))
+        return 0, y0, w, y1
+
+    def _run_detector(self, frames, frame_ids=None):
+        """
+        Detect các frame; với roi_crop chỉ detect vùng ROI (+ margin) rồi đổi box về tọa độ frame gốc.
+        Có cache detection: frame đã có trong cache (theo frame_ids) lấy ra luôn, chỉ detect phần còn thiếu.
+        """
+        return detect_for_engines(self.detector, [(self, frames, frame_ids)])[0]
 
-        dets_to_sort = np.array(dets_to_sort)
-        if len(dets_to_sort) == 0:
-            dets_to_sort = np.empty((0, 5))
+    def _detect_inputs(self, frames):
+        """
+        Ảnh đưa vào model cho các frame: thu nhỏ theo decode_size, cắt vùng ROI nếu roi_crop.
+        Trả về (ảnh, imgsz hoặc None = mặc định của detector, (offset, scale)) dùng cho _map_detections.
+        """
+        frames = self._inference_frames(frames)
+        scale = self._frame_scale(frames[0].shape)
+        roi = self.roi
+        if not (self.roi_crop and roi):
+            return frames, None, ((0, 0), scale)
+        x0, y0, x1, y1 = self._crop_box(roi, frames[0].shape)
+        crops = [np.ascontiguousarray(f[y0:y1, x0:x1]) for f in frames]
+        # Input size vừa với vùng crop (bội số 32), không vượt quá input size của model
+        imgsz = min(self.detector.imgsz, -(-max(x1 - x0, y1 - y0) // 32) * 32)
+        return crops, imgsz, ((x0, y0), scale)
+
+    @staticmethod
+    def _map_detections(detections_list, mapping):
+        """Đổi box từ tọa độ ảnh đưa vào model về tọa độ video gốc (bù vùng crop, rồi tỉ lệ decode_size)."""
+        (x0, y0), (sx, sy) = mapping
+        for detections in detections_list:
+            if x0 or y0:
+                detections["xyxy"] += (x0, y0, x0, y0)
+            if sx != 1.0 or sy != 1.0:
+                detections["xyxy"] *= (sx, sy, sx, sy)
+        return detections_list
+
+    def _inference_frames(self, frames):
+        """Thu nhỏ frame full-res về decode_size trước detect (frame từ ScaledCapture đã đúng kích thước)."""
+        if not self.decode_size or not frames:
+            return frames
+        h, w = frames[0].shape[:2]
+        size = scaled_dims(w, h, self.decode_size)
+        if size == (w, h):
+            return frames
+        return [cv2.resize(f, size, interpolation=cv2.INTER_AREA) for f in frames]
+
+    def _frame_scale(self, frame_shape):
+        """Tỉ lệ tọa độ video gốc / tọa độ frame (khác 1 khi frame đã được thu nhỏ)."""
+        h, w = frame_shape[:2]
+        sw, sh = self.source_size
+        if not sw or not sh or (w, h) == (sw, sh):
+            return 1.0, 1.0
+        return sw / w, sh / h
+
+    def _crop_box(self, roi, frame_shape):
+        """ROI (tọa độ video gốc) + roi_margin -> vùng cắt theo tọa độ của frame."""
+        h, w = frame_shape[:2]
+        sx, sy = self._frame_scale(frame_shape)
+        rx1, ry1, rx2, ry2 = roi
+        m = self.roi_margin
+        return (max(0, int((rx1 - m) / sx)), max(0, int((ry1 - m) / sy)),
+                min(w, math.ceil((rx2 + m) / sx)), min(h, math.ceil((ry2 + m) / sy)))
+
+    def _next_is_keyframe(self, stride):
+        # Stride vừa bị giảm (xe gần vạch / đông xe) thì detect ngay frame này
+        if self._frames_to_key <= 0 or self._frames_to_key >= stride:
+            self._frames_to_key = stride - 1
+            return True
+        self._frames_to_key -= 1
+        return False
+
+    def _evict_removed_tracks(self):
+        """Xóa trạng thái theo ID của các track SORT vừa bỏ, để bộ nhớ không tăng mãi với stream 24/7."""
+        for oid in self.tracker.removed_ids.tolist():
+            self.prev_centroids.pop(oid, None)
+            self.counter_down.forget(oid)
+            self.counter_up.forget(oid)
+
+    def _choose_stride(self, tracks):
+        """Tính stride cho các frame tiếp theo dựa trên số track và hoạt động gần vạch đếm."""
+        if not self.adaptive_stride or self.detect_stride <= 1:
+            return self.detect_stride
+        stride = self.detect_stride
+        if len(tracks) >= self.dense_tracks:
+            stride = max(1, stride // 2)
+        bank = self.tracker.bank
+        vy = dict(zip((bank.ids + 1).tolist(), bank.x[:, 5].tolist()))  # Vận tốc tâm theo trục y (px/frame)
+        for oid, x1, y1, x2, y2, _, _ in tracks:
+            cY = (y1 + y2) / 2
+            v = vy.get(oid, 0.0)
+            for line_y in (self.line_down_y, self.line_up_y):
+                d = line_y - cY
+                if abs(d) < self.line_band and abs(v) * stride < self.line_band:
+                    return 1  # Đứng gần vạch, chưa rõ hướng đi
+                if d * v > 0:
+                    # Keyframe sau rơi vào frame đầu tiên track được dự đoán đã qua vạch
+                    stride = min(stride, max(1, math.ceil(abs(d) / abs(v))))
+        return stride
+
+    def _process_detections(self, frame, detections):
+        """Track + đếm + vẽ cho 1 frame đã có detections."""
+        tracks, stats = self._track_and_count(detections)
+        frame_out = self._render(frame, tracks) if self.render else None
+        return True, frame_out, stats
+
+    def _track_and_count(self, detections):
+        """
+        Lọc ROI, cập nhật SORT, đếm và ghi CSV cho frame tiếp theo.
+        detections = None nghĩa là frame không chạy detect: SORT chỉ coast.
+        Phải được gọi đúng thứ tự frame. Trả về (tracks, stats),
+        tracks = list (oid, x1, y1, x2, y2, cls_name, counted) dùng để vẽ.
+        """
+        self.frame_idx += 1
+        m = self.metrics
+        t0 = time.perf_counter() if m else 0
 
-        # 3. Update Tracker (SORT)
-        tracked_dets = self.tracker.update(dets_to_sort)
+        # 2. Lọc bằng ROI (nếu có) - vector hóa trên cả mảng detections
+        if self.roi and detections is not None and len(detections):
+            rx1, ry1, rx2, ry2 = self.roi
+            xyxy = detections["xyxy"]
+            # Chỉ giữ box có trung tâm nằm trong ROI
+            box_cx = (xyxy[:, 0] + xyxy[:, 2]) / 2
+            box_cy = (xyxy[:, 1] + xyxy[:, 3]) / 2
+            inside = (rx1 < box_cx) & (box_cx < rx2) & (ry1 < box_cy) & (box_cy < ry2)
+            detections = detections[inside]
+
+        # 3. Update Tracker (SORT) - nhận trực tiếp structured array, trả về kèm class được bầu
+        if detections is None:
+            tracked_dets, track_info = self.tracker.coast(return_info=True)
+        else:
+            tracked_dets, track_info = self.tracker.update(detections, return_info=True)
+        if self._track_log is not None:
+            self._track_log.append(self.frame_idx, tracked_dets, track_info["cls"])
+        if m:
+            t0 = m.since("track", t0)
+            m.count("detections", len(detections) if detections is not None else 0)
+            m.count("tracks", len(tracked_dets))
 
         # 4. Loop qua các xe đã track
-        for track in tracked_dets:
+        tracks = []
+        # Cache detection có sẵn tên class: chạy lại từ cache không cần load model
+        names = self._class_names or self.detector.names
+        for track, info in zip(tracked_dets, track_info):
             x1, y1, x2, y2, oid = track
             oid = int(oid)
             x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
@@ -298,18 +657,9 @@ class VideoEngine:
             cX, cY = int((x1 + x2) / 2), int((y1 + y2) / 2)
             curr_centroid = (cX, cY)
 
-            # 5. Tìm lại Class Name (vì SORT không lưu)
-            if oid not in self.id_classes:
-                min_dist = 100
-                assigned_cls = "unknown"
-                for (dcx, dcy), name in current_frame_classes.items():
-                    dist = ((dcx - cX) ** 2 + (dcy - cY) ** 2) ** 0.5
-                    if dist < min_dist:
-                        min_dist = dist
-                        assigned_cls = name
-                self.id_classes[oid] = assigned_cls
-
-            cls_name = self.id_classes.get(oid, "car")
+            # 5. Class của track do SORT bầu từ các detection đã khớp
+            cid = int(info["cls"])
+            cls_name = names.get(cid, "unknown")
 
             # 6. Đếm
             prev = self.prev_centroids.get(oid, curr_centroid)
@@ -317,42 +667,81 @@ class VideoEngine:
 
             c_down = self.counter_down.check_and_count(oid, prev, curr_centroid, cls_name, self.frame_idx, timestamp)
             c_up = self.counter_up.check_and_count(oid, prev, curr_centroid, cls_name, self.frame_idx, timestamp)
-            counted = c_down or c_up
 
             self.prev_centroids[oid] = curr_centroid
 
-            # 7. Ghi CSV
-            if c_down:
-                self._write_csv_row([self.frame_idx, oid, cls_name, "down", timestamp])
-            elif c_up:
-                self._write_csv_row([self.frame_idx, oid, cls_name, "up", timestamp])
-
-            # 8. Vẽ
+            # 7. Ghi kết quả (theo lô, xem writers.py)
+            if c_down or c_up:
+                direction = "down" if c_down else "up"
+                self._write_result([self.frame_idx, oid, cls_name, direction, timestamp])
+                if self.on_count:
+                    self.on_count({"frame": self.frame_idx, "object_id": oid, "class": cls_name,
+                                   "direction": direction, "timestamp": timestamp, "centroid": curr_centroid})
+
+            tracks.append((oid, x1, y1, x2, y2, cls_name, c_down or c_up))
+
+        # Lô kết quả cũ được ghi đúng hạn flush_interval cả khi không có thêm lượt đếm
+        self._flush_results_if_due()
+        self._evict_removed_tracks()
+        stride = self._choose_stride(tracks)
+        with self._stride_lock:
+            self._current_stride = stride
+        latency = self.cap.frame_processed() if self.is_live and self.cap else 0.0
+        if m:
+            m.since("count", t0)
+            if self.is_live:
+                m.observe("e2e_latency", latency)
+            m.frame_done()
+
+        # 9. Lấy số liệu thống kê hiện tại (không kèm metrics: tính snapshot mỗi frame sẽ tốn)
+        return tracks, self._count_stats()
+
+    def _render(self, frame, tracks):
+        """Vẽ box, vạch đếm, ROI lên frame (vẽ trực tiếp, frame không còn dùng cho detect)."""
+        m = self.metrics
+        t0 = time.perf_counter() if m else 0
+        # 8. Vẽ các xe đã track
+        for oid, x1, y1, x2, y2, cls_name, counted in tracks:
+            cX, cY = int((x1 + x2) / 2), int((y1 + y2) / 2)
             color = (0, 255, 0) if not counted else (0, 0, 255)
-            cv2.rectangle(frame_to_show, (x1, y1), (x2, y2), color, 2)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
             label = f"ID {oid} {cls_name}"
-            cv2.putText(frame_to_show, label, (x1, y1 - 5),
+            cv2.putText(frame, label, (x1, y1 - 5),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 2)
-            cv2.circle(frame_to_show, (cX, cY), 4, color, -1)
-
-        # 9. Lấy số liệu thống kê hiện tại
-        stats = self.get_stats()
+            cv2.circle(frame, (cX, cY), 4, color, -1)
 
         # 10. Vẽ vạch đếm + ROI
-        cv2.line(frame_to_show, (0, self.line_down_y), (frame.shape[1], self.line_down_y), (0, 255, 255), 2)  # Vàng
-        cv2.line(frame_to_show, (0, self.line_up_y), (frame.shape[1], self.line_up_y), (255, 0, 255), 2)  # Tím
+        cv2.line(frame, (0, self.line_down_y), (frame.shape[1], self.line_down_y), (0, 255, 255), 2)  # Vàng
+        cv2.line(frame, (0, self.line_up_y), (frame.shape[1], self.line_up_y), (255, 0, 255), 2)  # Tím
         if self.roi:
             rx1, ry1, rx2, ry2 = self.roi
-            cv2.rectangle(frame_to_show, (rx1, ry1), (rx2, ry2), (255, 165, 0), 2)
-            cv2.putText(frame_to_show, "ROI", (rx1, ry1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 165, 0), 2)
+            cv2.rectangle(frame, (rx1, ry1), (rx2, ry2), (255, 165, 0), 2)
+            cv2.putText(frame, "ROI", (rx1, ry1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 165, 0), 2)
 
-        # 11. Chuyển đổi màu BGR sang RGB để PyQt hiển thị
-        frame_rgb = cv2.cvtColor(frame_to_show, cv2.COLOR_BGR2RGB)
+        if m:
+            t0 = m.since("draw", t0)
 
-        return True, frame_rgb, stats
+        # 11. Chuyển đổi màu BGR sang RGB để PyQt hiển thị
+        if not self.rgb:
+            return frame
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if m:
+            m.since("convert", t0)
+        return frame
 
     def get_stats(self):
-        """Lấy số liệu tổng hợp từ cả 2 bộ đếm."""
+        """Lấy số liệu tổng hợp từ cả 2 bộ đếm, kèm số liệu motion gate, nguồn live và metrics (nếu có)."""
+        stats = self._count_stats()
+        if stats and self.motion_gate:
+            stats["motion"] = self.motion_gate.get_stats()
+        if stats and self.is_live and self.cap:
+            stats["live"] = self.cap.get_stats()
+        if stats and self.metrics:
+            stats["metrics"] = self.metrics.snapshot()
+        return stats
+
+    def _count_stats(self):
+        """Số đếm theo class + "total" ({tên class: int}); số liệu khác nằm trong get_stats()."""
         if not self.counter_down or not self.counter_up:
             return {}
 
@@ -367,32 +756,62 @@ class VideoEngine:
         combined_counts["total"] = sum(combined_counts.values())
         return combined_counts
 
-    # --- CSV Helper Functions ---
-    def _open_csv(self):
+    # --- Result writer helpers ---
+    def _open_writer(self):
         try:
-            self._close_csv()  # Đóng file cũ nếu có
-            first_write = not os.path.exists(self.csv_path)
-            self._csv_file = open(self.csv_path, "a", newline="", encoding="utf-8")
-            self._csv_writer = csv.writer(self._csv_file)
-            if first_write:
-                self._csv_writer.writerow(["frame", "object_id", "class", "direction", "timestamp"])
-            self._csv_file.flush()
+            self._close_writer()  # Đóng file cũ nếu có
+            fmt = format_from_path(self.csv_path, default=self.output_format)
+            self._writer = open_writer(self.csv_path, fmt, flush_rows=self.flush_rows,
+                                       flush_interval=self.flush_interval)
         except Exception as e:
-            print(f"Lỗi khi mở CSV: {e}")
+            print(f"Lỗi khi mở file kết quả: {e}")
 
-    def _write_csv_row(self, row):
-        if self._csv_writer:
+    def _write_result(self, row):
+        if self._writer:
             try:
-                self._csv_writer.writerow(row)
-                self._csv_file.flush()
+                self._writer.write(row)
             except Exception as e:
-                print(f"Lỗi khi ghi CSV: {e}")
+                print(f"Lỗi khi ghi kết quả: {e}")
+
+    def _flush_results_if_due(self):
+        if self._writer:
+            try:
+                self._writer.maybe_flush()
+            except Exception as e:
+                print(f"Lỗi khi ghi kết quả: {e}")
+
+    def _open_track_log(self, base_name):
+        self._close_track_log()
+        self.track_log_path = (self.track_log if isinstance(self.track_log, str)
+                               else f"{self.output_dir}/{base_name}_tracks")
+        try:
+            self._track_log = TrackLogWriter(self.track_log_path)
+        except Exception as e:
+            print(f"Lỗi khi mở track log: {e}")
+
+    def _close_track_log(self):
+        if self._track_log is None:
+            return
+        names = self._class_names or (self._detector.names if self._detector is not None else {})
+        meta = {
+            "source_video": self.video_path,
+            "source_size": list(self.source_size),
+            "fps": self.source_fps,
+            "line_down_y": self.line_down_y,
+            "line_up_y": self.line_up_y,
+            "roi": list(self.roi) if self.roi else None,
+            "names": {str(k): v for k, v in names.items()},
+        }
+        try:
+            self._track_log.close(meta)
+        except Exception as e:
+            print(f"Lỗi khi đóng track log: {e}")
+        self._track_log = None
 
-    def _close_csv(self):
-        if self._csv_file and not self._csv_file.closed:
+    def _close_writer(self):
+        if self._writer:
             try:
-                self._csv_file.close()
+                self._writer.close()
             except Exception as e:
-                print(f"Lỗi khi đóng CSV: {e}")
-        self._csv_file = None
-        self._csv_writer = None
\ No newline at end of file
+                print(f"Lỗi khi đóng file kết quả: {e}")
+        self._writer = None
@@ -0,0 +1,122 @@
+# video_io.py
+"""
+Xử lý video không cần giao diện (không import PyQt): dùng cho app.py và server.
+Chạy từ dòng lệnh: python video_io.py input.mp4 [--output out.mp4] [--csv counts.csv] [--display]
+"""
+import argparse
+import atexit
+import time
+
+import cv2
+
+from video_engine import VideoEngine
+
+
+def process_video(in_path, output_path=None, csv_path=None, display=False, model_path="yolov8n.pt",
+                  detector=None, progress_cb=None, stop_event=None, progress_every=25, stats_cb=None,
+                  stats_interval=1.0, **engine_kwargs):
+    """
+    Đếm xe trong 1 video bằng VideoEngine (VehicleDetector + Sort + Counter).
+    output_path: ghi video đã vẽ kết quả (None = không vẽ, không ghi).
+    csv_path: file CSV các lượt đếm (mặc định do VideoEngine đặt trong outputs/).
+    display: hiện cửa sổ OpenCV (nhấn q để dừng).
+    detector: dùng lại VehicleDetector đã load; engine_kwargs: tham số thêm cho VideoEngine.
+    progress_cb(frames, total_frames, fps): gọi mỗi progress_every frame và khi kết thúc.
+    stats_cb(stats): gọi với engine.get_stats() mỗi stats_interval giây (vd. đẩy ra SSE, xem events.py).
+    stop_event: threading.Event, được set thì dừng xử lý sớm (kết quả tới frame đó vẫn được lưu).
+    Trả về dict {frames, elapsed_s, fps, counts, csv_path, summary_path, output_path, metrics}.
+    """
+    render = bool(output_path or display)
+    engine = VideoEngine(model_path=model_path, detector=detector, render=render, rgb=False, **engine_kwargs)
+    width, height = engine.start(in_path, csv_path=csv_path)
+    csv_path = engine.csv_path
+
+    writer = None
+    if output_path:
+        fps = engine.source_fps or 25.0
+        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+
+    frames = 0
+    stats = {}
+    t0 = time.perf_counter()
+    next_stats = t0 + stats_interval
+    try:
+        while True:
+            ret, frame, frame_stats = engine.process_next_frame()
+            if not ret:
+                break
+            frames += 1
+            stats = frame_stats
+            if progress_cb and frames % progress_every == 0:
+                progress_cb(frames, engine.total_frames, frames / (time.perf_counter() - t0))
+            if stats_cb and time.perf_counter() >= next_stats:
+                stats_cb(engine.get_stats())
+                next_stats = time.perf_counter() + stats_interval
+            if stop_event is not None and stop_event.is_set():
+                break
+            if writer is not None:
+                writer.write(frame)
+            if display:
+                cv2.imshow("Vehicle Counter", frame)
+                if cv2.waitKey(1) & 0xFF == ord("q"):
+                    break
+    finally:
+        summary_path = engine.stop()
+        atexit.unregister(engine.stop)  # Server gọi nhiều lần: không giữ engine đến lúc thoát
+        if writer is not None:
+            writer.release()
+        if display:
+            cv2.destroyAllWindows()
+
+    elapsed = time.perf_counter() - t0
+    fps = frames / elapsed if elapsed > 0 else 0.0
+    print(f"Đã xử lý {frames} frame trong {elapsed:.1f}s ({fps:.1f} FPS)")
+    if progress_cb:
+        progress_cb(frames, engine.total_frames, fps)
+    return {
+        "frames": frames,
+        "elapsed_s": elapsed,
+        "fps": fps,
+        "counts": stats,
+        "csv_path": csv_path,
+        "summary_path": summary_path,
+        "output_path": output_path,
+        "metrics": engine.metrics.snapshot() if engine.metrics else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đếm xe trong video (không cần giao diện)")
+    parser.add_argument("input", help="Đường dẫn video đầu vào")
+    parser.add_argument("--output", help="Ghi video đã vẽ kết quả ra file này")
+    parser.add_argument("--csv", help="File kết quả các lượt đếm (.csv / .jsonl / .parquet / .feather)")
+    parser.add_argument("--format", default="csv", choices=["csv", "jsonl", "parquet", "feather"],
+                        help="Định dạng file kết quả khi không chỉ định --csv")
+    parser.add_argument("--display", action="store_true", help="Hiện cửa sổ xem trực tiếp")
+    parser.add_argument("--model", default="yolov8n.pt", help="Model YOLO")
+    parser.add_argument("--backend", choices=["torch", "onnx", "openvino"], help="Backend inference (mặc định theo model)")
+    parser.add_argument("--threads", type=int, help="Số thread intra-op của backend")
+    parser.add_argument("--batch-size", type=int, default=1, help="Số frame detect chung 1 lần")
+    parser.add_argument("--detect-stride", type=int, default=1, help="Chỉ detect mỗi k frame")
+    parser.add_argument("--pipeline", action="store_true", help="Chạy decode / detect / track trên các thread riêng")
+    parser.add_argument("--decode-size", type=int, help="Decode / detect ở cạnh dài nhất này (px) khi không vẽ")
+    parser.add_argument("--decoder", default="opencv", choices=["opencv", "ffmpeg"], help="Backend decode thu nhỏ")
+    parser.add_argument("--cache-dir", help="Thư mục cache detection (chạy lại cùng video không chạy model)")
+    parser.add_argument("--track-log", action="store_true", help="Ghi track log để đếm lại bằng recount.py")
+    parser.add_argument("--metrics", action="store_true", help="Đo thời gian từng stage (ghi vào summary)")
+    parser.add_argument("--motion-gate", action="store_true", help="Bỏ qua detect ở các frame không có chuyển động")
+    args = parser.parse_args()
+
+    result = process_video(args.input, output_path=args.output, csv_path=args.csv, display=args.display,
+                           model_path=args.model, batch_size=args.batch_size,
+                           detect_stride=args.detect_stride, pipeline=args.pipeline,
+                           motion_gate=args.motion_gate or None, output_format=args.format,
+                           metrics=args.metrics, decode_size=args.decode_size, decoder=args.decoder,
+                           backend=args.backend, threads=args.threads, detection_cache=args.cache_dir,
+                           track_log=args.track_log or None)
+    print(f"Kết quả: {result['counts']}")
+    print(f"File: {result['csv_path']} | Summary: {result['summary_path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# writers.py
+"""
+Lớp ghi kết quả đếm: gom các dòng trong bộ đệm, ghi ra file theo lô (đủ flush_rows dòng hoặc
+sau flush_interval giây) thay vì flush sau từng dòng, và flush + fsync khi đóng. Engine gọi
+maybe_flush() mỗi frame, nên lô cũ vẫn được ghi đúng hạn khi không có thêm lượt đếm nào.
+Cùng 1 schema cho mọi định dạng: frame, object_id, class, direction, timestamp.
+
+Định dạng chọn theo đuôi file (hoặc tham số fmt của open_writer):
+    .csv     -> CsvResultWriter
+    .jsonl   -> JsonlResultWriter
+    .parquet -> ArrowResultWriter (cần pyarrow)
+    .feather -> ArrowResultWriter (cần pyarrow)
+"""
+import csv
+import json
+import os
+import time
+
+RESULT_COLUMNS = ["frame", "object_id", "class", "direction", "timestamp"]
+
+
+def write_json(path, data):
+    """Ghi JSON an toàn: ghi ra file tạm, fsync rồi đổi tên (không để lại file ghi dở)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ResultWriter:
+    """
+    Lớp cơ sở: bộ đệm + điều kiện flush. Lớp con cài đặt _write_rows(rows) và _close().
+    flush_rows: số dòng tối đa trong bộ đệm; flush_interval: số giây tối đa giữa 2 lần flush.
+    """
+
+    def __init__(self, path, flush_rows=256, flush_interval=1.0):
+        self.path = path
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def write(self, row):
+        """row: [frame, object_id, class, direction, timestamp]."""
+        self._buffer.append(row)
+        if len(self._buffer) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def maybe_flush(self):
+        """Flush nếu bộ đệm có dòng đã chờ quá flush_interval giây (gọi định kỳ, vd. mỗi frame)."""
+        if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._write_rows(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def write_summary(self, path, summary):
+        """Ghi summary JSON cùng đợt với kết quả (kết quả được flush trước)."""
+        self.flush()
+        write_json(path, summary)
+
+    def close(self):
+        """Flush phần còn lại và đảm bảo dữ liệu đã xuống đĩa."""
+        self.flush()
+        self._close()
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class _TextResultWriter(ResultWriter):
+    """File text mở 1 lần ở chế độ append, mỗi lần flush ghi cả lô rồi flush 1 lần."""
+
+    def __init__(self, path, flush_rows=256, flush_interval=1.0):
+        super().__init__(path, flush_rows, flush_interval)
+        first_write = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._init_file(first_write)
+        self._file.flush()
+
+    def _init_file(self, first_write):
+        pass
+
+    def _close(self):
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+class CsvResultWriter(_TextResultWriter):
+    def _init_file(self, first_write):
+        self._csv = csv.writer(self._file)
+        if first_write:
+            self._csv.writerow(RESULT_COLUMNS)
+
+    def _write_rows(self, rows):
+        self._csv.writerows(rows)
+        self._file.flush()
+
+
+class JsonlResultWriter(_TextResultWriter):
+    def _write_rows(self, rows):
+        self._file.write("".join(json.dumps(dict(zip(RESULT_COLUMNS, row)), ensure_ascii=False) + "\n"
+                                 for row in rows))
+        self._file.flush()
+
+
+class ArrowResultWriter(ResultWriter):
+    """
+    Parquet / Feather (Arrow IPC) qua pyarrow: mỗi lần flush ghi 1 row group / record batch nối vào
+    file, bộ nhớ không tăng theo số dòng. Cả 2 định dạng chỉ đọc được sau khi close() ghi footer, nên
+    dữ liệu được ghi vào file tạm rồi đổi tên khi close(); nếu file đã tồn tại, dữ liệu cũ được chép
+    sang file tạm trước (giống chế độ append của CSV) và file cũ giữ nguyên tới lúc đổi tên.
+    """
+
+    def __init__(self, path, fmt="parquet", flush_rows=256, flush_interval=1.0):
+        try:
+            import pyarrow as pa  # Chỉ cần khi dùng định dạng cột
+        except ImportError as e:
+            raise ImportError(f"Định dạng {fmt} cần pyarrow (pip install pyarrow), hoặc dùng csv / jsonl") from e
+
+        super().__init__(path, flush_rows, flush_interval)
+        self.fmt = fmt
+        self._pa = pa
+        self._schema = pa.schema([("frame", pa.int64()), ("object_id", pa.int64()), ("class", pa.string()),
+                                  ("direction", pa.string()), ("timestamp", pa.string())])
+        self._tmp_path = f"{path}.tmp"
+        existing = self._read_existing() if os.path.exists(path) else None
+        if fmt == "feather":
+            self._sink = pa.OSFile(self._tmp_path, "wb")
+            options = pa.ipc.IpcWriteOptions(compression="lz4")
+            self._arrow_writer = pa.ipc.new_file(self._sink, self._schema, options=options)
+        else:
+            import pyarrow.parquet as pq
+
+            self._sink = None
+            self._arrow_writer = pq.ParquetWriter(self._tmp_path, self._schema)
+        if existing is not None:
+            self._arrow_writer.write_table(existing)
+
+    def _read_existing(self):
+        if self.fmt == "feather":
+            import pyarrow.feather as feather
+
+            table = feather.read_table(self.path)
+        else:
+            import pyarrow.parquet as pq
+
+            table = pq.read_table(self.path)
+        return table.select(self._schema.names).cast(self._schema)
+
+    def _write_rows(self, rows):
+        columns = [list(col) for col in zip(*rows)]
+        columns[0] = [int(v) for v in columns[0]]
+        columns[1] = [int(v) for v in columns[1]]
+        columns[2:] = [[str(v) for v in col] for col in columns[2:]]
+        self._arrow_writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(col, type=field.type) for col, field in zip(columns, self._schema)],
+            schema=self._schema))
+
+    def _close(self):
+        if self._arrow_writer is None:
+            return
+        self._arrow_writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        self._arrow_writer = None
+        fd = os.open(self._tmp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(self._tmp_path, self.path)
+
+
+WRITER_FORMATS = {
+    "csv": ".csv",
+    "jsonl": ".jsonl",
+    "parquet": ".parquet",
+    "feather": ".feather",
+}
+
+
+def format_from_path(path, default="csv"):
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, fmt_ext in WRITER_FORMATS.items():
+        if ext == fmt_ext:
+            return fmt
+    return default
+
+
+def open_writer(path, fmt=None, flush_rows=256, flush_interval=1.0):
+    """Tạo ResultWriter cho path; fmt = None thì chọn theo đuôi file (mặc định CSV)."""
+    fmt = fmt or format_from_path(path)
+    if fmt == "csv":
+        return CsvResultWriter(path, flush_rows, flush_interval)
+    if fmt == "jsonl":
+        return JsonlResultWriter(path, flush_rows, flush_interval)
+    if fmt in ("parquet", "feather"):
+        return ArrowResultWriter(path, fmt, flush_rows, flush_interval)
+    raise ValueError(f"Định dạng kết quả không hỗ trợ: {fmt}")